@@ -0,0 +1,928 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from busqueda import normalizar
+from unidades import a_micro, convertir_micro, desde_micro
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# INTERFAZ DE ALMACENAMIENTO
+# ============================================================================
+
+class BackendInventario:
+    """Operaciones de almacenamiento que usa SistemaInventarioReactivos"""
+
+    nombre = "base"
+
+    def listar_inventario(self, desde_updated_at=None):
+        """Filas de inventario (solo las con updated_at >= marca si se indica)"""
+        raise NotImplementedError
+
+    def listar_movimientos(self, desde_id=None, limite=1000):
+        """Movimientos más recientes primero (solo id > marca si se indica)"""
+        raise NotImplementedError
+
+    def marca_cambios(self):
+        """Valor barato de consultar que cambia cuando otro proceso escribe (para sondeo)"""
+        raise NotImplementedError
+
+    def paginar_movimientos(self, antes_de_id=None, limite=100, filtros=None, desde_id=None):
+        """Página del historial por keyset: id < antes_de_id, más recientes primero.
+
+        Con desde_id solo se traen filas con id > desde_id (lo nuevo desde una marca).
+
+        filtros admite 'fecha_desde'/'fecha_hasta' ('YYYY-MM-DD', inclusivas),
+        'tipo_movimiento' (exacto) y 'reactivo'/'usuario'/'proyecto_curso'
+        (contiene, sin distinguir mayúsculas).
+        """
+        raise NotImplementedError
+
+    def consultar_resumen_diario(self, desde=None, hasta=None, por_usuario=False):
+        """Agregados diarios materializados entre fechas 'YYYY-MM-DD' (inclusivas).
+
+        Por reactivo: fecha, reactivo, unidad, entradas, salidas, movimientos.
+        Con por_usuario: fecha, usuario, proyecto_curso, entradas, salidas, movimientos.
+        """
+        raise NotImplementedError
+
+    def reconstruir_resumenes(self):
+        """Recalcula los agregados diarios desde todo log_movimientos"""
+        raise NotImplementedError
+
+    def insertar_inventario(self, filas):
+        """Inserta filas nuevas de inventario (con un lote inicial si traen stock)"""
+        raise NotImplementedError
+
+    def migrar_nombres(self):
+        """Completa el nombre normalizado de filas anteriores a la columna (migración única).
+
+        Devuelve (filas completadas, ids que duplican un nombre existente).
+        SQLite ya lo hace al abrir la base: no queda nada pendiente.
+        """
+        return 0, []
+
+    def listar_lotes(self, reactivo_id=None, con_stock=True, vencen_hasta=None, desde_updated_at=None):
+        """Lotes (de un reactivo o de todos) en orden FEFO: primero el que vence antes.
+
+        Con vencen_hasta ('YYYY-MM-DD', inclusiva) solo los que vencen hasta esa fecha;
+        con desde_updated_at (ISO) solo los creados o modificados desde ese instante.
+        """
+        raise NotImplementedError
+
+    def registrar_salida(self, reactivo_id, cantidad, usuario, proyecto_curso, notas, fecha, hora,
+                         unidad=None):
+        """Descuento condicional + log en una transacción.
+
+        La cantidad se expresa en `unidad` (por defecto la del reactivo) y se
+        descuenta convertida a micro-unidades base. Devuelve {'ok', 'inventario',
+        'movimiento', 'lotes'}; 'inventario' es None si el reactivo no existe y
+        'ok' es False si el stock no alcanza. Unidades de otra dimensión y
+        cantidades que no sean mayores a cero son un error (ValueError). Se
+        descuenta de los lotes en orden FEFO (first-expired-first-out) y 'lotes'
+        detalla [{'lote_id', 'cantidad'}] en la unidad del reactivo.
+        """
+        raise NotImplementedError
+
+    def registrar_entrada(self, reactivo, cantidad, unidad, fecha_vencimiento,
+                          usuario, proyecto_curso, notas, fecha, hora, proveedor=None):
+        """Suma al reactivo existente (o lo crea) + lote nuevo + log en una transacción.
+
+        Si el reactivo ya existe, la cantidad se convierte a su unidad (500 mL
+        suman 0.5 a un stock en L). El vencimiento del reactivo pasa a ser el del
+        lote que vence primero. Devuelve {'ok', 'nuevo', 'inventario', 'movimiento'}.
+        """
+        raise NotImplementedError
+
+    def registrar_movimientos_lote(self, movimientos):
+        """Entradas y salidas con clave de idempotencia, en orden, en una transacción/petición.
+
+        Cada movimiento es {'clave', 'tipo': 'ENTRADA'|'SALIDA'} más los argumentos
+        de registrar_entrada/registrar_salida (sin fecha de sistema: la trae el
+        movimiento). Una clave ya aplicada devuelve el resultado guardado sin volver
+        a mover stock. Devuelve, en el mismo orden, {'clave', 'resultado'} o
+        {'clave', 'error'} si el movimiento fue rechazado (p. ej. unidad incompatible o
+        datos mal formados); solo una falla del backend mismo hace fallar el lote.
+        """
+        raise NotImplementedError
+
+    def registrar_entradas_lote(self, movimientos):
+        """Varias entradas en una sola transacción/petición.
+
+        Cada movimiento es un dict con las claves de registrar_entrada. Devuelve
+        {'inventario': filas finales de los reactivos tocados, 'movimientos': log}.
+        """
+        inventario, registrados = {}, []
+        for movimiento in movimientos:
+            resultado = self.registrar_entrada(**movimiento)
+            inventario[resultado['inventario']['id']] = resultado['inventario']
+            registrados.append(resultado['movimiento'])
+        return {'inventario': list(inventario.values()), 'movimientos': registrados}
+
+# Filas por petición al leer agregados diarios (o migrar nombres) desde Supabase
+TAMANO_PAGINA_RESUMEN = 1000
+
+# Filtros del historial que se comparan como "contiene"
+COLUMNAS_FILTRO_TEXTO = ['reactivo', 'usuario', 'proyecto_curso']
+
+def escapar_like(texto):
+    """Escapa comodines de LIKE para que '%' y '_' del usuario sean literales"""
+    return str(texto).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+# ============================================================================
+# SUPABASE
+# ============================================================================
+
+class BackendSupabase(BackendInventario):
+    """Backend sobre Supabase (PostgREST + funciones de sql/movimientos.sql)"""
+
+    nombre = "Supabase"
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def migrar_nombres(self):
+        """Completa nombre_normalizado de filas anteriores a la columna, con busqueda.normalizar.
+
+        Se calcula acá y no en SQL para que la clave sea idéntica a la que usan
+        las entradas. Recorre las pendientes por páginas de id; un nombre que
+        choca con la clave única (duplicado previo) queda sin completar.
+        """
+        completados, duplicados, ultimo_id = 0, [], 0
+        while True:
+            pendientes = (self.cliente.table('inventario').select('id, reactivo')
+                          .is_('nombre_normalizado', 'null').gt('id', ultimo_id).order('id')
+                          .limit(TAMANO_PAGINA_RESUMEN).execute().data or [])
+            for fila in pendientes:
+                nombre = normalizar(fila['reactivo'])
+                try:
+                    self.cliente.table('inventario').update({'nombre_normalizado': nombre}).eq('id', fila['id']).execute()
+                except Exception as e:
+                    if getattr(e, 'code', None) != '23505':  # unique_violation
+                        raise
+                    logger.warning("Reactivo %s duplica el nombre '%s': fusionarlo a mano", fila['id'], nombre)
+                    duplicados.append(fila['id'])
+                    continue
+                completados += 1
+            if len(pendientes) < TAMANO_PAGINA_RESUMEN:
+                return completados, duplicados
+            ultimo_id = pendientes[-1]['id']
+
+    def listar_inventario(self, desde_updated_at=None):
+        consulta = self.cliente.table('inventario').select("*")
+        if desde_updated_at is not None:
+            # gte: se vuelven a pedir las filas en la marca para no perder empates
+            consulta = consulta.gte('updated_at', desde_updated_at)
+        return consulta.execute().data or []
+
+    def listar_movimientos(self, desde_id=None, limite=1000):
+        consulta = self.cliente.table('log_movimientos').select("*")
+        if desde_id is not None:
+            consulta = consulta.gt('id', desde_id)
+        return consulta.order('id', desc=True).limit(limite).execute().data or []
+
+    def marca_cambios(self):
+        # Respaldo cuando no hay canal realtime: última modificación y último movimiento
+        inventario = (self.cliente.table('inventario').select('updated_at')
+                      .order('updated_at', desc=True).limit(1).execute().data or [{}])
+        log = self.cliente.table('log_movimientos').select('id').order('id', desc=True).limit(1).execute().data or [{}]
+        return inventario[0].get('updated_at'), log[0].get('id')
+
+    def paginar_movimientos(self, antes_de_id=None, limite=100, filtros=None, desde_id=None):
+        filtros = filtros or {}
+        consulta = self.cliente.table('log_movimientos').select("*")
+        if antes_de_id is not None:
+            consulta = consulta.lt('id', antes_de_id)
+        if desde_id is not None:
+            consulta = consulta.gt('id', desde_id)
+        if filtros.get('fecha_desde'):
+            consulta = consulta.gte('fecha', filtros['fecha_desde'])
+        if filtros.get('fecha_hasta'):
+            consulta = consulta.lte('fecha', filtros['fecha_hasta'])
+        if filtros.get('tipo_movimiento'):
+            consulta = consulta.eq('tipo_movimiento', filtros['tipo_movimiento'])
+        for columna in COLUMNAS_FILTRO_TEXTO:
+            if filtros.get(columna):
+                consulta = consulta.ilike(columna, f"%{escapar_like(filtros[columna])}%")
+        return consulta.order('id', desc=True).limit(limite).execute().data or []
+
+    def consultar_resumen_diario(self, desde=None, hasta=None, por_usuario=False):
+        tabla = 'resumen_diario_usuario' if por_usuario else 'resumen_diario'
+        filas, inicio = [], 0
+        # PostgREST corta las respuestas: se pagina por rango (son pocas filas)
+        while True:
+            consulta = self.cliente.table(tabla).select("*")
+            if desde:
+                consulta = consulta.gte('fecha', desde)
+            if hasta:
+                consulta = consulta.lte('fecha', hasta)
+            pagina = consulta.order('fecha').range(inicio, inicio + TAMANO_PAGINA_RESUMEN - 1).execute().data or []
+            filas.extend(pagina)
+            if len(pagina) < TAMANO_PAGINA_RESUMEN:
+                return filas
+            inicio += TAMANO_PAGINA_RESUMEN
+
+    def reconstruir_resumenes(self):
+        self.cliente.rpc('reconstruir_resumenes', {}).execute()
+
+    def insertar_inventario(self, filas):
+        filas = [dict(fila, nombre_normalizado=normalizar(fila['reactivo']),
+                      cantidad_base=a_micro(fila.get('cantidad') or 0, fila.get('unidad')))
+                 for fila in filas]
+        insertadas = self.cliente.table('inventario').insert(filas).execute().data or []
+        lotes = [{'reactivo_id': fila['id'], 'cantidad_base': fila['cantidad_base'],
+                  'fecha_vencimiento': fila.get('fecha_vencimiento'), 'fecha_ingreso': fila.get('fecha_ingreso')}
+                 for fila in insertadas if fila.get('cantidad_base')]
+        if lotes:
+            self.cliente.table('lotes').insert(lotes).execute()
+        return insertadas
+
+    def listar_lotes(self, reactivo_id=None, con_stock=True, vencen_hasta=None, desde_updated_at=None):
+        consulta = self.cliente.table('lotes').select('*')
+        if reactivo_id is not None:
+            consulta = consulta.eq('reactivo_id', int(reactivo_id))
+        if con_stock:
+            consulta = consulta.gt('cantidad_base', 0)
+        if vencen_hasta is not None:
+            consulta = consulta.lte('fecha_vencimiento', vencen_hasta)
+        if desde_updated_at is not None:
+            consulta = consulta.gte('updated_at', desde_updated_at)
+        # Ascendente en Postgres deja los lotes sin fecha al final
+        return consulta.order('reactivo_id').order('fecha_vencimiento').order('id').execute().data or []
+
+    def registrar_salida(self, reactivo_id, cantidad, usuario, proyecto_curso, notas, fecha, hora,
+                         unidad=None):
+        return self.cliente.rpc('registrar_salida', {
+            'p_reactivo_id': int(reactivo_id),
+            'p_cantidad': cantidad,
+            'p_unidad': unidad,
+            'p_usuario': usuario,
+            'p_proyecto_curso': proyecto_curso,
+            'p_notas': notas,
+            'p_fecha': fecha,
+            'p_hora': hora
+        }).execute().data
+
+    def registrar_entrada(self, reactivo, cantidad, unidad, fecha_vencimiento,
+                          usuario, proyecto_curso, notas, fecha, hora, proveedor=None):
+        return self.cliente.rpc('registrar_entrada', {
+            'p_reactivo': reactivo,
+            'p_nombre_normalizado': normalizar(reactivo),
+            'p_cantidad': cantidad,
+            'p_unidad': unidad,
+            'p_fecha_vencimiento': fecha_vencimiento,
+            'p_usuario': usuario,
+            'p_proyecto_curso': proyecto_curso,
+            'p_notas': notas,
+            'p_fecha': fecha,
+            'p_hora': hora,
+            'p_proveedor': proveedor
+        }).execute().data
+
+    def registrar_entradas_lote(self, movimientos):
+        movimientos = [dict(m, nombre_normalizado=normalizar(m['reactivo'])) for m in movimientos]
+        return self.cliente.rpc('registrar_entradas_lote', {'p_movimientos': movimientos}).execute().data
+
+    def registrar_movimientos_lote(self, movimientos):
+        movimientos = [dict(m, nombre_normalizado=normalizar(m['reactivo'])) if m['tipo'] == 'ENTRADA' else m
+                       for m in movimientos]
+        return self.cliente.rpc('registrar_movimientos_lote', {'p_movimientos': movimientos}).execute().data
+
+# ============================================================================
+# SQLITE LOCAL
+# ============================================================================
+
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS inventario (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    reactivo TEXT NOT NULL,
+    cantidad REAL NOT NULL DEFAULT 0,
+    unidad TEXT,
+    estado TEXT,
+    fecha_vencimiento TEXT,
+    fecha_ingreso TEXT,
+    notas TEXT,
+    updated_at TEXT,
+    nombre_normalizado TEXT,
+    cantidad_base INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_inventario_vencimiento ON inventario (fecha_vencimiento);
+CREATE INDEX IF NOT EXISTS idx_inventario_updated_at ON inventario (updated_at);
+
+-- id INTEGER PRIMARY KEY es el rowid: el log ya queda indexado por id
+CREATE TABLE IF NOT EXISTS log_movimientos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha TEXT,
+    hora TEXT,
+    tipo_movimiento TEXT,
+    reactivo TEXT,
+    cantidad REAL,
+    unidad TEXT,
+    usuario TEXT,
+    proyecto_curso TEXT,
+    notas TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_log_fecha ON log_movimientos (fecha);
+
+-- Stock por lote (cada entrada es un lote); inventario.cantidad_base es la suma
+CREATE TABLE IF NOT EXISTS lotes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    reactivo_id INTEGER NOT NULL REFERENCES inventario (id),
+    cantidad_base INTEGER NOT NULL,
+    fecha_vencimiento TEXT,
+    fecha_ingreso TEXT,
+    proveedor TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_lotes_reactivo ON lotes (reactivo_id);
+-- Orden FEFO (sin fecha al final) solo sobre lotes con stock: tomar el
+-- siguiente lote a consumir es una búsqueda O(log n) en el índice
+CREATE INDEX IF NOT EXISTS idx_lotes_fefo
+    ON lotes (reactivo_id, fecha_vencimiento IS NULL, fecha_vencimiento, id) WHERE cantidad_base > 0;
+CREATE INDEX IF NOT EXISTS idx_lotes_updated_at ON lotes (updated_at);
+
+-- Qué lotes cubrió cada salida
+CREATE TABLE IF NOT EXISTS salidas_lotes (
+    movimiento_id INTEGER NOT NULL REFERENCES log_movimientos (id),
+    lote_id INTEGER NOT NULL REFERENCES lotes (id),
+    cantidad_base INTEGER NOT NULL,
+    PRIMARY KEY (movimiento_id, lote_id)
+);
+
+-- Claves de idempotencia ya aplicadas y su resultado (reintentos de la cola)
+CREATE TABLE IF NOT EXISTS movimientos_aplicados (
+    clave TEXT PRIMARY KEY,
+    resultado TEXT NOT NULL,
+    creado TEXT
+);
+"""
+
+ORDEN_FEFO_SQLITE = "fecha_vencimiento IS NULL, fecha_vencimiento, id"
+
+# Agregados diarios mantenidos por trigger en cada inserción del log
+ESQUEMA_RESUMENES_SQLITE = """
+CREATE TABLE IF NOT EXISTS resumen_diario (
+    fecha TEXT NOT NULL,
+    reactivo TEXT NOT NULL,
+    unidad TEXT NOT NULL DEFAULT '',
+    entradas REAL NOT NULL DEFAULT 0,
+    salidas REAL NOT NULL DEFAULT 0,
+    movimientos INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, reactivo, unidad)
+);
+CREATE TABLE IF NOT EXISTS resumen_diario_usuario (
+    fecha TEXT NOT NULL,
+    usuario TEXT NOT NULL DEFAULT '',
+    proyecto_curso TEXT NOT NULL DEFAULT '',
+    entradas REAL NOT NULL DEFAULT 0,
+    salidas REAL NOT NULL DEFAULT 0,
+    movimientos INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, usuario, proyecto_curso)
+);
+CREATE TRIGGER IF NOT EXISTS trg_resumen_diario AFTER INSERT ON log_movimientos
+BEGIN
+    INSERT INTO resumen_diario (fecha, reactivo, unidad, entradas, salidas, movimientos)
+    VALUES (NEW.fecha, NEW.reactivo, COALESCE(NEW.unidad, ''),
+            CASE WHEN NEW.tipo_movimiento = 'ENTRADA' THEN NEW.cantidad ELSE 0 END,
+            CASE WHEN NEW.tipo_movimiento = 'SALIDA' THEN NEW.cantidad ELSE 0 END, 1)
+    ON CONFLICT (fecha, reactivo, unidad) DO UPDATE SET
+        entradas = entradas + excluded.entradas,
+        salidas = salidas + excluded.salidas,
+        movimientos = movimientos + 1;
+    INSERT INTO resumen_diario_usuario (fecha, usuario, proyecto_curso, entradas, salidas, movimientos)
+    VALUES (NEW.fecha, COALESCE(NEW.usuario, ''), COALESCE(NEW.proyecto_curso, ''),
+            CASE WHEN NEW.tipo_movimiento = 'ENTRADA' THEN NEW.cantidad ELSE 0 END,
+            CASE WHEN NEW.tipo_movimiento = 'SALIDA' THEN NEW.cantidad ELSE 0 END, 1)
+    ON CONFLICT (fecha, usuario, proyecto_curso) DO UPDATE SET
+        entradas = entradas + excluded.entradas,
+        salidas = salidas + excluded.salidas,
+        movimientos = movimientos + 1;
+END;
+"""
+
+RECONSTRUIR_RESUMENES_SQLITE = """
+DELETE FROM resumen_diario;
+DELETE FROM resumen_diario_usuario;
+INSERT INTO resumen_diario (fecha, reactivo, unidad, entradas, salidas, movimientos)
+SELECT fecha, reactivo, COALESCE(unidad, ''),
+       SUM(CASE WHEN tipo_movimiento = 'ENTRADA' THEN cantidad ELSE 0 END),
+       SUM(CASE WHEN tipo_movimiento = 'SALIDA' THEN cantidad ELSE 0 END),
+       COUNT(*)
+  FROM log_movimientos GROUP BY fecha, reactivo, COALESCE(unidad, '');
+INSERT INTO resumen_diario_usuario (fecha, usuario, proyecto_curso, entradas, salidas, movimientos)
+SELECT fecha, COALESCE(usuario, ''), COALESCE(proyecto_curso, ''),
+       SUM(CASE WHEN tipo_movimiento = 'ENTRADA' THEN cantidad ELSE 0 END),
+       SUM(CASE WHEN tipo_movimiento = 'SALIDA' THEN cantidad ELSE 0 END),
+       COUNT(*)
+  FROM log_movimientos GROUP BY fecha, COALESCE(usuario, ''), COALESCE(proyecto_curso, '');
+"""
+
+COLUMNAS_INVENTARIO = ['reactivo', 'cantidad', 'unidad', 'estado', 'fecha_vencimiento',
+                       'fecha_ingreso', 'notas', 'updated_at', 'nombre_normalizado', 'cantidad_base']
+
+# Columnas agregadas después de la primera versión del esquema
+COLUMNAS_MIGRADAS = {'nombre_normalizado': 'TEXT', 'cantidad_base': 'INTEGER'}
+
+class BackendSQLite(BackendInventario):
+    """Backend local sobre un archivo SQLite en modo WAL (referencia para pruebas y benchmarks)"""
+
+    nombre = "SQLite"
+
+    def __init__(self, ruta="inventario.db"):
+        self.ruta = ruta
+        # sqlite3 no permite compartir conexiones entre hilos: una por hilo
+        self._local = threading.local()
+        # executescript confirma por su cuenta: fuera de _transaccion
+        conexion = self._conexion()
+        conexion.executescript(ESQUEMA_SQLITE)
+        self._migrar_inventario(conexion)
+        habia_resumenes = conexion.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'resumen_diario'"
+        ).fetchone() is not None
+        conexion.executescript(ESQUEMA_RESUMENES_SQLITE)
+        if not habia_resumenes:
+            # Base creada antes de los agregados: poblarlos con el historial existente
+            self.reconstruir_resumenes()
+
+    def _conexion(self):
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexion = conexion
+        return conexion
+
+    def _transaccion(self):
+        return _TransaccionSQLite(self._conexion())
+
+    def _migrar_inventario(self, conexion):
+        """Agrega/completa las columnas derivadas (nombre normalizado, stock en micro-unidades)"""
+        columnas = {fila['name'] for fila in conexion.execute("PRAGMA table_info(inventario)")}
+        for columna, tipo in COLUMNAS_MIGRADAS.items():
+            if columna not in columnas:
+                conexion.execute(f"ALTER TABLE inventario ADD COLUMN {columna} {tipo}")
+
+        # SQLite no sabe quitar acentos: la normalización se calcula en Python
+        pendientes = conexion.execute(
+            "SELECT id, reactivo, cantidad, unidad, nombre_normalizado, cantidad_base FROM inventario "
+            "WHERE nombre_normalizado IS NULL OR cantidad_base IS NULL"
+        ).fetchall()
+        if pendientes:
+            with _TransaccionSQLite(conexion):
+                conexion.executemany(
+                    "UPDATE inventario SET nombre_normalizado = ?, cantidad_base = ? WHERE id = ?",
+                    [(fila['nombre_normalizado'] or normalizar(fila['reactivo']),
+                      fila['cantidad_base'] if fila['cantidad_base'] is not None
+                      else a_micro(fila['cantidad'] or 0, fila['unidad']),
+                      fila['id']) for fila in pendientes]
+                )
+
+        try:
+            conexion.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_inventario_nombre "
+                             "ON inventario (nombre_normalizado)")
+        except sqlite3.IntegrityError:
+            # Duplicados previos a la clave única: índice simple, gana el id menor
+            conexion.execute("CREATE INDEX IF NOT EXISTS idx_inventario_nombre_dup "
+                             "ON inventario (nombre_normalizado)")
+
+        # Stock anterior a los lotes: un lote por reactivo con su vencimiento actual
+        with _TransaccionSQLite(conexion):
+            conexion.execute(
+                "INSERT INTO lotes (reactivo_id, cantidad_base, fecha_vencimiento, fecha_ingreso, updated_at) "
+                "SELECT id, cantidad_base, fecha_vencimiento, fecha_ingreso, updated_at FROM inventario "
+                "WHERE cantidad_base > 0 AND NOT EXISTS (SELECT 1 FROM lotes WHERE reactivo_id = inventario.id)"
+            )
+
+    def _consultar(self, sql, parametros=()):
+        return [dict(fila) for fila in self._conexion().execute(sql, parametros).fetchall()]
+
+    def listar_inventario(self, desde_updated_at=None):
+        if desde_updated_at is None:
+            return self._consultar("SELECT * FROM inventario")
+        return self._consultar("SELECT * FROM inventario WHERE updated_at >= ?", (desde_updated_at,))
+
+    def listar_movimientos(self, desde_id=None, limite=1000):
+        if desde_id is None:
+            return self._consultar("SELECT * FROM log_movimientos ORDER BY id DESC LIMIT ?", (limite,))
+        return self._consultar(
+            "SELECT * FROM log_movimientos WHERE id > ? ORDER BY id DESC LIMIT ?", (desde_id, limite)
+        )
+
+    def marca_cambios(self):
+        # data_version cambia con cada commit hecho por otra conexión (otro hilo o
+        # proceso); es una lectura en memoria, sin tocar tablas
+        return self._conexion().execute("PRAGMA data_version").fetchone()[0]
+
+    def paginar_movimientos(self, antes_de_id=None, limite=100, filtros=None, desde_id=None):
+        filtros = filtros or {}
+        condiciones, parametros = [], []
+        if antes_de_id is not None:
+            condiciones.append("id < ?")
+            parametros.append(antes_de_id)
+        if desde_id is not None:
+            condiciones.append("id > ?")
+            parametros.append(desde_id)
+        if filtros.get('fecha_desde'):
+            condiciones.append("fecha >= ?")
+            parametros.append(filtros['fecha_desde'])
+        if filtros.get('fecha_hasta'):
+            condiciones.append("fecha <= ?")
+            parametros.append(filtros['fecha_hasta'])
+        if filtros.get('tipo_movimiento'):
+            condiciones.append("tipo_movimiento = ?")
+            parametros.append(filtros['tipo_movimiento'])
+        for columna in COLUMNAS_FILTRO_TEXTO:
+            if filtros.get(columna):
+                condiciones.append(f"{columna} LIKE ? ESCAPE '\\'")
+                parametros.append(f"%{escapar_like(filtros[columna])}%")
+
+        where = f"WHERE {' AND '.join(condiciones)} " if condiciones else ""
+        parametros.append(limite)
+        return self._consultar(f"SELECT * FROM log_movimientos {where}ORDER BY id DESC LIMIT ?", parametros)
+
+    def consultar_resumen_diario(self, desde=None, hasta=None, por_usuario=False):
+        tabla = 'resumen_diario_usuario' if por_usuario else 'resumen_diario'
+        condiciones, parametros = [], []
+        if desde:
+            condiciones.append("fecha >= ?")
+            parametros.append(desde)
+        if hasta:
+            condiciones.append("fecha <= ?")
+            parametros.append(hasta)
+        where = f"WHERE {' AND '.join(condiciones)} " if condiciones else ""
+        return self._consultar(f"SELECT * FROM {tabla} {where}ORDER BY fecha", parametros)
+
+    def reconstruir_resumenes(self):
+        with self._transaccion() as conexion:
+            for sentencia in RECONSTRUIR_RESUMENES_SQLITE.split(';'):
+                if sentencia.strip():
+                    conexion.execute(sentencia)
+
+    def insertar_inventario(self, filas):
+        with self._transaccion() as conexion:
+            ids = []
+            for fila in filas:
+                fila = dict(fila, nombre_normalizado=normalizar(fila['reactivo']),
+                            cantidad_base=a_micro(fila.get('cantidad') or 0, fila.get('unidad')))
+                cursor = conexion.execute(
+                    f"INSERT INTO inventario ({', '.join(COLUMNAS_INVENTARIO)}) "
+                    f"VALUES ({', '.join('?' for _ in COLUMNAS_INVENTARIO)})",
+                    [fila.get(columna) for columna in COLUMNAS_INVENTARIO]
+                )
+                ids.append(cursor.lastrowid)
+                if fila['cantidad_base'] > 0:
+                    self._insertar_lote(conexion, cursor.lastrowid, fila['cantidad_base'],
+                                        fila.get('fecha_vencimiento'), fila.get('fecha_ingreso'),
+                                        fila.get('proveedor'))
+            return [self._fila(conexion, 'inventario', id_) for id_ in ids]
+
+    def insertar_movimientos(self, filas):
+        """Inserta filas de log ya formadas en una transacción (historial importado o sintético)"""
+        with self._transaccion() as conexion:
+            conexion.executemany(
+                "INSERT INTO log_movimientos (fecha, hora, tipo_movimiento, reactivo, cantidad, unidad, "
+                "usuario, proyecto_curso, notas) VALUES (:fecha, :hora, :tipo_movimiento, :reactivo, "
+                ":cantidad, :unidad, :usuario, :proyecto_curso, :notas)",
+                filas
+            )
+
+    def listar_lotes(self, reactivo_id=None, con_stock=True, vencen_hasta=None, desde_updated_at=None):
+        condiciones, parametros = [], []
+        if reactivo_id is not None:
+            condiciones.append("reactivo_id = ?")
+            parametros.append(int(reactivo_id))
+        if con_stock:
+            condiciones.append("cantidad_base > 0")
+        if vencen_hasta is not None:
+            condiciones.append("fecha_vencimiento <= ?")
+            parametros.append(vencen_hasta)
+        if desde_updated_at is not None:
+            condiciones.append("updated_at >= ?")
+            parametros.append(desde_updated_at)
+        where = f"WHERE {' AND '.join(condiciones)} " if condiciones else ""
+        return self._consultar(f"SELECT * FROM lotes {where}ORDER BY reactivo_id, {ORDEN_FEFO_SQLITE}",
+                               parametros)
+
+    @staticmethod
+    def _fila(conexion, tabla, id_):
+        fila = conexion.execute(f"SELECT * FROM {tabla} WHERE id = ?", (id_,)).fetchone()
+        return dict(fila) if fila is not None else None
+
+    @staticmethod
+    def _insertar_movimiento(conexion, tipo, reactivo, cantidad, unidad,
+                             usuario, proyecto_curso, notas, fecha, hora):
+        cursor = conexion.execute(
+            "INSERT INTO log_movimientos (fecha, hora, tipo_movimiento, reactivo, cantidad, "
+            "unidad, usuario, proyecto_curso, notas) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (fecha, hora, tipo, reactivo, cantidad, unidad, usuario, proyecto_curso, notas)
+        )
+        return BackendSQLite._fila(conexion, 'log_movimientos', cursor.lastrowid)
+
+    @staticmethod
+    def _insertar_lote(conexion, id_reactivo, micro, fecha_vencimiento, fecha, proveedor):
+        conexion.execute(
+            "INSERT INTO lotes (reactivo_id, cantidad_base, fecha_vencimiento, fecha_ingreso, proveedor, "
+            "updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (id_reactivo, micro, fecha_vencimiento, fecha, proveedor, datetime.now().isoformat())
+        )
+
+    @staticmethod
+    def _consumir_lotes(conexion, id_reactivo, micro):
+        """Descuenta de los lotes en orden FEFO; devuelve [(lote_id, micro descontado)]
+
+        Cada vuelta toma el primer lote del índice parcial idx_lotes_fefo; un lote
+        agotado sale del índice, así que el costo es O(log n) por lote consumido.
+        """
+        asignados, restante = [], micro
+        while restante > 0:
+            lote = conexion.execute(
+                f"SELECT id, cantidad_base FROM lotes WHERE reactivo_id = ? AND cantidad_base > 0 "
+                f"ORDER BY {ORDEN_FEFO_SQLITE} LIMIT 1", (id_reactivo,)
+            ).fetchone()
+            if lote is None:
+                # Los lotes deben sumar el total del reactivo: si no alcanzan, se
+                # deshace la salida en vez de dejar stock sin lote
+                raise RuntimeError(f"Los lotes del reactivo {id_reactivo} no cubren la salida")
+            tomado = min(restante, lote['cantidad_base'])
+            conexion.execute("UPDATE lotes SET cantidad_base = cantidad_base - ?, updated_at = ? WHERE id = ?",
+                             (tomado, datetime.now().isoformat(), lote['id']))
+            asignados.append((lote['id'], tomado))
+            restante -= tomado
+        return asignados
+
+    @staticmethod
+    def _actualizar_vencimiento(conexion, ids):
+        """El vencimiento del reactivo pasa a ser el del próximo lote a consumir"""
+        conexion.execute(
+            f"UPDATE inventario SET fecha_vencimiento = COALESCE((SELECT fecha_vencimiento FROM lotes "
+            f"WHERE reactivo_id = inventario.id AND cantidad_base > 0 ORDER BY {ORDEN_FEFO_SQLITE} LIMIT 1), "
+            f"fecha_vencimiento) WHERE id IN ({', '.join('?' for _ in ids)})", list(ids)
+        )
+
+    def registrar_salida(self, reactivo_id, cantidad, usuario, proyecto_curso, notas, fecha, hora,
+                         unidad=None):
+        with self._transaccion() as conexion:
+            return self._salida(conexion, reactivo_id, cantidad, usuario, proyecto_curso, notas,
+                                fecha, hora, unidad)
+
+    def _salida(self, conexion, reactivo_id, cantidad, usuario, proyecto_curso, notas, fecha, hora,
+                unidad=None):
+        actual = self._fila(conexion, 'inventario', int(reactivo_id))
+        if actual is None:
+            return {'ok': False, 'inventario': None}
+        unidad_stock = actual['unidad']
+        micro = _micro_positivo(convertir_micro(cantidad, unidad or unidad_stock, unidad_stock))
+
+        # Chequeo y descuento en la misma sentencia, bajo el lock de escritura
+        cursor = conexion.execute(
+            "UPDATE inventario SET cantidad_base = cantidad_base - ?, cantidad = ?, "
+            "estado = CASE WHEN cantidad_base - ? <= 0 THEN 'agotado' ELSE estado END, "
+            "updated_at = ? WHERE id = ? AND cantidad_base >= ?",
+            (micro, desde_micro(actual['cantidad_base'] - micro, unidad_stock), micro,
+             datetime.now().isoformat(), int(reactivo_id), micro)
+        )
+        if cursor.rowcount == 0:
+            return {'ok': False, 'inventario': actual}
+
+        asignados = self._consumir_lotes(conexion, int(reactivo_id), micro)
+        self._actualizar_vencimiento(conexion, [int(reactivo_id)])
+        inventario = self._fila(conexion, 'inventario', int(reactivo_id))
+
+        # El log queda en la unidad del reactivo, para agregados coherentes
+        movimiento = self._insertar_movimiento(
+            conexion, 'SALIDA', inventario['reactivo'], desde_micro(micro, unidad_stock), unidad_stock,
+            usuario, proyecto_curso, notas, fecha, hora
+        )
+        conexion.executemany(
+            "INSERT INTO salidas_lotes (movimiento_id, lote_id, cantidad_base) VALUES (?, ?, ?)",
+            [(movimiento['id'], lote_id, tomado) for lote_id, tomado in asignados]
+        )
+        return {'ok': True, 'inventario': inventario, 'movimiento': movimiento,
+                'lotes': [{'lote_id': lote_id, 'cantidad': desde_micro(tomado, unidad_stock)}
+                          for lote_id, tomado in asignados]}
+
+    def registrar_entrada(self, reactivo, cantidad, unidad, fecha_vencimiento,
+                          usuario, proyecto_curso, notas, fecha, hora, proveedor=None):
+        with self._transaccion() as conexion:
+            return self._entrada(conexion, reactivo, cantidad, unidad, fecha_vencimiento,
+                                 usuario, proyecto_curso, notas, fecha, hora, proveedor)
+
+    def _entrada(self, conexion, reactivo, cantidad, unidad, fecha_vencimiento,
+                 usuario, proyecto_curso, notas, fecha, hora, proveedor=None):
+        existente = conexion.execute(
+            "SELECT id FROM inventario WHERE nombre_normalizado = ? ORDER BY id LIMIT 1",
+            (normalizar(reactivo),)
+        ).fetchone()
+        id_reactivo, micro = self._sumar_stock(
+            conexion, existente['id'] if existente else None, reactivo, cantidad, unidad, notas, fecha
+        )
+        self._insertar_lote(conexion, id_reactivo, micro,
+                            _vencimiento_del_lote(fecha_vencimiento, existente is None), fecha, proveedor)
+        self._actualizar_vencimiento(conexion, [id_reactivo])
+
+        inventario = self._fila(conexion, 'inventario', id_reactivo)
+        # El log lleva el nombre del reactivo tal como está en inventario, no el tipeado
+        movimiento = self._insertar_movimiento(
+            conexion, 'ENTRADA', inventario['reactivo'], desde_micro(micro, inventario['unidad']),
+            inventario['unidad'], usuario, proyecto_curso, notas, fecha, hora
+        )
+        return {'ok': True, 'nuevo': existente is None,
+                'inventario': inventario, 'movimiento': movimiento}
+
+    def registrar_movimientos_lote(self, movimientos):
+        respuestas = []
+        with self._transaccion() as conexion:
+            for movimiento in movimientos:
+                datos = dict(movimiento)
+                clave, tipo = datos.pop('clave'), datos.pop('tipo')
+                previo = conexion.execute(
+                    "SELECT resultado FROM movimientos_aplicados WHERE clave = ?", (clave,)
+                ).fetchone()
+                if previo is not None:
+                    # Reintento de algo ya aplicado: mismo resultado, sin mover stock
+                    respuestas.append({'clave': clave, 'resultado': json.loads(previo['resultado'])})
+                    continue
+
+                # Un savepoint por movimiento: un rechazo no deshace el resto del lote.
+                # Cualquier error del movimiento (datos mal formados, unidad, cantidad)
+                # lo rechaza; si se propagara, la cola reenviaría el lote para siempre.
+                # Los errores de la base (bloqueo, disco) sí cortan el lote entero.
+                conexion.execute("SAVEPOINT movimiento")
+                try:
+                    if tipo == 'SALIDA':
+                        resultado = self._salida(conexion, **datos)
+                    else:
+                        resultado = self._entrada(conexion, **datos)
+                except sqlite3.OperationalError:
+                    raise
+                except Exception as e:
+                    conexion.execute("ROLLBACK TO movimiento")
+                    conexion.execute("RELEASE movimiento")
+                    respuestas.append({'clave': clave, 'error': str(e)})
+                    continue
+                conexion.execute("RELEASE movimiento")
+                conexion.execute(
+                    "INSERT INTO movimientos_aplicados (clave, resultado, creado) VALUES (?, ?, ?)",
+                    (clave, json.dumps(resultado), datetime.now().isoformat())
+                )
+                respuestas.append({'clave': clave, 'resultado': resultado})
+        return respuestas
+
+    @staticmethod
+    def _sumar_stock(conexion, id_reactivo, reactivo, cantidad, unidad, notas, fecha):
+        """Suma al total del reactivo existente (convirtiendo a su unidad) o lo crea.
+
+        Devuelve (id, micro-unidades sumadas); el lote lo agrega quien llama.
+        """
+        ahora = datetime.now().isoformat()
+        if id_reactivo is not None:
+            actual = conexion.execute(
+                "SELECT unidad, cantidad_base FROM inventario WHERE id = ?", (id_reactivo,)
+            ).fetchone()
+            micro = _micro_positivo(convertir_micro(cantidad, unidad, actual['unidad']))
+            conexion.execute(
+                "UPDATE inventario SET cantidad_base = cantidad_base + ?, cantidad = ?, "
+                "estado = CASE WHEN estado = 'agotado' THEN 'disponible' ELSE estado END, "
+                "updated_at = ? WHERE id = ?",
+                (micro, desde_micro(actual['cantidad_base'] + micro, actual['unidad']), ahora, id_reactivo)
+            )
+            return id_reactivo, micro
+
+        micro = _micro_positivo(a_micro(cantidad, unidad))
+        cursor = conexion.execute(
+            "INSERT INTO inventario (reactivo, cantidad, unidad, estado, fecha_ingreso, notas, updated_at, "
+            "nombre_normalizado, cantidad_base) VALUES (?, ?, ?, 'disponible', ?, ?, ?, ?, ?)",
+            (reactivo, desde_micro(micro, unidad), unidad, fecha, notas, ahora, normalizar(reactivo), micro)
+        )
+        return cursor.lastrowid, micro
+
+    def registrar_entradas_lote(self, movimientos):
+        if not movimientos:
+            return {'inventario': [], 'movimientos': []}
+
+        with self._transaccion() as conexion:
+            # Resolver todos los reactivos existentes en una sola consulta
+            claves = [normalizar(m['reactivo']) for m in movimientos]
+            nombres = list(set(claves))
+            existentes = {}
+            for fila in conexion.execute(
+                f"SELECT id, reactivo, nombre_normalizado, unidad FROM inventario WHERE nombre_normalizado "
+                f"IN ({', '.join('?' for _ in nombres)}) ORDER BY id DESC", nombres
+            ):
+                existentes[fila['nombre_normalizado']] = (fila['id'], fila['unidad'], fila['reactivo'])
+
+            # Un UPDATE/INSERT por reactivo distinto, con las cantidades sumadas en
+            # micro-unidades de la unidad del reactivo (o de la primera fila si es nuevo)
+            agrupados, unidades, micros = {}, {}, []
+            for clave, movimiento in zip(claves, movimientos):
+                if clave not in agrupados:
+                    unidades[clave] = existentes[clave][1] if clave in existentes else movimiento['unidad']
+                    agrupados[clave] = dict(movimiento, micro=0)
+                micro = _micro_positivo(convertir_micro(movimiento['cantidad'], movimiento['unidad'],
+                                                        unidades[clave]))
+                agrupados[clave]['micro'] += micro
+                micros.append(micro)
+
+            # Nombre de inventario de cada reactivo (el de la primera fila si es nuevo) para el log
+            ids, canonicos = {}, {}
+            for clave, total in agrupados.items():
+                existente = existentes.get(clave)
+                canonicos[clave] = existente[2] if existente else total['reactivo']
+                ids[clave], _ = self._sumar_stock(
+                    conexion, existente[0] if existente else None, total['reactivo'],
+                    desde_micro(total['micro'], unidades[clave]), unidades[clave],
+                    total.get('notas', ""), total['fecha']
+                )
+
+            # Un lote por fila importada, y el log, cada uno en un solo executemany
+            ahora = datetime.now().isoformat()
+            conexion.executemany(
+                "INSERT INTO lotes (reactivo_id, cantidad_base, fecha_vencimiento, fecha_ingreso, proveedor, "
+                "updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(ids[clave], micro, _vencimiento_del_lote(m.get('fecha_vencimiento'), clave not in existentes),
+                  m['fecha'],
+                  m.get('proveedor') or None, ahora)
+                 for clave, micro, m in zip(claves, micros, movimientos)]
+            )
+            self._actualizar_vencimiento(conexion, ids.values())
+
+            ultimo_id = conexion.execute("SELECT COALESCE(MAX(id), 0) FROM log_movimientos").fetchone()[0]
+            conexion.executemany(
+                "INSERT INTO log_movimientos (fecha, hora, tipo_movimiento, reactivo, cantidad, "
+                "unidad, usuario, proyecto_curso, notas) VALUES (?, ?, 'ENTRADA', ?, ?, ?, ?, ?, ?)",
+                [(m['fecha'], m['hora'], canonicos[clave], desde_micro(micro, unidades[clave]),
+                  unidades[clave], m['usuario'], m['proyecto_curso'], m.get('notas', ""))
+                 for clave, micro, m in zip(claves, micros, movimientos)]
+            )
+
+            inventario = [dict(fila) for fila in conexion.execute(
+                f"SELECT * FROM inventario WHERE id IN ({', '.join('?' for _ in ids)})", list(ids.values())
+            )]
+            registrados = [dict(fila) for fila in conexion.execute(
+                "SELECT * FROM log_movimientos WHERE id > ? ORDER BY id", (ultimo_id,)
+            )]
+            return {'inventario': inventario, 'movimientos': registrados}
+
+def _micro_positivo(micro):
+    """Las entradas y salidas mueven cantidades mayores a cero: una salida negativa sumaría stock"""
+    if not micro > 0:
+        raise ValueError("La cantidad debe ser mayor a 0")
+    return micro
+
+def _vencimiento_del_lote(fecha_vencimiento, nuevo):
+    """Sin fecha, un reactivo nuevo vence en un año (como siempre se hizo al crearlo);
+    el lote sin fecha de un reactivo existente queda en NULL y se consume último"""
+    if fecha_vencimiento or not nuevo:
+        return fecha_vencimiento or None
+    return (datetime.now() + timedelta(days=365)).strftime('%Y-%m-%d')
+
+class _TransaccionSQLite:
+    """BEGIN IMMEDIATE / COMMIT / ROLLBACK sobre una conexión en autocommit"""
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+
+    def __enter__(self):
+        # IMMEDIATE toma el lock de escritura al inicio: sin carreras lectura-escritura
+        self.conexion.execute("BEGIN IMMEDIATE")
+        return self.conexion
+
+    def __exit__(self, tipo, valor, traza):
+        self.conexion.execute("COMMIT" if tipo is None else "ROLLBACK")
+        return False
+
+# ============================================================================
+# SELECCIÓN POR CONFIGURACIÓN
+# ============================================================================
+
+def backend_desde_entorno():
+    """Backend para scripts fuera de Streamlit, configurado por variables de entorno
+
+    INVENTARIO_BACKEND ('supabase'|'sqlite'), INVENTARIO_SQLITE (ruta) y, para
+    Supabase, SUPABASE_URL y SUPABASE_KEY.
+    """
+    config = {'tipo': os.environ.get('INVENTARIO_BACKEND', 'supabase')}
+    if os.environ.get('INVENTARIO_SQLITE'):
+        config['ruta'] = os.environ['INVENTARIO_SQLITE']
+    cliente = None
+    if config['tipo'].lower() == 'supabase':
+        from supabase import create_client
+        cliente = create_client(os.environ['SUPABASE_URL'], os.environ['SUPABASE_KEY'])
+    return crear_backend(config, cliente)
+
+def crear_backend(config, cliente_supabase=None):
+    """Crea el backend indicado en config ({'tipo': 'supabase'|'sqlite', 'ruta': ...})"""
+    tipo = str(config.get('tipo', 'supabase')).lower()
+    if tipo == 'sqlite':
+        return BackendSQLite(config.get('ruta', 'inventario.db'))
+    if tipo == 'supabase':
+        if cliente_supabase is None:
+            raise ValueError("El backend Supabase requiere un cliente")
+        return BackendSupabase(cliente_supabase)
+    raise ValueError(f"Backend desconocido: {tipo}")
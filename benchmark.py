@@ -0,0 +1,448 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from almacenamiento import BackendSQLite
+from sistema import LIMITE_BUSQUEDA, SistemaInventarioReactivos
+from unidades import a_micro
+
+# Escalas predefinidas: (reactivos, filas de log)
+ESCALAS = {
+    'mini': (1_000, 10_000),
+    '10k': (10_000, 100_000),
+    '100k': (100_000, 1_000_000),
+}
+
+# Vocabulario para nombres sintéticos parecidos a los reales (búsquedas con aciertos)
+BASES = ['Ácido', 'Sulfato', 'Cloruro', 'Hidróxido', 'Nitrato', 'Carbonato', 'Fosfato',
+         'Acetato', 'Óxido', 'Permanganato', 'Bicarbonato', 'Yoduro', 'Bromuro', 'Etanol',
+         'Metanol', 'Acetona', 'Tolueno', 'Hexano', 'Glicerina', 'Formaldehído']
+COMPLEMENTOS = ['de sodio', 'de potasio', 'de calcio', 'de magnesio', 'de cobre', 'de hierro',
+                'de zinc', 'de amonio', 'de plata', 'de bario', 'clorhídrico', 'sulfúrico',
+                'nítrico', 'acético', 'absoluto', 'técnico', 'p.a.', 'grado HPLC']
+TERMINOS_BUSQUEDA = ['acido', 'sulfato de', 'cloruro sodio', 'hidroxido potasio', 'etanol',
+                     'acetona hplc', 'nitrato plata', 'permanganto', 'carbonato calcio', 'zzz']
+
+USUARIOS = [f'usuario{i}' for i in range(50)]
+PROYECTOS = [f'QUI{100 + i}' for i in range(30)]
+
+# Filas de log por transacción al sembrar el historial
+TAMANO_BLOQUE_LOG = 50_000
+
+# ============================================================================
+# DATOS SINTÉTICOS
+# ============================================================================
+
+def generar_inventario(n, semilla=0, hoy=None):
+    """n filas de inventario con nombres únicos, unidades mezcladas y vencimientos repartidos"""
+    aleatorio = random.Random(semilla)
+    hoy = hoy or datetime.now()
+    filas = []
+    for i in range(n):
+        unidad = aleatorio.choice(('L', 'mL', 'kg', 'g'))
+        cantidad = round(aleatorio.uniform(1, 50), 2) if unidad in ('L', 'kg') else float(aleatorio.randint(100, 5000))
+        # Un ~5 % ya vencido, el resto dentro de los próximos dos años
+        dias = aleatorio.randint(-90, -1) if aleatorio.random() < 0.05 else aleatorio.randint(0, 730)
+        filas.append({
+            'reactivo': f"{aleatorio.choice(BASES)} {aleatorio.choice(COMPLEMENTOS)} {i:06d}",
+            'cantidad': cantidad,
+            'unidad': unidad,
+            'estado': aleatorio.choice(('disponible', 'disponible', 'en uso')),
+            'fecha_vencimiento': (hoy + timedelta(days=dias)).strftime('%Y-%m-%d'),
+            'fecha_ingreso': (hoy - timedelta(days=aleatorio.randint(0, 1500))).strftime('%Y-%m-%d'),
+            'notas': '',
+            # Marcas distintas, como en datos reales (la sincronización incremental usa >=)
+            'updated_at': (hoy - timedelta(seconds=n - i)).isoformat(),
+        })
+    return filas
+
+def generar_log(n, reactivos, semilla=0, anios=4, hoy=None):
+    """Genera n movimientos en bloques de TAMANO_BLOQUE_LOG (listas de dicts), repartidos en `anios`"""
+    aleatorio = random.Random(semilla)
+    hoy = hoy or datetime.now()
+    inicio = hoy - timedelta(days=365 * anios)
+    dias = (hoy - inicio).days
+    for desde in range(0, n, TAMANO_BLOQUE_LOG):
+        bloque = []
+        for _ in range(min(TAMANO_BLOQUE_LOG, n - desde)):
+            reactivo, unidad = aleatorio.choice(reactivos)
+            bloque.append({
+                'fecha': (inicio + timedelta(days=aleatorio.randrange(dias))).strftime('%Y-%m-%d'),
+                'hora': f"{aleatorio.randrange(8, 20):02d}:{aleatorio.randrange(60):02d}:00",
+                'tipo_movimiento': 'SALIDA' if aleatorio.random() < 0.8 else 'ENTRADA',
+                'reactivo': reactivo,
+                'cantidad': round(aleatorio.uniform(0.01, 2), 2),
+                'unidad': unidad,
+                'usuario': aleatorio.choice(USUARIOS),
+                'proyecto_curso': aleatorio.choice(PROYECTOS),
+                'notas': '',
+            })
+        yield bloque
+
+def ruta_sembrada(reactivos, movimientos, semilla=0):
+    """Archivo prístino por defecto: uno por tamaño y semilla, en el directorio temporal"""
+    return os.path.join(tempfile.gettempdir(), f"bench_{reactivos}_{movimientos}_s{semilla}.db")
+
+def sembrar_sqlite(ruta, reactivos, movimientos, semilla=0):
+    """Siembra datos sintéticos en `ruta` si el archivo no existe; devuelve la ruta.
+
+    El archivo sembrado no se modifica después: cada corrida trabaja sobre una
+    copia (copia_de_trabajo), así todas parten de los mismos datos. Se siembra en
+    un archivo aparte que se renombra al terminar: un sembrado interrumpido
+    no queda como válido.
+    """
+    if os.path.exists(ruta):
+        return ruta
+
+    temporal = f"{ruta}.sembrando"
+    _borrar_sqlite(temporal)
+    backend = BackendSQLite(temporal)
+    filas = generar_inventario(reactivos, semilla)
+    backend.insertar_inventario(filas)
+    nombres = [(fila['reactivo'], fila['unidad']) for fila in filas]
+    for bloque in generar_log(movimientos, nombres, semilla):
+        backend.insertar_movimientos(bloque)
+
+    # Todo el WAL al archivo principal antes de renombrarlo
+    with contextlib.closing(sqlite3.connect(temporal)) as conexion:
+        conexion.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    os.replace(temporal, ruta)
+    _borrar_sqlite(temporal)
+    return ruta
+
+@contextlib.contextmanager
+def copia_de_trabajo(ruta):
+    """Backend sobre una copia temporal de la base sembrada: la corrida escribe
+    (salidas, prueba de carga) sin tocar el original"""
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directorio:
+        copia = os.path.join(directorio, os.path.basename(ruta))
+        copiar_sqlite(ruta, copia)
+        yield BackendSQLite(copia)
+
+def copiar_sqlite(origen, destino):
+    """Copia consistente de una base SQLite (API de backup: incluye lo que esté en el WAL)"""
+    _borrar_sqlite(destino)
+    with contextlib.closing(sqlite3.connect(origen)) as fuente, \
+            contextlib.closing(sqlite3.connect(destino)) as copia:
+        fuente.backup(copia)
+
+def _borrar_sqlite(ruta):
+    for sufijo in ('', '-wal', '-shm'):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(ruta + sufijo)
+
+# ============================================================================
+# BACKEND INSTRUMENTADO
+# ============================================================================
+
+class BackendMedido:
+    """Envuelve un backend: cuenta llamadas (viajes de red) y agrega latencia simulada
+
+    Cada llamada a un método público equivale a una petición a Supabase, así
+    el conteo mide viajes de red aunque el backend real sea SQLite local.
+    `latencia` y `variacion` (segundos) emulan la red.
+    """
+
+    def __init__(self, backend, latencia=0.0, variacion=0.0, semilla=0):
+        self._backend = backend
+        self.latencia = latencia
+        self.variacion = variacion
+        self._aleatorio = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.viajes = Counter()
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self._backend, nombre)
+        if nombre.startswith('_') or not callable(atributo):
+            return atributo
+
+        def medido(*args, **kwargs):
+            with self._lock:
+                self.viajes[nombre] += 1
+                espera = self.latencia + self._aleatorio.uniform(0, self.variacion)
+            if espera > 0:
+                time.sleep(espera)
+            return atributo(*args, **kwargs)
+        return medido
+
+    def total_viajes(self):
+        with self._lock:
+            return sum(self.viajes.values())
+
+# ============================================================================
+# MEDICIÓN
+# ============================================================================
+
+def percentiles(latencias):
+    """Resumen en milisegundos de una lista de duraciones en segundos"""
+    if not latencias:
+        return {'n': 0}
+    ms = np.asarray(latencias) * 1000
+    return {
+        'n': len(ms),
+        'media_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p90_ms': round(float(np.percentile(ms, 90)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }
+
+def medir(funcion, backend, repeticiones=20, preparar=None):
+    """Latencias de `funcion(i)`, viajes al backend por llamada y pico de memoria Python.
+
+    `preparar(i)` corre antes de cada repetición fuera del tiempo medido (p. ej.
+    para invalidar memorizaciones). La memoria se mide en una corrida extra con
+    tracemalloc, para no inflar las latencias.
+    """
+    latencias = []
+    viajes_antes = backend.total_viajes()
+    for i in range(repeticiones):
+        if preparar is not None:
+            preparar(i)
+        inicio = time.perf_counter()
+        funcion(i)
+        latencias.append(time.perf_counter() - inicio)
+    viajes = backend.total_viajes() - viajes_antes
+
+    if preparar is not None:
+        preparar(repeticiones)
+    tracemalloc.start()
+    try:
+        funcion(repeticiones)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return dict(percentiles(latencias),
+                viajes_por_llamada=round(viajes / repeticiones, 2),
+                memoria_pico_kb=round(pico / 1024, 1))
+
+def micro_benchmarks(sistema, backend, repeticiones=20, semilla=0):
+    """Mide los métodos del sistema de a uno, sobre la caché ya cargada"""
+    aleatorio = random.Random(semilla)
+    df = sistema.df_inventario
+    ids = df.index[df['cantidad'].astype(float) > 1].tolist()
+    nombres = list(zip(df['reactivo'], df['unidad']))
+
+    def invalidar_reporte(_):
+        sistema._memo_reporte = (None, None)
+
+    resultados = {
+        'cargar_datos_completo': medir(lambda i: sistema.cargar_datos(completo=True), backend,
+                                       max(3, repeticiones // 5)),
+        'cargar_datos_incremental': medir(lambda i: sistema.cargar_datos(), backend, repeticiones),
+        'buscar_reactivo': medir(
+            lambda i: sistema.buscar_reactivo(TERMINOS_BUSQUEDA[i % len(TERMINOS_BUSQUEDA)], limite=LIMITE_BUSQUEDA),
+            backend, repeticiones),
+        'verificar_vencimientos': medir(lambda i: sistema.verificar_vencimientos(30), backend, repeticiones),
+        'generar_reporte_stock': medir(lambda i: sistema.generar_reporte_stock(), backend,
+                                       repeticiones, preparar=invalidar_reporte),
+        'historial_movimientos': medir(
+            lambda i: sistema.historial_movimientos(usuario=USUARIOS[i % len(USUARIOS)]), backend, repeticiones),
+        'consumo_historico': medir(lambda i: sistema.consumo_historico(frecuencia='M'), backend,
+                                   max(3, repeticiones // 5)),
+        'registrar_salida': medir(
+            lambda i: sistema.registrar_salida(aleatorio.choice(ids), 0.01, 'bench', 'BENCH'),
+            backend, repeticiones),
+        'registrar_entrada': medir(
+            lambda i: sistema.registrar_entrada(*_nombre_y_unidad(aleatorio.choice(nombres))),
+            backend, repeticiones),
+    }
+    return resultados
+
+def _nombre_y_unidad(par):
+    nombre, unidad = par
+    return nombre, 1, 'bench', 'BENCH', unidad
+
+def prueba_carga(sistema, backend, hilos=16, salidas_por_hilo=25, reactivos=5, cantidad=1.0, semilla=0):
+    """Salidas concurrentes sobre pocos reactivos, con demanda mayor al stock.
+
+    Verifica que ninguna salida aceptada deje stock negativo: para cada reactivo,
+    stock inicial - suma de salidas aceptadas debe ser igual al stock final (>= 0).
+    """
+    aleatorio = random.Random(semilla)
+    df = sistema.df_inventario
+    unidades_volumen = df[df['unidad'] == 'L']
+    objetivos = unidades_volumen.index[:reactivos].tolist()
+    # Stock de cada objetivo en 3/4 de la demanda esperada, para forzar rechazos
+    demanda = hilos * salidas_por_hilo * cantidad / len(objetivos)
+    fecha = datetime.now().strftime('%Y-%m-%d')
+    stock_inicial = {}
+    for id_ in objetivos:
+        backend.registrar_salida(id_, float(df.loc[id_, 'cantidad']), 'bench', 'BENCH', 'vaciado', fecha, '00:00:00')
+        fila = backend.registrar_entrada(df.loc[id_, 'reactivo'], demanda * 0.75, 'L', None,
+                                         'bench', 'BENCH', 'carga', fecha, '00:00:00')
+        stock_inicial[id_] = int(fila['inventario']['cantidad_base'])
+    sistema.cargar_datos()
+
+    latencias, aceptadas = [], Counter()
+    rechazadas = errores = 0
+    lock = threading.Lock()
+    barrera = threading.Barrier(hilos)
+    elecciones = [[aleatorio.choice(objetivos) for _ in range(salidas_por_hilo)] for _ in range(hilos)]
+
+    def trabajar(mis_objetivos):
+        nonlocal rechazadas, errores
+        propias, ok_propias, rechazos, fallos = [], Counter(), 0, 0
+        barrera.wait()
+        for id_ in mis_objetivos:
+            inicio = time.perf_counter()
+            exito, mensaje = sistema.registrar_salida(id_, cantidad, 'carga', 'BENCH')
+            propias.append(time.perf_counter() - inicio)
+            if exito:
+                ok_propias[id_] += 1
+            elif mensaje.startswith("Stock insuficiente"):
+                rechazos += 1
+            else:
+                fallos += 1
+        with lock:
+            latencias.extend(propias)
+            aceptadas.update(ok_propias)
+            rechazadas += rechazos
+            errores += fallos
+
+    viajes_antes = backend.total_viajes()
+    inicio = time.perf_counter()
+    trabajadores = [threading.Thread(target=trabajar, args=(e,)) for e in elecciones]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    duracion = time.perf_counter() - inicio
+
+    finales = {fila['id']: int(fila['cantidad_base']) for fila in backend.listar_inventario()
+               if fila['id'] in stock_inicial}
+    micro = a_micro(cantidad, 'L')
+    sin_sobregiro = all(
+        finales[id_] >= 0 and stock_inicial[id_] - aceptadas[id_] * micro == finales[id_]
+        for id_ in objetivos
+    )
+    return dict(
+        percentiles(latencias),
+        hilos=hilos,
+        salidas=hilos * salidas_por_hilo,
+        aceptadas=sum(aceptadas.values()),
+        rechazadas_por_stock=rechazadas,
+        errores=errores,
+        salidas_por_segundo=round(len(latencias) / duracion, 1),
+        viajes_totales=backend.total_viajes() - viajes_antes,
+        sin_sobregiro=sin_sobregiro,
+    )
+
+def memoria_pico_proceso_kb():
+    """Pico de memoria residente del proceso (None si la plataforma no lo informa)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS informa bytes, Linux kilobytes
+    return round(pico / 1024, 1) if sys.platform == 'darwin' else pico
+
+def comparar(anterior, actual, tolerancia=0.2, metrica='p50_ms', minimo_ms=1.0):
+    """Operaciones cuya `metrica` empeoró más de `tolerancia` (fracción) respecto de `anterior`.
+
+    Las diferencias menores a `minimo_ms` se ignoran: por debajo es ruido de medición.
+    """
+    regresiones = {}
+    for operacion, medida in actual.get('micro', {}).items():
+        base = anterior.get('micro', {}).get(operacion, {}).get(metrica)
+        ahora = medida.get(metrica, 0)
+        if base and ahora > base * (1 + tolerancia) and ahora - base >= minimo_ms:
+            regresiones[operacion] = {'antes': base, 'ahora': medida[metrica]}
+    return regresiones
+
+def ejecutar(reactivos, movimientos, ruta=None, latencia=0.0, variacion=0.0, repeticiones=20,
+             hilos=16, salidas_por_hilo=25, semilla=0):
+    """Siembra (o reutiliza) la base, corre micro-benchmarks y prueba de carga; devuelve el informe"""
+    ruta = ruta or ruta_sembrada(reactivos, movimientos, semilla)
+    inicio = time.perf_counter()
+    sembrar_sqlite(ruta, reactivos, movimientos, semilla)
+    with copia_de_trabajo(ruta) as base:
+        preparacion = time.perf_counter() - inicio
+
+        backend = BackendMedido(base, latencia, variacion, semilla)
+        inicio = time.perf_counter()
+        sistema = SistemaInventarioReactivos(backend=backend)
+        carga_inicial = time.perf_counter() - inicio
+
+        informe = {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'entorno': {'python': platform.python_version(), 'pandas': pd.__version__,
+                        'plataforma': platform.platform(), 'backend': base.nombre},
+            'parametros': {'reactivos': reactivos, 'movimientos': movimientos, 'latencia_ms': latencia * 1000,
+                           'variacion_ms': variacion * 1000, 'repeticiones': repeticiones, 'semilla': semilla},
+            'preparacion_s': round(preparacion, 2),
+            'carga_inicial_s': round(carga_inicial, 3),
+            'micro': micro_benchmarks(sistema, backend, repeticiones, semilla),
+            'carga': prueba_carga(sistema, backend, hilos, salidas_por_hilo, semilla=semilla),
+            'viajes_por_metodo': dict(backend.viajes),
+            'memoria_pico_proceso_kb': memoria_pico_proceso_kb(),
+        }
+    return informe
+
+# ============================================================================
+# LÍNEA DE COMANDOS
+# ============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks y prueba de carga del inventario (informe JSON)")
+    parser.add_argument('--escala', choices=list(ESCALAS), default='mini',
+                        help="Reactivos / filas de log predefinidos")
+    parser.add_argument('--reactivos', type=int, help="Reemplaza la cantidad de reactivos de la escala")
+    parser.add_argument('--movimientos', type=int, help="Reemplaza las filas de log de la escala")
+    parser.add_argument('--ruta', help="Archivo SQLite sembrado a reutilizar (si no existe se siembra; por defecto "
+                                       "uno por tamaño y semilla en el directorio temporal). Cada corrida usa una copia")
+    parser.add_argument('--latencia-ms', type=float, default=0.0, help="Latencia simulada por viaje al backend")
+    parser.add_argument('--variacion-ms', type=float, default=0.0, help="Variación aleatoria extra por viaje")
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--hilos', type=int, default=16, help="Usuarios concurrentes en la prueba de carga")
+    parser.add_argument('--salidas-por-hilo', type=int, default=25)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', help="Guardar el informe JSON en este archivo")
+    parser.add_argument('--comparar', help="Informe JSON anterior: sale con código 1 si hay regresiones")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="Empeoramiento admitido de p50 (fracción)")
+    args = parser.parse_args(argv)
+
+    reactivos, movimientos = ESCALAS[args.escala]
+    informe = ejecutar(
+        args.reactivos or reactivos, args.movimientos if args.movimientos is not None else movimientos,
+        ruta=args.ruta, latencia=args.latencia_ms / 1000, variacion=args.variacion_ms / 1000,
+        repeticiones=args.repeticiones, hilos=args.hilos, salidas_por_hilo=args.salidas_por_hilo,
+        semilla=args.semilla
+    )
+
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            archivo.write(texto)
+        print(f"✅ Informe guardado en {args.salida}", file=sys.stderr)
+    else:
+        print(texto)
+
+    codigo = 0 if informe['carga']['sin_sobregiro'] else 2
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            regresiones = comparar(json.load(archivo), informe, args.tolerancia)
+        for operacion, valores in regresiones.items():
+            print(f"⚠️ {operacion}: p50 {valores['antes']} ms -> {valores['ahora']} ms", file=sys.stderr)
+        if regresiones:
+            codigo = codigo or 1
+    return codigo
+
+if __name__ == "__main__":
+    sys.exit(main())
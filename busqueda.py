@@ -0,0 +1,453 @@
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+# Número CAS: 2-7 dígitos, 2 dígitos y dígito de control (p. ej. 7664-93-9)
+PATRON_CAS = re.compile(r'^\d{2,7}-?\d{2}-?\d$')
+
+# Similitud mínima de trigramas para aceptar una coincidencia aproximada
+SIMILITUD_MINIMA = 0.3
+
+# Fracción de los trigramas de la consulta que un nombre debe compartir para
+# que se calcule su similitud; acota los candidatos de la búsqueda aproximada
+FRACCION_COMUNES_MINIMA = 0.5
+
+# Filas reindexadas desde la última reconstrucción que se guardan aparte en
+# diccionarios; al superarlas se vuelven a armar los arreglos del índice
+MAXIMO_PENDIENTES = 2000
+
+# Tamaño de bloque (filas, y filas x ancho) al procesar nombres como matriz de códigos
+FILAS_POR_BLOQUE = 16384
+CELDAS_POR_BLOQUE = 1 << 21
+
+# Mayor código Unicode: cota superior para rangos de prefijo
+ULTIMO_CARACTER = '\U0010ffff'
+
+def normalizar(texto):
+    """Minúsculas, sin acentos y con espacios colapsados ("Ácido  X" -> "acido x")"""
+    if texto is None:
+        return ""
+    descompuesto = unicodedata.normalize('NFKD', str(texto))
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_acentos.lower().split())
+
+def normalizar_cas(texto):
+    """Solo dígitos del número CAS, para comparar con o sin guiones"""
+    return re.sub(r'\D', '', str(texto or ''))
+
+def trigramas(texto):
+    """Trigramas del texto normalizado, con relleno para pesar los inicios de palabra"""
+    relleno = f"  {texto} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+def codigo_trigrama(trigrama):
+    """Trigrama -> entero (21 bits por carácter), la clave de los arreglos del índice"""
+    return (ord(trigrama[0]) << 42) | (ord(trigrama[1]) << 21) | ord(trigrama[2])
+
+# ============================================================================
+# NORMALIZACIÓN VECTORIZADA
+# ============================================================================
+
+# Código -> código normalizado (0 = se quita), o -1 si no se traduce carácter
+# a carácter (se expande, como las ligaduras, o depende del contexto, como la sigma)
+_TRADUCCIONES = {0: 0}
+
+def _traducir_caracter(codigo):
+    caracter = chr(codigo)
+    descompuesto = unicodedata.normalize('NFKD', caracter)
+    traducido = ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+    if caracter == 'Σ' or len(traducido) > 1:
+        return -1
+    if not traducido:
+        return 0
+    return 32 if traducido.isspace() else ord(traducido)
+
+def _bloques(textos):
+    """(posiciones, matriz uint32 de códigos con 0 de relleno) por bloques de largo parecido"""
+    longitudes = np.fromiter(map(len, textos), dtype=np.int64, count=len(textos))
+    orden = np.argsort(longitudes, kind='stable')
+    inicio = 0
+    while inicio < len(textos):
+        # Ordenados por largo: el último del bloque fija el ancho de la matriz
+        ancho = max(int(longitudes[orden[min(inicio + FILAS_POR_BLOQUE, len(textos)) - 1]]), 1)
+        fin = min(inicio + min(FILAS_POR_BLOQUE, max(1, CELDAS_POR_BLOQUE // ancho)), len(textos))
+        filas = orden[inicio:fin]
+        matriz = np.array([textos[i] for i in filas], dtype=str)
+        yield filas, matriz.view(np.uint32).reshape(len(filas), -1)
+        inicio = fin
+
+def _compactar(codigos):
+    """Corre a la izquierda los caracteres no nulos de cada fila, sin cambiar su orden"""
+    orden = np.argsort(codigos == 0, axis=1, kind='stable')
+    return np.take_along_axis(codigos, orden, axis=1)
+
+def normalizar_serie(valores):
+    """normalizar() de toda una columna, operando sobre la matriz de códigos de carácter
+
+    NFKD, quitar marcas combinantes y pasar a minúsculas se resuelven carácter
+    por carácter (NFKD solo reordena marcas, que se quitan), así que la
+    traducción se calcula una vez por carácter distinto. Las pocas filas con
+    caracteres que no se traducen uno a uno usan normalizar().
+    """
+    textos = ['' if valor is None or valor != valor else str(valor) for valor in valores]
+    resultado = np.empty(len(textos), dtype=object)
+    for filas, codigos in _bloques(textos):
+        presentes = np.flatnonzero(np.bincount(codigos.ravel()))
+        for codigo in presentes.tolist():
+            if codigo not in _TRADUCCIONES:
+                _TRADUCCIONES[codigo] = _traducir_caracter(codigo)
+        tabla = np.zeros(int(presentes[-1]) + 1, dtype=np.int64)
+        tabla[presentes] = [_TRADUCCIONES[codigo] for codigo in presentes.tolist()]
+        traducidos = tabla[codigos]
+        especiales = (traducidos < 0).any(axis=1)
+        traducidos = _compactar(np.where(traducidos < 0, 0, traducidos).astype(np.uint32))
+
+        # Espacios colapsados y recortados, como ' '.join(texto.split())
+        espacio = traducidos == 32
+        previo = np.ones_like(espacio)
+        previo[:, 1:] = espacio[:, :-1]
+        traducidos[espacio & previo] = 0
+        traducidos = _compactar(traducidos)
+        final = np.ones_like(espacio)
+        final[:, :-1] = traducidos[:, 1:] == 0
+        traducidos[(traducidos == 32) & final] = 0
+
+        ancho = traducidos.shape[1]
+        resultado[filas] = np.ascontiguousarray(traducidos).view(f'<U{ancho}').ravel().tolist()
+        for fila in filas[especiales].tolist():
+            resultado[fila] = normalizar(textos[fila])
+    return resultado.tolist()
+
+def _pares_trigramas(nombres):
+    """(códigos, posiciones) de los trigramas de cada nombre normalizado, sin repetir
+    dentro de un nombre y ordenados por código y posición (listas de postings)
+
+    Cada par se empaqueta en un solo entero (rango de cada carácter entre los
+    presentes + posición) para ordenar con np.sort en lugar de lexsort.
+    """
+    bloques = []
+    for filas, matriz in _bloques(nombres):
+        # Relleno "  nombre " como en trigramas()
+        relleno = np.zeros((len(filas), matriz.shape[1] + 3), dtype=np.int64)
+        relleno[:, :2] = 32
+        relleno[:, 2:-1] = matriz
+        largos = (matriz != 0).sum(axis=1)
+        relleno[np.arange(len(filas)), largos + 2] = 32
+        validos = np.arange(matriz.shape[1] + 1) <= largos[:, None]
+        bloques.append((filas, relleno, validos))
+    if not bloques:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+
+    caracteres = np.flatnonzero(np.bincount(np.concatenate([relleno.ravel() for _, relleno, _ in bloques])))
+    bits = max(int(len(caracteres)).bit_length(), 1)
+    bits_posicion = max(len(nombres).bit_length(), 1)
+    if 3 * bits + bits_posicion > 63:
+        # Demasiados caracteres distintos para empaquetar: orden por dos claves
+        codigos = np.concatenate([((r[:, :-2] << 42) | (r[:, 1:-1] << 21) | r[:, 2:])[v] for _, r, v in bloques])
+        posiciones = np.concatenate([np.broadcast_to(f[:, None], v.shape)[v] for f, _, v in bloques])
+        orden = np.lexsort((posiciones, codigos))
+        codigos, posiciones = codigos[orden], posiciones[orden]
+        distintos = np.ones(len(codigos), dtype=bool)
+        distintos[1:] = (codigos[1:] != codigos[:-1]) | (posiciones[1:] != posiciones[:-1])
+        return codigos[distintos], posiciones[distintos]
+
+    # Rango del carácter entre los presentes: conserva el orden de los códigos
+    rangos = np.zeros(int(caracteres[-1]) + 1, dtype=np.int64)
+    rangos[caracteres] = np.arange(len(caracteres))
+    claves = []
+    for filas, relleno, validos in bloques:
+        r = rangos[relleno]
+        compacto = (r[:, :-2] << (2 * bits)) | (r[:, 1:-1] << bits) | r[:, 2:]
+        claves.append(((compacto << bits_posicion) | filas[:, None])[validos])
+    claves = np.sort(np.concatenate(claves))
+    claves = claves[np.concatenate(([True], claves[1:] != claves[:-1]))]
+    mascara = (1 << bits) - 1
+    compacto = claves >> bits_posicion
+    codigos = ((caracteres[compacto >> (2 * bits)] << 42) | (caracteres[(compacto >> bits) & mascara] << 21)
+               | caracteres[compacto & mascara])
+    return codigos, claves & ((1 << bits_posicion) - 1)
+
+# ============================================================================
+# ÍNDICE DE BÚSQUEDA
+# ============================================================================
+
+class _ArreglosIndice:
+    """Parte inmutable del índice, armada de una vez con numpy
+
+    Nombres en orden alfabético (prefijos por búsqueda binaria) y postings de
+    trigramas: para cada código de trigrama, las posiciones ordenadas de los
+    nombres que lo tienen. 'vigente' marca las posiciones no reemplazadas.
+    """
+
+    def __init__(self, ids, nombres):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.nombres = list(nombres)
+        self.posicion = dict(zip(self.ids.tolist(), range(len(self.ids))))
+        self.vigente = np.ones(len(self.ids), dtype=bool)
+        # Orden de pyarrow (bytes UTF-8) = orden de Python (puntos de código)
+        self.orden = pd.Series(self.nombres, dtype=str).argsort(kind='stable').to_numpy(dtype=np.int64)
+        self.ordenados = [self.nombres[posicion] for posicion in self.orden.tolist()]
+        self.rango = np.empty(len(self.ids), dtype=np.int64)
+        self.rango[self.orden] = np.arange(len(self.ids))
+        codigos, posiciones = _pares_trigramas(self.nombres)
+        self.n_trigramas = np.bincount(posiciones, minlength=len(self.ids))
+        # Los códigos vienen ordenados: cada posting es un tramo contiguo
+        inicios = np.flatnonzero(np.concatenate(([True], codigos[1:] != codigos[:-1]))) if len(codigos) else []
+        self.claves = codigos[inicios]
+        self.inicios = np.append(inicios, len(codigos)).astype(np.int64)
+        self.postings = posiciones
+
+    def rango_prefijo(self, consulta):
+        """Tramo [inicio, fin) de 'ordenados' con los nombres que empiezan con la consulta"""
+        return (bisect_left(self.ordenados, consulta),
+                bisect_left(self.ordenados, consulta + ULTIMO_CARACTER))
+
+    def posting(self, codigo):
+        """Posiciones de los nombres que tienen el trigrama"""
+        indice = np.searchsorted(self.claves, codigo)
+        if indice >= len(self.claves) or self.claves[indice] != codigo:
+            return self.postings[:0]
+        return self.postings[self.inicios[indice]:self.inicios[indice + 1]]
+
+    def postings_entre(self, desde, hasta):
+        """Posiciones (sin repetir) de los nombres con algún trigrama de código en [desde, hasta)"""
+        inicio, fin = np.searchsorted(self.claves, [desde, hasta])
+        return np.unique(self.postings[self.inicios[inicio]:self.inicios[fin]])
+
+class IndiceBusqueda:
+    """Índice en memoria de nombres de reactivos (trigramas + nombres ordenados)
+
+    Devuelve ids ordenados por relevancia: exacto, prefijo, subcadena y por
+    último coincidencias aproximadas por similitud de trigramas (errores de
+    tipeo). Los términos con forma de número CAS se buscan en la columna 'cas'
+    si el inventario la tiene.
+
+    reconstruir() normaliza la columna y arma los arreglos de una vez. Las
+    filas que después cambian de nombre o son nuevas (sincronización
+    incremental) se marcan como no vigentes en los arreglos y se indexan en
+    diccionarios aparte; pasadas MAXIMO_PENDIENTES se rearman los arreglos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._nombres = {}      # id -> nombre normalizado (todas las filas)
+        self._por_nombre = {}   # nombre normalizado -> set de ids
+        self._cas = {}          # id -> CAS solo dígitos
+        self._base = _ArreglosIndice([], [])
+        self._pendientes = {}   # id -> cantidad de trigramas (filas fuera de los arreglos)
+        self._trigramas = {}    # trigrama -> set de ids pendientes
+
+    def __len__(self):
+        return len(self._nombres)
+
+    @staticmethod
+    def _columnas(df):
+        """Ids, nombres normalizados y CAS (solo dígitos) de las filas del DataFrame"""
+        if df is None or df.empty or 'reactivo' not in df.columns:
+            return [], [], []
+        ids = df['id'].tolist()
+        nombres = normalizar_serie(df['reactivo'].tolist())
+        if 'cas' in df.columns:
+            cas = df['cas'].astype(object).fillna('').astype(str).str.replace(r'\D', '', regex=True).tolist()
+        else:
+            cas = [''] * len(ids)
+        return ids, nombres, cas
+
+    def reconstruir(self, df):
+        """Reconstruye el índice completo desde un DataFrame de inventario"""
+        ids, nombres, cas = self._columnas(df)
+        # Todo el trabajo fuera del lock: las búsquedas siguen con el índice anterior
+        base = _ArreglosIndice(ids, nombres)
+        por_nombre = {}
+        for id_, nombre in zip(ids, nombres):
+            por_nombre.setdefault(nombre, set()).add(id_)
+        with self._lock:
+            self._base = base
+            self._nombres = dict(zip(ids, nombres))
+            self._por_nombre = por_nombre
+            self._cas = {id_: valor for id_, valor in zip(ids, cas) if valor}
+            self._pendientes = {}
+            self._trigramas = {}
+
+    def actualizar(self, df_cambios):
+        """Reindexa solo las filas nuevas o que cambiaron de nombre"""
+        ids, nombres, cas = self._columnas(df_cambios)
+        with self._lock:
+            for id_, nombre, valor_cas in zip(ids, nombres, cas):
+                if valor_cas:
+                    self._cas[id_] = valor_cas
+                else:
+                    self._cas.pop(id_, None)
+                if self._nombres.get(id_) == nombre:
+                    # Cambió el stock u otra columna: el nombre ya está indexado
+                    continue
+                self._quitar(id_)
+                self._nombres[id_] = nombre
+                self._por_nombre.setdefault(nombre, set()).add(id_)
+                trigramas_nombre = trigramas(nombre)
+                self._pendientes[id_] = len(trigramas_nombre)
+                for trigrama in trigramas_nombre:
+                    self._trigramas.setdefault(trigrama, set()).add(id_)
+            if len(self._pendientes) > MAXIMO_PENDIENTES:
+                ids = list(self._nombres)
+                self._base = _ArreglosIndice(ids, [self._nombres[id_] for id_ in ids])
+                self._pendientes = {}
+                self._trigramas = {}
+
+    def eliminar(self, ids):
+        """Quita filas del índice"""
+        with self._lock:
+            for id_ in ids:
+                self._quitar(id_)
+                self._cas.pop(id_, None)
+
+    def _quitar(self, id_):
+        nombre = self._nombres.pop(id_, None)
+        if nombre is None:
+            return
+        ids = self._por_nombre.get(nombre)
+        if ids is not None:
+            ids.discard(id_)
+            if not ids:
+                del self._por_nombre[nombre]
+        posicion = self._base.posicion.get(id_)
+        if posicion is not None:
+            self._base.vigente[posicion] = False
+        if self._pendientes.pop(id_, None) is not None:
+            for trigrama in trigramas(nombre):
+                ids = self._trigramas.get(trigrama)
+                if ids is not None:
+                    ids.discard(id_)
+                    if not ids:
+                        del self._trigramas[trigrama]
+
+    def id_por_nombre(self, nombre):
+        """Id del reactivo con ese nombre normalizado (el menor si hay duplicados), o None"""
+        with self._lock:
+            ids = self._por_nombre.get(normalizar(nombre))
+            return min(ids) if ids else None
+
+    def buscar(self, termino, limite=None, aproximada=True):
+        """Ids que coinciden con el término, del más al menos relevante (a lo sumo `limite`)"""
+        consulta = normalizar(termino)
+        if not consulta:
+            return []
+
+        with self._lock:
+            if PATRON_CAS.match(consulta.replace(' ', '')):
+                cas = normalizar_cas(consulta)
+                ids_cas = [id_ for id_, valor in self._cas.items() if valor == cas]
+                if ids_cas:
+                    return ids_cas[:limite] if limite else ids_cas
+
+            # Tuplas (-puntaje, nombre, id): exacto 3, prefijo 2, subcadena 1
+            resultados = self._literales(consulta, limite) + self._literales_pendientes(consulta)
+            # Lo aproximado solo entra si lo literal no alcanza (errores de tipeo)
+            if aproximada and len(resultados) < (limite or 1):
+                vistos = {id_ for _, _, id_ in resultados}
+                resultados += [r for r in self._similares(consulta, limite) if r[2] not in vistos]
+
+            if limite:
+                return [id_ for _, _, id_ in heapq.nsmallest(limite, resultados)]
+            return [id_ for _, _, id_ in sorted(resultados)]
+
+    def _literales(self, consulta, limite=None):
+        """Coincidencias literales en los arreglos, en orden de relevancia y nombre, hasta `limite`"""
+        base = self._base
+        inicio, fin = base.rango_prefijo(consulta)
+        posiciones = base.orden[inicio:fin]
+        posiciones = posiciones[base.vigente[posiciones]][:limite]
+        resultados = [(-3.0 if base.nombres[p] == consulta else -2.0, base.nombres[p], int(base.ids[p]))
+                      for p in posiciones.tolist()]
+        if limite and len(resultados) >= limite:
+            return resultados
+
+        # Subcadena: nombres con todos los trigramas internos de la consulta o, si
+        # es muy corta, con una palabra que empieza por ella (trigrama ' ' + consulta)
+        if len(consulta) >= 3:
+            postings = sorted((base.posting(codigo_trigrama(consulta[i:i + 3]))
+                               for i in range(len(consulta) - 2)), key=len)
+            candidatos = postings[0]
+            for posting in postings[1:]:
+                candidatos = np.intersect1d(candidatos, posting, assume_unique=True)
+        else:
+            desde = (32 << 42) | (ord(consulta[0]) << 21) | (ord(consulta[1]) if len(consulta) == 2 else 0)
+            candidatos = base.postings_entre(desde, desde + (1 if len(consulta) == 2 else 1 << 21))
+        rangos = base.rango[candidatos]
+        candidatos = candidatos[base.vigente[candidatos] & ((rangos < inicio) | (rangos >= fin))]
+        # Por orden de nombre, verificando hasta completar el límite
+        for p in candidatos[np.argsort(base.rango[candidatos])].tolist():
+            if limite and len(resultados) >= limite:
+                break
+            if len(consulta) < 3 or consulta in base.nombres[p]:
+                resultados.append((-1.0, base.nombres[p], int(base.ids[p])))
+        return resultados
+
+    def _literales_pendientes(self, consulta):
+        """Coincidencias literales entre las filas indexadas fuera de los arreglos"""
+        if not self._pendientes:
+            return []
+        if len(consulta) >= 3:
+            candidatos = set.intersection(*(self._trigramas.get(consulta[i:i + 3], set())
+                                            for i in range(len(consulta) - 2)))
+        else:
+            inicio_palabra = ' ' + consulta
+            candidatos = set().union(*(ids for trigrama, ids in self._trigramas.items()
+                                       if trigrama.startswith(inicio_palabra)))
+        resultados = []
+        for id_ in candidatos:
+            nombre = self._nombres[id_]
+            if nombre == consulta:
+                resultados.append((-3.0, nombre, id_))
+            elif nombre.startswith(consulta):
+                resultados.append((-2.0, nombre, id_))
+            elif len(consulta) < 3 or consulta in nombre:
+                resultados.append((-1.0, nombre, id_))
+        return resultados
+
+    def _similares(self, consulta, limite=None):
+        """Nombres con similitud de trigramas (Dice) sobre el umbral, con puntaje < 1
+
+        Solo se puntúan nombres que comparten al menos FRACCION_COMUNES_MINIMA
+        de los trigramas de la consulta. Esos nombres aparecen por fuerza en
+        alguno de los postings más cortos (todos salvo los minimo - 1 más
+        largos): solo esos aportan candidatos, y los largos solo suman al
+        conteo de trigramas comunes.
+        """
+        base = self._base
+        trigramas_consulta = trigramas(consulta)
+        total = len(trigramas_consulta)
+        minimo = max(math.ceil(total * FRACCION_COMUNES_MINIMA),
+                     math.ceil(SIMILITUD_MINIMA * total / (2 - SIMILITUD_MINIMA)), 1)
+
+        postings = sorted((base.posting(codigo_trigrama(t)) for t in trigramas_consulta), key=len)
+        conteo = np.zeros(len(base.ids), dtype=np.int32)
+        for posting in postings[:total - minimo + 1]:
+            conteo[posting] += 1
+        candidatos = np.flatnonzero(conteo)
+        for posting in postings[total - minimo + 1:]:
+            conteo[posting] += 1
+        comunes = conteo[candidatos]
+        similitud = 2.0 * comunes / (total + base.n_trigramas[candidatos])
+        aceptados = (comunes >= minimo) & (similitud >= SIMILITUD_MINIMA) & base.vigente[candidatos]
+        candidatos, similitud = candidatos[aceptados], similitud[aceptados]
+        orden = np.lexsort((base.rango[candidatos], -similitud))[:limite]
+        # Debajo de cualquier coincidencia exacta/prefijo/subcadena
+        resultados = [(-0.99 * s, base.nombres[p], int(base.ids[p]))
+                      for p, s in zip(candidatos[orden].tolist(), similitud[orden].tolist())]
+
+        conteos = {}
+        for trigrama in trigramas_consulta:
+            for id_ in self._trigramas.get(trigrama, ()):
+                conteos[id_] = conteos.get(id_, 0) + 1
+        for id_, comunes_id in conteos.items():
+            similitud_id = 2.0 * comunes_id / (total + self._pendientes[id_])
+            if comunes_id >= minimo and similitud_id >= SIMILITUD_MINIMA:
+                resultados.append((-0.99 * similitud_id, self._nombres[id_], id_))
+        return resultados
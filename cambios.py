@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import threading
+
+# Segundos entre consultas de la marca de cambios cuando no hay canal realtime
+INTERVALO_SONDEO = 2.0
+
+# Tablas cuyos cambios se propagan a la caché
+TABLAS_OBSERVADAS = ('inventario', 'log_movimientos')
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# SUSCRIPCIONES
+# ============================================================================
+
+class SuscripcionCambios:
+    """Fuente de cambios de filas que corre en un hilo propio
+
+    Llama a al_cambiar(cambios) con una lista de dicts {'tabla', 'tipo',
+    'registro'} (tipo INSERT/UPDATE/DELETE), o con None cuando solo sabe que
+    algo cambió y quien escucha debe pedir el delta por sus marcas.
+    """
+
+    def __init__(self):
+        self._detener = threading.Event()
+        self._hilo = None
+
+    @property
+    def activa(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self, al_cambiar):
+        if self.activa:
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ejecutar, args=(al_cambiar,),
+                                      name=type(self).__name__, daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=5)
+
+    def _ejecutar(self, al_cambiar):
+        raise NotImplementedError
+
+class SondeoCambios(SuscripcionCambios):
+    """Sustituto local de realtime: consulta backend.marca_cambios() cada `intervalo`
+
+    Con SQLite la marca es PRAGMA data_version (sin tocar tablas); solo cuando
+    cambia se avisa, y el delta se trae con las marcas de sincronización.
+    """
+
+    def __init__(self, backend, intervalo=INTERVALO_SONDEO):
+        super().__init__()
+        self.backend = backend
+        self.intervalo = intervalo
+
+    def _ejecutar(self, al_cambiar):
+        marca = None
+        while not self._detener.wait(self.intervalo if marca is not None else 0):
+            try:
+                actual = self.backend.marca_cambios()
+                if marca is not None and actual != marca:
+                    al_cambiar(None)
+                marca = actual
+            except Exception:
+                logger.exception("Error sondeando cambios")
+
+class CanalRealtimeSupabase(SuscripcionCambios):
+    """Canal realtime de Supabase (postgres_changes) sobre las tablas observadas
+
+    Requiere habilitar la replicación realtime de inventario y log_movimientos
+    en el proyecto. El cliente realtime es asíncrono: corre en su propio event
+    loop dentro del hilo de la suscripción.
+    """
+
+    def __init__(self, url, key, tablas=TABLAS_OBSERVADAS):
+        super().__init__()
+        self.url = url
+        self.key = key
+        self.tablas = tablas
+
+    def _ejecutar(self, al_cambiar):
+        try:
+            asyncio.run(self._escuchar(al_cambiar))
+        except Exception:
+            logger.exception("Canal realtime de Supabase cerrado")
+
+    async def _escuchar(self, al_cambiar):
+        from supabase import acreate_client
+
+        cliente = await acreate_client(self.url, self.key)
+        canal = cliente.channel('inventario-cambios')
+        for tabla in self.tablas:
+            canal.on_postgres_changes('*', schema='public', table=tabla,
+                                      callback=lambda carga: self._entregar(carga, al_cambiar))
+        await canal.subscribe()
+        try:
+            while not self._detener.is_set():
+                await asyncio.sleep(0.5)
+        finally:
+            await cliente.remove_channel(canal)
+
+    @staticmethod
+    def _entregar(carga, al_cambiar):
+        datos = carga.get('data', carga)
+        tipo = datos.get('type') or datos.get('eventType')
+        tipo = str(getattr(tipo, 'value', tipo)).upper()
+        fila = datos.get('record') or datos.get('new') or {}
+        if tipo == 'DELETE':
+            fila = datos.get('old_record') or datos.get('old') or {}
+        try:
+            al_cambiar([{'tabla': datos.get('table'), 'tipo': tipo, 'registro': fila}])
+        except Exception:
+            logger.exception("Error aplicando cambio realtime")
+
+def crear_suscripcion(backend, intervalo=INTERVALO_SONDEO):
+    """Canal realtime si el backend es Supabase con credenciales, si no sondeo de la marca"""
+    cliente = getattr(backend, 'cliente', None)
+    url = getattr(cliente, 'supabase_url', None)
+    key = getattr(cliente, 'supabase_key', None)
+    if url and key:
+        return CanalRealtimeSupabase(url, key)
+    return SondeoCambios(backend, intervalo)
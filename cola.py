@@ -0,0 +1,247 @@
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+# Movimientos por petición al backend en cada envío de la cola
+TAMANO_LOTE_COLA = 50
+
+# Espera tras un envío fallido: se duplica en cada fallo seguido hasta el máximo
+ESPERA_INICIAL = 1.0
+ESPERA_MAXIMA = 60.0
+
+# Días que se conservan los movimientos ya confirmados (para mostrarlos en la app)
+DIAS_RETENCION_COLA = 7
+
+ESQUEMA_COLA = """
+CREATE TABLE IF NOT EXISTS pendientes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    clave TEXT NOT NULL UNIQUE,
+    tipo TEXT NOT NULL,
+    datos TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    intentos INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    resultado TEXT,
+    creado TEXT NOT NULL,
+    resuelto TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_pendientes_estado ON pendientes (estado, id);
+"""
+
+# Campos que cada reintento completa con la hora del envío: no cuentan al
+# comparar un movimiento con el ya encolado bajo la misma clave
+CAMPOS_DEL_MOMENTO = ('fecha', 'hora')
+
+logger = logging.getLogger(__name__)
+
+class ClaveEnConflicto(ValueError):
+    """La clave ya está en la cola con otro movimiento (otro tipo o datos distintos)"""
+
+def motivo_rechazo(resultado):
+    """Mensaje si el backend respondió pero no aplicó el movimiento (ok = false)"""
+    if resultado is None or resultado.get('ok', True):
+        return None
+    reactivo = resultado.get('inventario')
+    if reactivo is None:
+        return "Reactivo no encontrado"
+    return f"Stock insuficiente. Disponible: {float(reactivo['cantidad'])} {reactivo['unidad']}"
+
+def _sin_momento(datos):
+    return {campo: valor for campo, valor in datos.items() if campo not in CAMPOS_DEL_MOMENTO}
+
+class ColaMovimientos:
+    """Cola local y durable de movimientos (write-behind) con envío en segundo plano
+
+    encolar() guarda el movimiento en un archivo SQLite y vuelve de inmediato;
+    un hilo lo envía al backend en lotes con registrar_movimientos_lote. Cada
+    movimiento lleva una clave de idempotencia (uuid) que el backend recuerda,
+    así un reintento tras un corte nunca descuenta stock dos veces. Si el envío
+    falla (red, backend caído) se reintenta con espera exponencial; lo pendiente
+    sobrevive a reinicios del proceso.
+
+    al_resolver(resueltos) se llama desde el hilo de envío con la lista de
+    movimientos que pasaron a confirmado o rechazado.
+    """
+
+    def __init__(self, backend, ruta='cola_movimientos.db', al_resolver=None,
+                 tamano_lote=TAMANO_LOTE_COLA, espera_inicial=ESPERA_INICIAL, espera_maxima=ESPERA_MAXIMA):
+        self.backend = backend
+        self.ruta = ruta
+        self.al_resolver = al_resolver
+        self.tamano_lote = tamano_lote
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        # Una conexión para encolar (sesiones) y enviar (hilo), serializada por el lock
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.row_factory = sqlite3.Row
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.executescript(ESQUEMA_COLA)
+        self._lock = threading.Lock()
+        self._lock_envio = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self.ultimo_error = None
+
+    # ------------------------------------------------------------------------
+    # Encolado y consulta
+    # ------------------------------------------------------------------------
+
+    def encolar(self, tipo, datos, clave=None):
+        """Guarda un movimiento ('ENTRADA' o 'SALIDA' + argumentos del backend); devuelve su clave.
+
+        Un cliente que reintenta puede traer su propia clave: si ya estaba en
+        la cola, el movimiento no se encola de nuevo. Si la clave ya se usó con
+        otro movimiento, lanza ClaveEnConflicto en lugar de descartarlo.
+        """
+        clave = clave or uuid.uuid4().hex
+        with self._lock:
+            cursor = self._conexion.execute(
+                "INSERT OR IGNORE INTO pendientes (clave, tipo, datos, creado) VALUES (?, ?, ?, ?)",
+                (clave, tipo, json.dumps(datos), datetime.now().isoformat())
+            )
+            if cursor.rowcount == 0:
+                previo = self._conexion.execute(
+                    "SELECT tipo, datos FROM pendientes WHERE clave = ?", (clave,)
+                ).fetchone()
+                if (previo['tipo'] != tipo
+                        or _sin_momento(json.loads(previo['datos'])) != _sin_momento(json.loads(json.dumps(datos)))):
+                    raise ClaveEnConflicto(f"La clave {clave} ya se usó con otro movimiento")
+        self._despertar.set()
+        return clave
+
+    def pendientes(self):
+        """Cantidad de movimientos aún no confirmados por el backend"""
+        with self._lock:
+            return self._conexion.execute(
+                "SELECT COUNT(*) FROM pendientes WHERE estado = 'pendiente'"
+            ).fetchone()[0]
+
+    def recientes(self, limite=20):
+        """Últimos movimientos encolados (cualquier estado), del más nuevo al más viejo"""
+        with self._lock:
+            filas = self._conexion.execute(
+                "SELECT clave, tipo, datos, estado, intentos, error, resultado, creado, resuelto "
+                "FROM pendientes ORDER BY id DESC LIMIT ?", (limite,)
+            ).fetchall()
+        return [self._movimiento(fila) for fila in filas]
+
+    def consultar(self, clave):
+        """Movimiento con esa clave (con su estado), o None si no pasó por la cola"""
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT clave, tipo, datos, estado, intentos, error, resultado, creado, resuelto "
+                "FROM pendientes WHERE clave = ?", (clave,)
+            ).fetchone()
+        return self._movimiento(fila) if fila is not None else None
+
+    @staticmethod
+    def _movimiento(fila):
+        movimiento = dict(fila)
+        movimiento['datos'] = json.loads(movimiento['datos'])
+        movimiento['resultado'] = json.loads(movimiento['resultado']) if movimiento['resultado'] else None
+        return movimiento
+
+    # ------------------------------------------------------------------------
+    # Envío
+    # ------------------------------------------------------------------------
+
+    @property
+    def activa(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self):
+        if self.activa:
+            return
+        self._purgar()
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ejecutar, name=type(self).__name__, daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=5)
+
+    def vaciar(self):
+        """Envía todo lo pendiente, lote a lote; devuelve cuántos movimientos se resolvieron.
+
+        Si el backend falla, el lote queda pendiente (con el error anotado) y la
+        excepción se propaga para que quien llama decida cuándo reintentar.
+        """
+        resueltos = 0
+        with self._lock_envio:
+            while True:
+                with self._lock:
+                    lote = self._conexion.execute(
+                        "SELECT clave, tipo, datos FROM pendientes WHERE estado = 'pendiente' "
+                        "ORDER BY id LIMIT ?", (self.tamano_lote,)
+                    ).fetchall()
+                if not lote:
+                    return resueltos
+                resueltos += self._enviar(lote)
+
+    def _enviar(self, lote):
+        claves = [fila['clave'] for fila in lote]
+        try:
+            respuestas = self.backend.registrar_movimientos_lote(
+                [dict(json.loads(fila['datos']), clave=fila['clave'], tipo=fila['tipo']) for fila in lote]
+            )
+        except Exception as e:
+            self.ultimo_error = str(e)
+            with self._lock:
+                self._conexion.executemany(
+                    "UPDATE pendientes SET intentos = intentos + 1, error = ? WHERE clave = ?",
+                    [(str(e), clave) for clave in claves]
+                )
+            raise
+        self.ultimo_error = None
+
+        ahora = datetime.now().isoformat()
+        tipos = {fila['clave']: fila['tipo'] for fila in lote}
+        resueltos = []
+        for respuesta in respuestas:
+            resultado = respuesta.get('resultado')
+            error = respuesta.get('error') or motivo_rechazo(resultado)
+            resueltos.append({'clave': respuesta['clave'], 'tipo': tipos.get(respuesta['clave']),
+                              'estado': 'rechazado' if error else 'confirmado',
+                              'resultado': resultado, 'error': error})
+        with self._lock:
+            self._conexion.executemany(
+                "UPDATE pendientes SET estado = ?, error = ?, resultado = ?, resuelto = ?, "
+                "intentos = intentos + 1 WHERE clave = ?",
+                [(r['estado'], r['error'], json.dumps(r['resultado']), ahora, r['clave']) for r in resueltos]
+            )
+        if self.al_resolver is not None and resueltos:
+            try:
+                self.al_resolver(resueltos)
+            except Exception:
+                logger.exception("Error aplicando movimientos confirmados")
+        return len(resueltos)
+
+    def _ejecutar(self):
+        espera = self.espera_inicial
+        while not self._detener.is_set():
+            # Se limpia antes de leer: un encolado durante el envío vuelve a despertar
+            self._despertar.clear()
+            try:
+                self.vaciar()
+            except Exception as e:
+                logger.warning("Envío de la cola fallido (%s); reintento en %.1f s", e, espera)
+                self._detener.wait(espera)
+                espera = min(espera * 2, self.espera_maxima)
+                continue
+            espera = self.espera_inicial
+            self._despertar.wait(self.espera_maxima)
+
+    def _purgar(self):
+        limite = (datetime.now() - timedelta(days=DIAS_RETENCION_COLA)).isoformat()
+        with self._lock:
+            self._conexion.execute(
+                "DELETE FROM pendientes WHERE estado != 'pendiente' AND resuelto < ?", (limite,)
+            )
@@ -0,0 +1,292 @@
+import contextlib
+import contextvars
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import wraps
+
+# Tramos y ejecuciones que se conservan en memoria (los más viejos se descartan)
+LIMITE_TRAMOS = 5000
+LIMITE_EJECUCIONES = 200
+
+# Filas del informe de cProfile
+LIMITE_PERFIL = 40
+
+NOMBRE_SERVICIO = 'inventario-reactivos'
+
+_tramo_actual = contextvars.ContextVar('tramo_actual', default=None)
+_ejecucion_actual = contextvars.ContextVar('ejecucion_actual', default=None)
+
+class Instrumentacion:
+    """Tramos de tiempo (spans), contadores por ejecución y perfiles de cProfile
+
+    Cada tramo guarda nombre, tipo ('ejecucion' = un rerun, 'metodo' del
+    sistema o 'backend' = un viaje), padre, duración y atributos. Los tramos
+    abiertos dentro de ejecucion() (un rerun de Streamlit) suman a esa
+    ejecución los viajes al backend, las filas transferidas y el tiempo en
+    backend y en métodos del sistema; lo que resta del total es pandas y
+    renderizado. Con `activa` en False los envoltorios llaman directo.
+    """
+
+    def __init__(self, activa=True):
+        self.activa = activa
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.tramos = deque(maxlen=LIMITE_TRAMOS)
+        self.ejecuciones = deque(maxlen=LIMITE_EJECUCIONES)
+        self._agregados = {}
+        self.ultimo_perfil = None
+
+    # ------------------------------------------------------------------------
+    # Registro
+    # ------------------------------------------------------------------------
+
+    @contextlib.contextmanager
+    def tramo(self, nombre, tipo='metodo', **atributos):
+        """Mide el bloque; cede el dict de atributos para completarlo (p. ej. filas)"""
+        if not self.activa:
+            yield atributos
+            return
+        padre = _tramo_actual.get()
+        registro = {
+            'nombre': nombre,
+            'tipo': tipo,
+            'id': next(self._ids),
+            'padre': padre['id'] if padre else None,
+            'traza': padre['traza'] if padre else None,
+            'inicio_ns': time.time_ns(),
+            'hilo': threading.current_thread().name,
+            'atributos': atributos,
+            'error': None,
+        }
+        if registro['traza'] is None:
+            registro['traza'] = registro['id']
+        token = _tramo_actual.set(registro)
+        inicio = time.perf_counter_ns()
+        try:
+            yield atributos
+        except Exception as e:
+            registro['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            # También ante st.rerun()/st.stop(), que no heredan de Exception
+            registro['duracion_ns'] = time.perf_counter_ns() - inicio
+            _tramo_actual.reset(token)
+            self._registrar(registro)
+
+    def _registrar(self, registro):
+        filas = registro['atributos'].get('filas', 0)
+        with self._lock:
+            self.tramos.append(registro)
+            agregado = self._agregados.setdefault(
+                (registro['tipo'], registro['nombre']),
+                {'llamadas': 0, 'total_ns': 0, 'max_ns': 0, 'filas': 0, 'errores': 0}
+            )
+            agregado['llamadas'] += 1
+            agregado['total_ns'] += registro['duracion_ns']
+            agregado['max_ns'] = max(agregado['max_ns'], registro['duracion_ns'])
+            agregado['filas'] += filas
+            agregado['errores'] += registro['error'] is not None
+
+            ejecucion = _ejecucion_actual.get()
+            if ejecucion is None or registro['tipo'] == 'ejecucion':
+                return
+            if registro['tipo'] == 'backend':
+                ejecucion['viajes'] += 1
+                ejecucion['filas'] += filas
+                ejecucion['backend_ns'] += registro['duracion_ns']
+            elif registro['padre'] == ejecucion['raiz']:
+                # Solo métodos de primer nivel: los anidados ya están contados en su padre
+                ejecucion['sistema_ns'] += registro['duracion_ns']
+
+    def anotar(self, **atributos):
+        """Agrega atributos al tramo abierto (y a la ejecución en curso)"""
+        tramo = _tramo_actual.get()
+        if tramo is not None:
+            tramo['atributos'].update(atributos)
+        ejecucion = _ejecucion_actual.get()
+        if ejecucion is not None:
+            ejecucion['atributos'].update(atributos)
+
+    @contextlib.contextmanager
+    def ejecucion(self, nombre='rerun', **atributos):
+        """Agrupa lo que ocurre en un rerun: duración, viajes, filas y reparto del tiempo"""
+        if not self.activa:
+            yield
+            return
+        acumulado = {'viajes': 0, 'filas': 0, 'backend_ns': 0, 'sistema_ns': 0,
+                     'raiz': None, 'atributos': dict(atributos)}
+        token = _ejecucion_actual.set(acumulado)
+        inicio = time.perf_counter_ns()
+        try:
+            with self.tramo(nombre, tipo='ejecucion', **atributos):
+                acumulado['raiz'] = _tramo_actual.get()['id']
+                yield
+        finally:
+            total = time.perf_counter_ns() - inicio
+            _ejecucion_actual.reset(token)
+            with self._lock:
+                self.ejecuciones.append({
+                    'inicio': datetime.now().isoformat(timespec='seconds'),
+                    'nombre': nombre,
+                    **acumulado['atributos'],
+                    'duracion_ms': round(total / 1e6, 2),
+                    'viajes': acumulado['viajes'],
+                    'filas': acumulado['filas'],
+                    'backend_ms': round(acumulado['backend_ns'] / 1e6, 2),
+                    'sistema_ms': round(acumulado['sistema_ns'] / 1e6, 2),
+                    # Lo que no es sistema ni backend: armado de la página y Streamlit
+                    'resto_ms': round(max(total - max(acumulado['sistema_ns'], acumulado['backend_ns']), 0) / 1e6, 2),
+                })
+
+    @contextlib.contextmanager
+    def perfilar(self, ordenar='cumulative', limite=LIMITE_PERFIL):
+        """Corre el bloque bajo cProfile y guarda el informe en ultimo_perfil"""
+        perfil = cProfile.Profile()
+        perfil.enable()
+        try:
+            yield
+        finally:
+            perfil.disable()
+            texto = io.StringIO()
+            pstats.Stats(perfil, stream=texto).sort_stats(ordenar).print_stats(limite)
+            self.ultimo_perfil = {'fecha': datetime.now().isoformat(timespec='seconds'),
+                                  'informe': texto.getvalue()}
+
+    def reiniciar(self):
+        with self._lock:
+            self.tramos.clear()
+            self.ejecuciones.clear()
+            self._agregados.clear()
+            self.ultimo_perfil = None
+
+    # ------------------------------------------------------------------------
+    # Consulta y exportación
+    # ------------------------------------------------------------------------
+
+    def resumen(self):
+        """Agregados por tramo (tipo, nombre), del mayor al menor tiempo total"""
+        with self._lock:
+            agregados = list(self._agregados.items())
+        filas = [{
+            'tipo': tipo,
+            'nombre': nombre,
+            'llamadas': datos['llamadas'],
+            'total_ms': round(datos['total_ns'] / 1e6, 2),
+            'media_ms': round(datos['total_ns'] / datos['llamadas'] / 1e6, 3),
+            'max_ms': round(datos['max_ns'] / 1e6, 2),
+            'filas': datos['filas'],
+            'errores': datos['errores'],
+        } for (tipo, nombre), datos in agregados]
+        return sorted(filas, key=lambda fila: fila['total_ms'], reverse=True)
+
+    def exportar_json(self):
+        """Todo lo registrado como dict serializable (resumen, ejecuciones y tramos)"""
+        with self._lock:
+            tramos = list(self.tramos)
+            ejecuciones = list(self.ejecuciones)
+        return {
+            'servicio': NOMBRE_SERVICIO,
+            'generado': datetime.now().isoformat(timespec='seconds'),
+            'resumen': self.resumen(),
+            'ejecuciones': ejecuciones,
+            'tramos': [dict(t, duracion_ms=round(t['duracion_ns'] / 1e6, 3)) for t in tramos],
+            'perfil': self.ultimo_perfil,
+        }
+
+    def exportar_otel(self):
+        """Tramos en el formato JSON de OTLP (ExportTraceServiceRequest), para un colector OpenTelemetry"""
+        with self._lock:
+            tramos = list(self.tramos)
+        spans = []
+        for t in tramos:
+            span = {
+                'traceId': f"{t['traza']:032x}",
+                'spanId': f"{t['id']:016x}",
+                'name': t['nombre'],
+                'kind': 3 if t['tipo'] == 'backend' else 1,   # CLIENT / INTERNAL
+                'startTimeUnixNano': str(t['inicio_ns']),
+                'endTimeUnixNano': str(t['inicio_ns'] + t['duracion_ns']),
+                'attributes': _atributos_otel(dict(t['atributos'], tipo=t['tipo'], hilo=t['hilo'])),
+                'status': {'code': 2, 'message': t['error']} if t['error'] else {'code': 1},
+            }
+            if t['padre'] is not None:
+                span['parentSpanId'] = f"{t['padre']:016x}"
+            spans.append(span)
+        return {'resourceSpans': [{
+            'resource': {'attributes': _atributos_otel({'service.name': NOMBRE_SERVICIO})},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+        }]}
+
+def _atributos_otel(atributos):
+    convertidos = []
+    for clave, valor in atributos.items():
+        if isinstance(valor, bool):
+            convertido = {'boolValue': valor}
+        elif isinstance(valor, int):
+            convertido = {'intValue': str(valor)}
+        elif isinstance(valor, float):
+            convertido = {'doubleValue': valor}
+        else:
+            convertido = {'stringValue': str(valor)}
+        convertidos.append({'key': clave, 'value': convertido})
+    return convertidos
+
+# Instancia del proceso (desactivable con INVENTARIO_DIAGNOSTICO=0)
+instrumentacion = Instrumentacion(activa=os.environ.get('INVENTARIO_DIAGNOSTICO', '1') != '0')
+
+# ============================================================================
+# ENVOLTORIOS
+# ============================================================================
+
+def contar_filas(resultado):
+    """Filas transferidas en una respuesta del backend (listas, o dicts de listas/filas)"""
+    if isinstance(resultado, list):
+        return len(resultado)
+    if isinstance(resultado, dict):
+        listas = [len(valor) for valor in resultado.values() if isinstance(valor, list)]
+        return sum(listas) if listas else 1
+    return 0
+
+class BackendInstrumentado:
+    """Envuelve un backend: cada llamada a un método público es un tramo 'backend' (un viaje)"""
+
+    def __init__(self, backend, instrumentacion=instrumentacion):
+        self._backend = backend
+        self._instrumentacion = instrumentacion
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self._backend, nombre)
+        if nombre.startswith('_') or not callable(atributo):
+            return atributo
+
+        @wraps(atributo)
+        def medido(*args, **kwargs):
+            with self._instrumentacion.tramo(nombre, tipo='backend') as atributos:
+                resultado = atributo(*args, **kwargs)
+                atributos['filas'] = contar_filas(resultado)
+                return resultado
+        return medido
+
+def instrumentar_clase(cls, instrumentacion=instrumentacion):
+    """Envuelve en tramos 'metodo' todas las funciones de la clase (no estáticas ni propiedades)"""
+    for nombre, atributo in list(vars(cls).items()):
+        if nombre.startswith('__') or not callable(atributo) or isinstance(atributo, (staticmethod, classmethod)):
+            continue
+        setattr(cls, nombre, _metodo_medido(atributo, f"{cls.__name__}.{nombre}", instrumentacion))
+    return cls
+
+def _metodo_medido(funcion, nombre, instrumentacion):
+    @wraps(funcion)
+    def medido(*args, **kwargs):
+        if not instrumentacion.activa:
+            return funcion(*args, **kwargs)
+        with instrumentacion.tramo(nombre):
+            return funcion(*args, **kwargs)
+    return medido
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+from unidades import UNIDADES
+
+# Tipos de columna admitidos en los esquemas:
+#   'entero'    int64 (nulos -> 0)
+#   'decimal'   float64
+#   'fecha'     datetime64 (texto inválido -> NaT)
+#   'categoria' categórica; las categorías conocidas van primero y se agregan las que aparezcan
+#   'texto'     el tipo de texto por defecto de pandas ('str' con pyarrow en pandas 3, si no object)
+# Cada columna es (tipo, categorías conocidas o None).
+
+TIPO_TEXTO = pd.Series(['']).dtype
+# Resolución fija de las fechas: un frame vacío y uno lleno tienen el mismo datetime64
+UNIDAD_FECHA = 'us'
+
+ESTADOS = ['disponible', 'en uso', 'agotado']
+TIPOS_MOVIMIENTO = ['ENTRADA', 'SALIDA']
+
+ESQUEMA_INVENTARIO = {
+    'id': ('entero', None),
+    'reactivo': ('texto', None),
+    'cantidad': ('decimal', None),
+    'cantidad_base': ('entero', None),
+    'unidad': ('categoria', UNIDADES),
+    'estado': ('categoria', ESTADOS),
+    'fecha_vencimiento': ('fecha', None),
+    'fecha_ingreso': ('fecha', None),
+    'notas': ('texto', None),
+    # Marca de sincronización: se devuelve tal cual al servidor, queda como texto
+    'updated_at': ('texto', None),
+    'nombre_normalizado': ('texto', None),
+}
+
+# En el log, fecha + hora se combinan en una sola columna datetime64 'fecha'.
+# Nombres, usuarios y proyectos se repiten mucho: categóricas (un código por fila)
+ESQUEMA_LOG = {
+    'id': ('entero', None),
+    'fecha': ('fecha', None),
+    'tipo_movimiento': ('categoria', TIPOS_MOVIMIENTO),
+    'reactivo': ('categoria', None),
+    'cantidad': ('decimal', None),
+    'unidad': ('categoria', UNIDADES),
+    'usuario': ('categoria', None),
+    'proyecto_curso': ('categoria', None),
+    'notas': ('texto', None),
+}
+
+def _convertir(valores, tipo, categorias=None):
+    """Columna ya tipada (arreglo, no Series) a partir de la lista de valores"""
+    if tipo in ('entero', 'decimal'):
+        numerico = 'int64' if tipo == 'entero' else 'float64'
+        try:
+            # Vía rápida: números (y None en decimal) de la base
+            return np.array(valores, dtype=numerico)
+        except (TypeError, ValueError, OverflowError):
+            convertidos = pd.to_numeric(pd.Series(valores, dtype=object), errors='coerce')
+            return (convertidos.fillna(0) if tipo == 'entero' else convertidos).to_numpy(dtype=numerico)
+    if tipo == 'fecha':
+        # ISO 8601 cubre 'YYYY-MM-DD' y 'YYYY-MM-DD HH:MM:SS' por la vía rápida
+        return pd.to_datetime(np.array(valores, dtype=object), errors='coerce', format='ISO8601').array.as_unit(UNIDAD_FECHA)
+    if tipo == 'categoria':
+        return _categorica(valores, categorias)
+    return pd.array(valores, dtype=TIPO_TEXTO)
+
+def _categorica(valores, categorias=None):
+    """Categorical con las categorías conocidas primero y luego las nuevas, ordenadas.
+
+    Los códigos salen de pd.factorize (una pasada, sin convertir a texto);
+    las categorías son siempre object para que frames vacíos y llenos, o
+    armados en momentos distintos, tengan el mismo tipo.
+    """
+    codigos, unicos = pd.factorize(np.array(valores, dtype=object))
+    conocidas = list(categorias or [])
+    posiciones = {valor: i for i, valor in enumerate(conocidas)}
+    for valor in sorted((u for u in unicos if u not in posiciones), key=str):
+        posiciones[valor] = len(posiciones)
+    tipo = pd.CategoricalDtype(pd.Index(list(posiciones), dtype=object))
+    if len(unicos):
+        # -1 (nulo) se conserva
+        mapa = np.array([posiciones[u] for u in unicos], dtype=np.int64)
+        codigos = np.where(codigos >= 0, mapa[codigos], -1)
+    return pd.Categorical.from_codes(codigos, dtype=tipo, validate=False)
+
+def _fecha_hora(filas):
+    """Texto 'fecha hora' por fila del log (hora ausente = medianoche)"""
+    return [f"{fila.get('fecha')} {fila.get('hora') or '00:00:00'}" if fila.get('fecha') else None
+            for fila in filas]
+
+def construir(filas, esquema):
+    """DataFrame tipado desde filas (dicts) del backend, armado columna a columna.
+
+    Las columnas del esquema ausentes en las filas quedan nulas con su tipo;
+    las que no están en el esquema se conservan sin convertir. Para el log,
+    'fecha' y 'hora' se combinan en 'fecha' (datetime64).
+    """
+    columnas = {}
+    for nombre, (tipo, categorias) in esquema.items():
+        if esquema is ESQUEMA_LOG and nombre == 'fecha':
+            valores = _fecha_hora(filas)
+        else:
+            valores = [fila.get(nombre) for fila in filas]
+        columnas[nombre] = _convertir(valores, tipo, categorias)
+    extras = []
+    for fila in filas[:1]:
+        extras = [c for c in fila if c not in esquema and not (esquema is ESQUEMA_LOG and c == 'hora')]
+    for nombre in extras:
+        columnas[nombre] = np.array([fila.get(nombre) for fila in filas], dtype=object)
+    return pd.DataFrame(columnas, copy=False)
+
+def vacio(esquema):
+    """Frame sin filas con los tipos definitivos del esquema"""
+    return construir([], esquema)
+
+def concatenar(frames, ignore_index=False):
+    """pd.concat sin deriva de tipos: las categóricas quedan categóricas.
+
+    Si todos los frames comparten las categorías de una columna, pd.concat ya
+    la conserva; si no, se recodifican a la unión de categorías (las del frame
+    más grande primero, así sus códigos no cambian).
+    """
+    frames = [df for df in frames if df is not None and len(df.columns)]
+    if not frames:
+        return pd.DataFrame()
+    mayor = max(frames, key=len)
+    tipos = [df.dtypes for df in frames]
+    alineados = None
+    for nombre, tipo in tipos[0].items():
+        if not isinstance(tipo, pd.CategoricalDtype) or not all(nombre in t for t in tipos[1:]):
+            continue
+        if all(_mismas_categorias(tipo, t[nombre]) for t in tipos[1:]):
+            continue
+        categorias = list(mayor[nombre].cat.categories) if isinstance(mayor[nombre].dtype, pd.CategoricalDtype) else []
+        for df in frames:
+            serie = df[nombre]
+            valores = serie.cat.categories if isinstance(serie.dtype, pd.CategoricalDtype) else serie
+            categorias.extend(_categorica(valores, categorias).categories[len(categorias):])
+        union = pd.CategoricalDtype(pd.Index(categorias, dtype=object))
+        if alineados is None:
+            alineados = [df.copy(deep=False) for df in frames]
+        for df in alineados:
+            df[nombre] = _recodificar(df[nombre], union)
+    return pd.concat(alineados or frames, ignore_index=ignore_index)
+
+def _recodificar(serie, tipo):
+    """La serie como categórica de ese tipo (cuyas categorías incluyen las suyas)"""
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        return _categorica(serie, list(tipo.categories))
+    if _mismas_categorias(serie.dtype, tipo):
+        return serie
+    posiciones = {valor: i for i, valor in enumerate(tipo.categories)}
+    mapa = np.array([posiciones[valor] for valor in serie.cat.categories] or [-1], dtype=np.int64)
+    codigos = serie.cat.codes.to_numpy()
+    return pd.Categorical.from_codes(np.where(codigos >= 0, mapa[codigos], -1), dtype=tipo, validate=False)
+
+def _mismas_categorias(a, b):
+    # Mismas categorías en el mismo orden y del mismo tipo: pd.concat no las toca
+    return (isinstance(b, pd.CategoricalDtype) and a.categories.dtype == b.categories.dtype
+            and a.categories.equals(b.categories))
+
+def reporte_memoria(df):
+    """Bytes por columna (deep) con su tipo, y una fila 'TOTAL'"""
+    if df is None:
+        df = pd.DataFrame()
+    bytes_columnas = df.memory_usage(deep=True, index=True)
+    reporte = pd.DataFrame({
+        'columna': bytes_columnas.index.astype(str),
+        'tipo': ['índice' if c == 'Index' else str(df[c].dtype) for c in bytes_columnas.index],
+        'bytes': bytes_columnas.to_numpy(dtype=np.int64),
+    })
+    total = pd.DataFrame({'columna': ['TOTAL'], 'tipo': [f"{len(df)} filas"],
+                          'bytes': [int(bytes_columnas.sum())]})
+    return pd.concat([reporte, total], ignore_index=True)
@@ -0,0 +1,278 @@
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from almacenamiento import backend_desde_entorno
+from busqueda import normalizar_serie
+from unidades import UNIDADES, dimension
+
+# Filas por petición al backend al importar / por página al exportar el log
+TAMANO_LOTE = 500
+TAMANO_PAGINA_EXPORTACION = 5000
+
+COLUMNAS_IMPORTACION = ['reactivo', 'cantidad', 'unidad', 'fecha_vencimiento',
+                        'usuario', 'proyecto_curso', 'notas', 'proveedor']
+
+# ============================================================================
+# LECTURA Y VALIDACIÓN
+# ============================================================================
+
+def leer_archivo(origen, nombre=None):
+    """Lee un CSV o Parquet (por extensión) desde una ruta o un archivo subido"""
+    nombre = str(nombre or getattr(origen, 'name', origen))
+    if nombre.lower().endswith('.parquet'):
+        return pd.read_parquet(origen)
+    return pd.read_csv(origen, dtype=str, keep_default_na=False)
+
+def validar_entradas(df, usuario=None, proyecto_curso=None, inventario=None):
+    """Valida y normaliza un archivo de entradas con operaciones vectorizadas.
+
+    `inventario` (DataFrame con 'reactivo' y 'unidad') es el stock actual: una
+    fila cuya unidad no se puede convertir a la del reactivo existente (kg a
+    un stock en L) se rechaza aquí en vez de hacer fallar su lote. Los
+    reactivos nuevos toman la dimensión de su primera fila válida del archivo.
+
+    Devuelve (df_validas, df_errores); df_errores conserva la fila original
+    (numerada como en el archivo, con encabezado) y el motivo en 'error'.
+    """
+    df = df.rename(columns=lambda columna: str(columna).strip().lower())
+    if 'reactivo' not in df.columns or 'cantidad' not in df.columns:
+        raise ValueError("El archivo debe tener las columnas 'reactivo' y 'cantidad'")
+
+    limpio = pd.DataFrame(index=df.index)
+    limpio['reactivo'] = df['reactivo'].astype(str).str.strip()
+    limpio['cantidad'] = pd.to_numeric(df['cantidad'], errors='coerce')
+    limpio['unidad'] = (df['unidad'].astype(str).str.strip().replace('', 'L')
+                        if 'unidad' in df.columns else 'L')
+    limpio['usuario'] = _texto_o_defecto(df, 'usuario', usuario)
+    limpio['proyecto_curso'] = _texto_o_defecto(df, 'proyecto_curso', proyecto_curso)
+    limpio['notas'] = _texto_o_defecto(df, 'notas', "")
+    limpio['proveedor'] = _texto_o_defecto(df, 'proveedor', "")
+
+    if 'fecha_vencimiento' in df.columns:
+        texto_fecha = df['fecha_vencimiento'].astype(str).str.strip()
+        fechas = pd.to_datetime(texto_fecha.where(~_vacio(texto_fecha)), errors='coerce')
+        fecha_invalida = ~_vacio(texto_fecha) & fechas.isna()
+        limpio['fecha_vencimiento'] = fechas.dt.strftime('%Y-%m-%d').where(fechas.notna(), None)
+    else:
+        fecha_invalida = pd.Series(False, index=df.index)
+        limpio['fecha_vencimiento'] = None
+
+    condiciones = [
+        _vacio(limpio['reactivo']),
+        limpio['cantidad'].isna(),
+        limpio['cantidad'] <= 0,
+        ~limpio['unidad'].isin(UNIDADES),
+        fecha_invalida,
+        _vacio(limpio['usuario']),
+        _vacio(limpio['proyecto_curso'])
+    ]
+    motivos = [
+        "Reactivo vacío",
+        "Cantidad no numérica",
+        "La cantidad debe ser mayor a 0",
+        f"Unidad no válida (use {', '.join(UNIDADES)})",
+        "Fecha de vencimiento no válida",
+        "Falta usuario",
+        "Falta proyecto/curso"
+    ]
+    error = pd.Series(np.select(condiciones, motivos, default=''), index=df.index)
+    incompatible, unidad_stock = _unidades_incompatibles(limpio, error == '', inventario)
+    error = error.mask(incompatible, "La unidad no es compatible con el stock en " + unidad_stock)
+    con_error = error != ''
+
+    df_errores = df[con_error].assign(error=error[con_error])
+    df_errores.index = df_errores.index + 2
+    return limpio.loc[~con_error, COLUMNAS_IMPORTACION].reset_index(drop=True), df_errores
+
+def _unidades_incompatibles(limpio, validas, inventario):
+    """Filas válidas cuya unidad es de otra dimensión que la del reactivo (existente o nuevo)
+
+    Devuelve (máscara, unidad del stock por fila) alineadas con `limpio`.
+    """
+    nombres = pd.Series(normalizar_serie(limpio['reactivo'].tolist()), index=limpio.index)
+    # Reactivos nuevos: la primera fila válida crea el reactivo con su unidad
+    unidades = limpio.loc[validas, 'unidad'].groupby(nombres[validas], sort=False).first()
+    if inventario is not None and len(inventario) > 0:
+        existentes = pd.Series(inventario['unidad'].astype(object).to_numpy(),
+                               index=normalizar_serie(inventario['reactivo'].tolist()))
+        existentes = existentes[~existentes.index.duplicated()]
+        unidades = existentes.combine_first(unidades)
+    unidad_stock = nombres.map(unidades).astype(object).fillna('').astype(str)
+    dimension_fila = limpio['unidad'].astype(object).map(dimension)
+    incompatible = validas & (dimension_fila != unidad_stock.map(dimension))
+    return incompatible, unidad_stock
+
+def _vacio(valores):
+    """Celdas vacías tal como llegan de CSV (texto) o Parquet (nulos convertidos a texto)"""
+    return pd.Series(valores).isin(['', 'nan', 'None', 'NaT', '<NA>'])
+
+def _texto_o_defecto(df, columna, defecto):
+    """Columna de texto del archivo, completando vacíos con el valor por defecto"""
+    if columna not in df.columns:
+        return defecto if defecto is not None else ''
+    serie = df[columna].astype(str).str.strip()
+    if defecto:
+        serie = serie.replace('', defecto)
+    return serie
+
+# ============================================================================
+# IMPORTACIÓN EN LOTES
+# ============================================================================
+
+class ImportacionInterrumpida(Exception):
+    """Falló un lote después de que otros ya quedaron registrados.
+
+    `resultados` trae los lotes confirmados (para fusionarlos en caché) y
+    `registradas` cuántas filas entraron.
+    """
+
+    def __init__(self, mensaje, resultados, registradas):
+        super().__init__(mensaje)
+        self.resultados = resultados
+        self.registradas = registradas
+
+def importar_entradas(backend, df_validas, al_avanzar=None):
+    """Escribe las entradas validadas en lotes de TAMANO_LOTE (una petición por lote).
+
+    Devuelve la lista de resultados de registrar_entradas_lote, para que quien
+    llama fusione las filas en su caché. Cada lote es una transacción: si uno
+    falla, los anteriores ya están confirmados y se informan con
+    ImportacionInterrumpida.
+    """
+    ahora = datetime.now()
+    df = df_validas.assign(fecha=ahora.strftime('%Y-%m-%d'), hora=ahora.strftime('%H:%M:%S'))
+    # NaN/NaT -> None para que viajen como null
+    df = df.astype(object).where(df.notna(), None)
+    movimientos = df.to_dict('records')
+
+    resultados = []
+    for inicio in range(0, len(movimientos), TAMANO_LOTE):
+        lote = movimientos[inicio:inicio + TAMANO_LOTE]
+        try:
+            resultados.append(backend.registrar_entradas_lote(lote))
+        except Exception as e:
+            raise ImportacionInterrumpida(
+                f"Se registraron {inicio} de {len(movimientos)} filas; el lote de las filas válidas "
+                f"{inicio + 1}-{inicio + len(lote)} falló y no se registró: {e}", resultados, inicio
+            ) from e
+        if al_avanzar is not None:
+            al_avanzar(min(inicio + TAMANO_LOTE, len(movimientos)), len(movimientos))
+    return resultados
+
+# ============================================================================
+# EXPORTACIÓN EN STREAMING
+# ============================================================================
+
+class _EscritorTabla:
+    """Escribe DataFrames por partes en CSV o Parquet sin juntarlos en memoria"""
+
+    def __init__(self, destino, formato):
+        self.destino = destino
+        self.formato = formato
+        self._parquet = None
+        self._primero = True
+
+    def escribir(self, df):
+        if df.empty:
+            return
+        if self.formato == 'parquet':
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise RuntimeError("Exportar a Parquet requiere pyarrow (pip install pyarrow)") from e
+            tabla = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.destino, tabla.schema)
+            self._parquet.write_table(tabla.cast(self._parquet.schema))
+        else:
+            df.to_csv(self.destino, index=False, header=self._primero, mode='w' if self._primero else 'a')
+        self._primero = False
+
+    def cerrar(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+def _formato(destino, formato=None):
+    if formato:
+        return formato
+    return 'parquet' if str(getattr(destino, 'name', destino)).lower().endswith('.parquet') else 'csv'
+
+def exportar_inventario(backend, destino, formato=None):
+    """Exporta el inventario completo; devuelve la cantidad de filas"""
+    df = pd.DataFrame(backend.listar_inventario())
+    escritor = _EscritorTabla(destino, _formato(destino, formato))
+    escritor.escribir(df)
+    escritor.cerrar()
+    return len(df)
+
+def exportar_movimientos(backend, destino, formato=None, filtros=None):
+    """Exporta el historial completo página a página (keyset por id); devuelve la cantidad de filas"""
+    escritor = _EscritorTabla(destino, _formato(destino, formato))
+    total, cursor = 0, None
+    try:
+        while True:
+            filas = backend.paginar_movimientos(antes_de_id=cursor, limite=TAMANO_PAGINA_EXPORTACION,
+                                                filtros=filtros)
+            if not filas:
+                break
+            escritor.escribir(pd.DataFrame(filas))
+            total += len(filas)
+            cursor = filas[-1]['id']
+            if len(filas) < TAMANO_PAGINA_EXPORTACION:
+                break
+    finally:
+        escritor.cerrar()
+    return total
+
+# ============================================================================
+# LÍNEA DE COMANDOS
+# ============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importación/exportación masiva del inventario de reactivos")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    importar = sub.add_parser('importar', help="Registra entradas desde un CSV/Parquet")
+    importar.add_argument('archivo')
+    importar.add_argument('--usuario', help="Usuario por defecto para filas sin 'usuario'")
+    importar.add_argument('--proyecto', help="Proyecto/curso por defecto para filas sin 'proyecto_curso'")
+    importar.add_argument('--errores', help="Ruta CSV donde guardar las filas rechazadas")
+
+    exportar = sub.add_parser('exportar', help="Exporta inventario o movimientos")
+    exportar.add_argument('tabla', choices=['inventario', 'movimientos'])
+    exportar.add_argument('destino', help="Archivo .csv o .parquet")
+
+    args = parser.parse_args(argv)
+    backend = backend_desde_entorno()
+
+    if args.comando == 'importar':
+        df_validas, df_errores = validar_entradas(leer_archivo(args.archivo), args.usuario, args.proyecto,
+                                                  inventario=pd.DataFrame(backend.listar_inventario()))
+        try:
+            importar_entradas(
+                backend, df_validas,
+                al_avanzar=lambda hechas, total: print(f"  {hechas}/{total} filas", file=sys.stderr)
+            )
+        except ImportacionInterrumpida as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return 1
+        print(f"✅ {len(df_validas)} entradas registradas, {len(df_errores)} filas rechazadas")
+        if len(df_errores) > 0 and args.errores:
+            df_errores.to_csv(args.errores, index_label='fila')
+        return 1 if len(df_errores) > 0 else 0
+
+    if args.tabla == 'inventario':
+        total = exportar_inventario(backend, args.destino)
+    else:
+        total = exportar_movimientos(backend, args.destino)
+    print(f"✅ {total} filas exportadas a {Path(args.destino).name}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,17 @@
+import contextlib
+import io
+import json
+import os
 import pandas as pd
 import streamlit as st
 from datetime import datetime, timedelta
-from supabase import create_client, Client
+import importacion
+import resumenes
+from almacenamiento import BackendInventario, crear_backend
+from diagnostico import instrumentacion
+from sistema import LIMITE_BUSQUEDA, RUTA_COLA, TAMANO_PAGINA_HISTORIAL, SistemaInventarioReactivos
+from unidades import UNIDADES, unidades_compatibles
+from vencimientos import HORIZONTES_VENCIMIENTO
 
 st.set_page_config(
     page_title="Sistema de Inventario de Reactivos",
@@ -11,344 +21,255 @@ st.set_page_config(
 )
 
 # ============================================================================
-# CONEXIÓN A SUPABASE
+# CONEXIÓN AL ALMACENAMIENTO
 # ============================================================================
 
+def leer_config_backend():
+    """Config del backend: variables de entorno o sección [backend] de secrets"""
+    config = {}
+    try:
+        config = dict(st.secrets.get("backend", {}))
+    except Exception:
+        pass
+    if os.environ.get("INVENTARIO_BACKEND"):
+        config['tipo'] = os.environ["INVENTARIO_BACKEND"]
+    if os.environ.get("INVENTARIO_SQLITE"):
+        config['ruta'] = os.environ["INVENTARIO_SQLITE"]
+    if "INVENTARIO_COLA" in os.environ:
+        config['cola'] = os.environ["INVENTARIO_COLA"]
+    return config
+
 @st.cache_resource
-def init_supabase() -> Client:
-    """Inicializa conexión con Supabase"""
+def init_backend() -> BackendInventario:
+    """Inicializa el backend configurado (Supabase por defecto, o SQLite local)"""
     try:
-        url = st.secrets["supabase"]["url"]
-        key = st.secrets["supabase"]["key"]
-        return create_client(url, key)
+        config = leer_config_backend()
+        cliente = None
+        if str(config.get('tipo', 'supabase')).lower() == 'supabase':
+            from supabase import create_client
+            url = st.secrets["supabase"]["url"]
+            key = st.secrets["supabase"]["key"]
+            cliente = create_client(url, key)
+        return crear_backend(config, cliente)
     except Exception as e:
-        st.error(f"Error conectando a Supabase: {e}")
+        st.error(f"Error conectando al almacenamiento: {e}")
         st.stop()
 
-supabase = init_supabase()
-
 # ============================================================================
-# CLASE PRINCIPAL DEL SISTEMA
+# INTERFAZ STREAMLIT
 # ============================================================================
 
-class SistemaInventarioReactivos:
-    """Gestión de inventario de reactivos químicos con Supabase"""
-    
-    def __init__(self):
-        self.df_inventario = None
-        self.df_log = None
-        self.cargar_datos()
+# Segundos entre chequeos (en memoria, sin consultar el backend) de la versión
+# compartida en cada sesión abierta
+INTERVALO_AVISO_CAMBIOS = 3
+
+# Indicador de color por categoría; reemplaza el Styler celda por celda
+ETIQUETAS_ESTADO = {'disponible': '🟢 disponible', 'en uso': '🟡 en uso', 'agotado': '🔴 agotado'}
+ETIQUETAS_TIPO = {'ENTRADA': '🟢 ENTRADA', 'SALIDA': '🔴 SALIDA'}
+ETIQUETAS_COLA = {'pendiente': '⏳ pendiente', 'confirmado': '✅ confirmado', 'rechazado': '❌ rechazado'}
+
+# Filas que se envían al navegador por vista de tabla
+FILAS_POR_VENTANA = 50
+
+def etiquetar(serie, etiquetas):
+    """Aplica las etiquetas sobre los códigos de categoría: un reemplazo por categoría, no por fila"""
+    categorias = serie.astype('category')
+    return categorias.cat.rename_categories([etiquetas.get(c, c) for c in categorias.cat.categories])
+
+def mostrar_ventana(df, columnas, clave, etiquetas=None, column_config=None,
+                    filas_por_ventana=FILAS_POR_VENTANA, alto=400):
+    """Muestra solo una ventana de filas de df; el resto nunca se serializa al navegador"""
+    total = len(df)
+    paginas = max(1, -(-total // filas_por_ventana))
+    pagina = 1
+    if paginas > 1:
+        pagina = st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas,
+                                 value=1, step=1, key=clave)
+    inicio = (pagina - 1) * filas_por_ventana
     
-    def cargar_datos(self):
-        """Carga datos desde Supabase"""
-        try:
-            # Cargar inventario
-            response = supabase.table('inventario').select("*").execute()
-            if response.data:
-                self.df_inventario = pd.DataFrame(response.data)
-            else:
-                st.info("No hay datos en inventario. Creando ejemplos iniciales...")
-                self.crear_inventario_inicial()
-            
-            # Cargar log
-            response = supabase.table('log_movimientos').select("*").order('id', desc=True).limit(1000).execute()
-            if response.data:
-                self.df_log = pd.DataFrame(response.data)
-            else:
-                self.df_log = pd.DataFrame()
-                
-        except Exception as e:
-            st.error(f"Error cargando datos: {e}")
-            self.df_inventario = pd.DataFrame()
-            self.df_log = pd.DataFrame()
+    # Recortar antes de renombrar/etiquetar: el costo depende de la ventana, no de la tabla
+    ventana = df.iloc[inicio:inicio + filas_por_ventana][list(columnas)]
+    for columna, mapa in (etiquetas or {}).items():
+        ventana = ventana.assign(**{columna: etiquetar(ventana[columna], mapa)})
     
-    def crear_inventario_inicial(self):
-        """Crea datos de ejemplo iniciales"""
-        datos_ejemplo = [
-            {
-                'reactivo': 'Ácido Sulfúrico 98%',
-                'cantidad': 2.5,
-                'unidad': 'L',
-                'estado': 'disponible',
-                'fecha_vencimiento': '2026-12-31',
-                'fecha_ingreso': '2024-01-15',
-                'notas': 'Manipular con precaución - Corrosivo'
-            },
-            {
-                'reactivo': 'Hidróxido de Sodio',
-                'cantidad': 5.0,
-                'unidad': 'kg',
-                'estado': 'disponible',
-                'fecha_vencimiento': '2027-06-30',
-                'fecha_ingreso': '2024-02-20',
-                'notas': 'Almacenar en lugar seco'
-            },
-            {
-                'reactivo': 'Etanol 96%',
-                'cantidad': 10.0,
-                'unidad': 'L',
-                'estado': 'disponible',
-                'fecha_vencimiento': '2025-11-15',
-                'fecha_ingreso': '2024-03-10',
-                'notas': 'Inflamable - Mantener alejado del fuego'
-            },
-            {
-                'reactivo': 'Cloruro de Sodio',
-                'cantidad': 15.0,
-                'unidad': 'kg',
-                'estado': 'disponible',
-                'fecha_vencimiento': '2028-01-31',
-                'fecha_ingreso': '2024-01-05',
-                'notas': 'Grado analítico'
-            },
-            {
-                'reactivo': 'Acetona',
-                'cantidad': 8.0,
-                'unidad': 'L',
-                'estado': 'disponible',
-                'fecha_vencimiento': '2025-10-20',
-                'fecha_ingreso': '2024-04-12',
-                'notas': 'Inflamable - Buena ventilación'
-            }
-        ]
-        
-        try:
-            supabase.table('inventario').insert(datos_ejemplo).execute()
-            self.cargar_datos()
-            st.success("✅ Inventario inicial creado")
-        except Exception as e:
-            st.error(f"Error creando inventario inicial: {e}")
+    st.dataframe(
+        ventana.rename(columns=columnas),
+        use_container_width=True,
+        hide_index=True,
+        column_config=column_config,
+        height=alto
+    )
+    if paginas > 1:
+        st.caption(f"Filas {inicio + 1}–{min(inicio + filas_por_ventana, total)} de {total}")
+
+@st.cache_resource
+def obtener_sistema_compartido():
+    """Instancia única del sistema por proceso, compartida por todas las sesiones,
+    suscrita al feed de cambios del backend"""
+    sistema = SistemaInventarioReactivos(backend=init_backend())
+    sistema.iniciar_cambios()
+    ruta_cola = leer_config_backend().get('cola', RUTA_COLA)
+    if ruta_cola:
+        sistema.iniciar_cola(ruta_cola)
+    return sistema
+
+def inicializar_sistema():
+    """Devuelve el sistema compartido; la sesión solo guarda la versión que ya vio"""
+    sistema = obtener_sistema_compartido()
+    for nivel, mensaje in sistema.tomar_avisos():
+        getattr(st, nivel)(mensaje)
+    version_vista = st.session_state.get('version_vista')
+    if version_vista is not None and version_vista != sistema.version:
+        st.toast("🔄 Inventario actualizado por otra sesión")
+    st.session_state.version_vista = sistema.version
+    return sistema
+
+def marcar_version_propia(sistema):
+    """Evita avisar a la sesión de sus propios cambios tras un registro"""
+    st.session_state.version_vista = sistema.version
+
+@st.fragment(run_every=INTERVALO_AVISO_CAMBIOS)
+def vigilar_cambios(sistema):
+    """Relanza la app solo cuando el feed o la cola cambiaron la caché compartida (sin consultar el backend)"""
+    if st.session_state.get('version_vista') != sistema.version:
+        st.rerun()
+
+PAGINA_DIAGNOSTICO = "🩺 Diagnóstico"
+
+def diagnostico_visible():
+    """La página de diagnóstico no está en el menú salvo con ?diagnostico=1 en la URL"""
+    return st.query_params.get("diagnostico") == "1"
+
+def pagina_diagnostico(sistema):
+    """Tiempos por rerun, por método y por viaje al backend; perfil cProfile y exportación"""
+    st.header("Diagnóstico")
+    if not instrumentacion.activa:
+        st.warning("La instrumentación está desactivada (INVENTARIO_DIAGNOSTICO=0).")
+        return
     
-    def buscar_reactivo(self, termino_busqueda):
-        """Busca reactivos por nombre"""
-        if self.df_inventario is None or self.df_inventario.empty:
-            return pd.DataFrame()
-        
-        if termino_busqueda.strip() == "":
-            return self.df_inventario
-        
-        mascara = self.df_inventario['reactivo'].str.contains(termino_busqueda, case=False, na=False)
-        return self.df_inventario[mascara]
+    # La ejecución en curso todavía no terminó: se muestran las anteriores
+    ejecuciones = list(instrumentacion.ejecuciones)
+    if ejecuciones:
+        ultima = ejecuciones[-1]
+        col1, col2, col3, col4, col5 = st.columns(5)
+        col1.metric("Último rerun", f"{ultima['duracion_ms']:.0f} ms")
+        col2.metric("Viajes al backend", ultima['viajes'])
+        col3.metric("Filas transferidas", ultima['filas'])
+        col4.metric("En backend", f"{ultima['backend_ms']:.0f} ms")
+        col5.metric("Página + Streamlit", f"{ultima['resto_ms']:.0f} ms")
+        st.subheader("Reruns recientes")
+        st.dataframe(pd.DataFrame(ejecuciones[::-1]), use_container_width=True, hide_index=True, height=250)
     
-    def registrar_salida(self, reactivo_id, cantidad, usuario, proyecto_curso, notas=""):
-        """Registra una salida de reactivo"""
-        try:
-            # Obtener reactivo actual
-            response = supabase.table('inventario').select("*").eq('id', reactivo_id).single().execute()
-            reactivo = response.data
-            
-            cantidad_actual = float(reactivo['cantidad'])
-            
-            if cantidad > cantidad_actual:
-                return False, f"Stock insuficiente. Disponible: {cantidad_actual} {reactivo['unidad']}"
-            
-            # Actualizar cantidad
-            nueva_cantidad = cantidad_actual - cantidad
-            nuevo_estado = 'agotado' if nueva_cantidad == 0 else reactivo['estado']
-            
-            supabase.table('inventario').update({
-                'cantidad': nueva_cantidad,
-                'estado': nuevo_estado,
-                'updated_at': datetime.now().isoformat()
-            }).eq('id', reactivo_id).execute()
-            
-            # Registrar en log
-            ahora = datetime.now()
-            supabase.table('log_movimientos').insert({
-                'fecha': ahora.strftime('%Y-%m-%d'),
-                'hora': ahora.strftime('%H:%M:%S'),
-                'tipo_movimiento': 'SALIDA',
-                'reactivo': reactivo['reactivo'],
-                'cantidad': cantidad,
-                'unidad': reactivo['unidad'],
-                'usuario': usuario,
-                'proyecto_curso': proyecto_curso,
-                'notas': notas
-            }).execute()
-            
-            # Recargar datos
-            self.cargar_datos()
-            
-            return True, f"Salida registrada: {cantidad} {reactivo['unidad']} de {reactivo['reactivo']}"
-            
-        except Exception as e:
-            return False, f"Error: {str(e)}"
+    st.subheader("Por método y por viaje")
+    st.dataframe(pd.DataFrame(instrumentacion.resumen()), use_container_width=True, hide_index=True, height=300)
     
-    def registrar_entrada(self, nombre_reactivo, cantidad, usuario, proyecto_curso, 
-                          unidad='L', fecha_vencimiento=None, notas=""):
-        """Registra una entrada de reactivo"""
-        try:
-            # Buscar si el reactivo ya existe
-            response = supabase.table('inventario').select("*").ilike('reactivo', nombre_reactivo).execute()
-            
-            if response.data and len(response.data) > 0:
-                # Reactivo existe, actualizar cantidad
-                reactivo = response.data[0]
-                nueva_cantidad = float(reactivo['cantidad']) + cantidad
-                nuevo_estado = 'disponible' if reactivo['estado'] == 'agotado' else reactivo['estado']
-                
-                update_data = {
-                    'cantidad': nueva_cantidad,
-                    'estado': nuevo_estado,
-                    'updated_at': datetime.now().isoformat()
-                }
-                
-                if fecha_vencimiento:
-                    update_data['fecha_vencimiento'] = fecha_vencimiento
-                
-                supabase.table('inventario').update(update_data).eq('id', reactivo['id']).execute()
-                
-                mensaje = f"Entrada registrada: +{cantidad} {reactivo['unidad']}. Nuevo stock: {nueva_cantidad} {reactivo['unidad']}"
-                unidad_usada = reactivo['unidad']
-            else:
-                # Reactivo nuevo
-                if not fecha_vencimiento:
-                    fecha_vencimiento = (datetime.now() + timedelta(days=365)).strftime('%Y-%m-%d')
-                
-                supabase.table('inventario').insert({
-                    'reactivo': nombre_reactivo,
-                    'cantidad': cantidad,
-                    'unidad': unidad,
-                    'estado': 'disponible',
-                    'fecha_vencimiento': fecha_vencimiento,
-                    'fecha_ingreso': datetime.now().strftime('%Y-%m-%d'),
-                    'notas': notas
-                }).execute()
-                
-                mensaje = f"Nuevo reactivo agregado: {cantidad} {unidad} de {nombre_reactivo}"
-                unidad_usada = unidad
-            
-            # Registrar en log
-            ahora = datetime.now()
-            supabase.table('log_movimientos').insert({
-                'fecha': ahora.strftime('%Y-%m-%d'),
-                'hora': ahora.strftime('%H:%M:%S'),
-                'tipo_movimiento': 'ENTRADA',
-                'reactivo': nombre_reactivo,
-                'cantidad': cantidad,
-                'unidad': unidad_usada,
-                'usuario': usuario,
-                'proyecto_curso': proyecto_curso,
-                'notas': notas
-            }).execute()
-            
-            # Recargar datos
-            self.cargar_datos()
-            
-            return True, mensaje
-            
-        except Exception as e:
-            return False, f"Error: {str(e)}"
+    st.subheader("Memoria por tabla")
+    for tabla, reporte in sistema.memoria().items():
+        st.caption(f"{tabla}: {reporte['bytes'].iloc[-1] / 1024:.1f} KiB")
+        st.dataframe(reporte, use_container_width=True, hide_index=True)
     
-    def verificar_vencimientos(self, dias_alerta=30):
-        """Verifica reactivos vencidos y próximos a vencer"""
-        if self.df_inventario is None or self.df_inventario.empty:
-            return {'vencidos': pd.DataFrame(), 'proximos_vencer': pd.DataFrame()}
-        
-        try:
-            hoy = datetime.now()
-            fecha_limite = hoy + timedelta(days=dias_alerta)
-            
-            self.df_inventario['fecha_vencimiento'] = pd.to_datetime(
-                self.df_inventario['fecha_vencimiento'], 
-                errors='coerce'
-            )
-            
-            vencidos = self.df_inventario[self.df_inventario['fecha_vencimiento'] < hoy]
-            proximos_vencer = self.df_inventario[
-                (self.df_inventario['fecha_vencimiento'] >= hoy) &
-                (self.df_inventario['fecha_vencimiento'] <= fecha_limite)
-            ]
-            
-            return {'vencidos': vencidos, 'proximos_vencer': proximos_vencer}
-        except:
-            return {'vencidos': pd.DataFrame(), 'proximos_vencer': pd.DataFrame()}
+    st.subheader("Perfil (cProfile)")
+    if st.button("⏱️ Perfilar el próximo rerun"):
+        st.session_state.perfilar_proxima = True
+        st.rerun()
+    if instrumentacion.ultimo_perfil:
+        st.caption(f"Capturado {instrumentacion.ultimo_perfil['fecha']}")
+        st.code(instrumentacion.ultimo_perfil['informe'], language=None)
     
-    def generar_reporte_stock(self):
-        """Genera reporte del estado del inventario"""
-        if self.df_inventario is None or self.df_inventario.empty:
-            return {
-                'total': 0, 'disponibles': 0, 'en_uso': 0, 
-                'vencidos': 0, 'proximos_vencer': 0,
-                'vencimientos': {'vencidos': pd.DataFrame(), 'proximos_vencer': pd.DataFrame()}
-            }
-        
-        total_reactivos = len(self.df_inventario)
-        disponibles = len(self.df_inventario[self.df_inventario['estado'] == 'disponible'])
-        en_uso = len(self.df_inventario[self.df_inventario['estado'] == 'en uso'])
-        vencimientos = self.verificar_vencimientos()
-        
-        return {
-            'total': total_reactivos,
-            'disponibles': disponibles,
-            'en_uso': en_uso,
-            'vencidos': len(vencimientos['vencidos']),
-            'proximos_vencer': len(vencimientos['proximos_vencer']),
-            'vencimientos': vencimientos
-        }
-
-# ============================================================================
-# INTERFAZ STREAMLIT
-# ============================================================================
-
-def inicializar_sistema():
-    if 'sistema' not in st.session_state:
-        st.session_state.sistema = SistemaInventarioReactivos()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button("⬇️ Exportar JSON", json.dumps(instrumentacion.exportar_json(), default=str),
+                           file_name="diagnostico.json", mime="application/json", use_container_width=True)
+    with col2:
+        st.download_button("⬇️ Exportar OpenTelemetry", json.dumps(instrumentacion.exportar_otel()),
+                           file_name="trazas_otlp.json", mime="application/json", use_container_width=True)
+    with col3:
+        if st.button("🗑️ Reiniciar mediciones", use_container_width=True):
+            instrumentacion.reiniciar()
+            st.rerun()
 
 def main():
-    inicializar_sistema()
-    sistema = st.session_state.sistema
+    """Un rerun de la app, medido; bajo cProfile si se pidió desde Diagnóstico"""
+    perfilar = st.session_state.pop('perfilar_proxima', False)
+    with instrumentacion.ejecucion('rerun'), \
+            (instrumentacion.perfilar() if perfilar else contextlib.nullcontext()):
+        mostrar_app()
+    if perfilar:
+        # El informe recién existe al terminar el rerun perfilado: uno más para mostrarlo
+        st.rerun()
+
+def mostrar_app():
+    sistema = inicializar_sistema()
+    if sistema.cambios_en_vivo or sistema.cola is not None:
+        vigilar_cambios(sistema)
 
     st.title("🧪 Sistema de Inventario de Reactivos Químicos")
-    st.success("✅ Conectado a Supabase - Guardado automático")
+    st.success(f"✅ Conectado a {sistema.backend.nombre} - Guardado automático")
     st.markdown("---")
 
-    menu = st.sidebar.radio(
-        "Navegación",
-        ["📦 Inventario", "➕ Nueva Entrada", "➖ Registrar Salida", 
-         "📋 Movimientos", "⚠️ Alertas", "📊 Reportes"]
-    )
+    paginas = ["📦 Inventario", "➕ Nueva Entrada", "➖ Registrar Salida", 
+               "📋 Movimientos", "⚠️ Alertas", "📊 Reportes", "📥 Importar/Exportar"]
+    if diagnostico_visible():
+        paginas.append(PAGINA_DIAGNOSTICO)
+    menu = st.sidebar.radio("Navegación", paginas)
+    instrumentacion.anotar(pagina=menu)
+    
+    if sistema.cola is not None:
+        pendientes = sistema.cola.pendientes()
+        if pendientes:
+            st.sidebar.caption(f"⏳ {pendientes} movimiento(s) pendiente(s) de confirmar")
+        else:
+            st.sidebar.caption("✅ Todos los movimientos confirmados")
+        if sistema.cola.ultimo_error:
+            st.sidebar.warning(f"Sin conexión con {sistema.backend.nombre}; se reintenta solo. "
+                               f"Último error: {sistema.cola.ultimo_error}")
 
     if menu == "📦 Inventario":
         st.header("Inventario de Reactivos")
         
-        col1, col2 = st.columns([3, 1])
+        col1, col2, col3 = st.columns([3, 1, 1])
         with col1:
-            busqueda = st.text_input("🔍 Buscar reactivo por nombre:", "")
+            busqueda = st.text_input("🔍 Buscar reactivo por nombre o CAS:", "")
         with col2:
-            if st.button("🔄 Recargar", use_container_width=True):
+            # Con el feed activo los cambios llegan solos; recargar queda como respaldo
+            if sistema.cambios_en_vivo:
+                st.caption("🟢 Cambios en vivo")
+            elif st.button("🔄 Recargar", use_container_width=True):
                 sistema.cargar_datos()
+                marcar_version_propia(sistema)
+                st.rerun()
+        with col3:
+            if st.button("♻️ Resincronizar todo", use_container_width=True):
+                sistema.cargar_datos(completo=True)
+                marcar_version_propia(sistema)
                 st.rerun()
         
         if sistema.df_inventario is not None and not sistema.df_inventario.empty:
-            df_mostrar = sistema.buscar_reactivo(busqueda)
+            df_mostrar = sistema.buscar_reactivo(busqueda, limite=LIMITE_BUSQUEDA)
+            if busqueda.strip() and len(df_mostrar) >= LIMITE_BUSQUEDA:
+                st.caption(f"Se muestran los {LIMITE_BUSQUEDA} resultados más relevantes; "
+                           "refine la búsqueda para ver otros.")
             
             if len(df_mostrar) > 0:
-                # Renombrar columnas para mostrar
-                df_display = df_mostrar.copy()
-                df_display = df_display.rename(columns={
-                    'reactivo': 'Reactivo',
-                    'cantidad': 'Cantidad',
-                    'unidad': 'Unidad',
-                    'estado': 'Estado',
-                    'fecha_vencimiento': 'Fecha Vencimiento',
-                    'fecha_ingreso': 'Fecha Ingreso',
-                    'notas': 'Notas'
-                })
-                
-                def colorear_estado(val):
-                    if val == 'disponible': return 'background-color: #d5f4e6'
-                    elif val == 'en uso': return 'background-color: #fff3cd'
-                    elif val == 'agotado': return 'background-color: #fadbd8'
-                    return ''
-                
-                columnas_mostrar = ['Reactivo', 'Cantidad', 'Unidad', 'Estado', 
-                                   'Fecha Vencimiento', 'Fecha Ingreso', 'Notas']
-                
-                st.dataframe(
-                    df_display[columnas_mostrar].style.applymap(colorear_estado, subset=['Estado']), 
-                    use_container_width=True, 
-                    height=400
+                mostrar_ventana(
+                    df_mostrar,
+                    {
+                        'reactivo': 'Reactivo',
+                        'cantidad': 'Cantidad',
+                        'unidad': 'Unidad',
+                        'estado': 'Estado',
+                        'fecha_vencimiento': 'Fecha Vencimiento',
+                        'fecha_ingreso': 'Fecha Ingreso',
+                        'notas': 'Notas'
+                    },
+                    clave="ventana_inventario",
+                    etiquetas={'estado': ETIQUETAS_ESTADO},
+                    column_config={
+                        'Cantidad': st.column_config.NumberColumn(format="%.2f"),
+                        'Fecha Vencimiento': st.column_config.DateColumn(format="YYYY-MM-DD"),
+                        'Fecha Ingreso': st.column_config.DateColumn(format="YYYY-MM-DD")
+                    },
+                    alto=400
                 )
             else:
                 st.warning("No se encontraron reactivos.")
@@ -362,12 +283,13 @@ def main():
             with col1:
                 nombre = st.text_input("Nombre del Reactivo *")
                 cantidad = st.number_input("Cantidad *", min_value=0.0, step=0.1, format="%.2f")
-                unidad = st.selectbox("Unidad", ["L", "kg", "g", "mL"])
+                unidad = st.selectbox("Unidad", UNIDADES)
                 usuario = st.text_input("Usuario *")
             with col2:
                 proyecto = st.text_input("Proyecto/Curso *")
                 fecha_venc = st.date_input("Fecha de Vencimiento", 
                                           value=datetime.now() + timedelta(days=365))
+                proveedor = st.text_input("Proveedor")
                 notas = st.text_area("Notas", height=100)
             
             submitted = st.form_submit_button("✅ Registrar Entrada", use_container_width=True)
@@ -378,13 +300,16 @@ def main():
                 elif cantidad <= 0:
                     st.error("La cantidad debe ser mayor a 0")
                 else:
-                    exito, mensaje = sistema.registrar_entrada(
+                    # Con cola el formulario no espera al backend
+                    registrar = sistema.encolar_entrada if sistema.cola is not None else sistema.registrar_entrada
+                    exito, mensaje = registrar(
                         nombre, cantidad, usuario, proyecto, unidad, 
-                        fecha_venc.strftime('%Y-%m-%d'), notas
+                        fecha_venc.strftime('%Y-%m-%d'), notas, proveedor=proveedor
                     )
                     if exito:
                         st.success(mensaje)
                         st.balloons()
+                        marcar_version_propia(sistema)
                         st.rerun()
                     else:
                         st.error(mensaje)
@@ -396,20 +321,34 @@ def main():
             with st.form("form_salida"):
                 col1, col2 = st.columns(2)
                 with col1:
-                    # Crear diccionario de reactivos con ID
-                    reactivos_dict = {
-                        f"{row['reactivo']} ({row['cantidad']:.2f} {row['unidad']})": row['id']
-                        for _, row in sistema.df_inventario.iterrows()
-                    }
-                    
-                    nombre_sel = st.selectbox("Seleccione el Reactivo *", list(reactivos_dict.keys()))
-                    reactivo_id = reactivos_dict[nombre_sel]
+                    # El selector guarda el id; las etiquetas se calculan una vez por versión
+                    opciones = sistema.opciones_reactivos()
+                    reactivo_id = st.selectbox("Seleccione el Reactivo *", list(opciones),
+                                               format_func=opciones.get)
                     
-                    if nombre_sel:
-                        info = sistema.df_inventario[sistema.df_inventario['id'] == reactivo_id].iloc[0]
-                        st.info(f"Stock disponible: {info['cantidad']:.2f} {info['unidad']}")
+                    info = sistema.obtener_reactivo(reactivo_id)
+                    if info is not None:
+                        st.info(f"Stock disponible: {float(info['cantidad']):.2f} {info['unidad']}")
+                        with st.expander("Lotes (se retira primero el que vence antes)"):
+                            st.dataframe(
+                                sistema.lotes_reactivo(reactivo_id)[
+                                    ['id', 'cantidad', 'unidad', 'fecha_vencimiento', 'fecha_ingreso', 'proveedor']
+                                ].rename(columns={
+                                    'id': 'Lote',
+                                    'cantidad': 'Cantidad',
+                                    'unidad': 'Unidad',
+                                    'fecha_vencimiento': 'Vencimiento',
+                                    'fecha_ingreso': 'Ingreso',
+                                    'proveedor': 'Proveedor'
+                                }),
+                                hide_index=True,
+                                use_container_width=True
+                            )
                     
                     cantidad = st.number_input("Cantidad a retirar *", min_value=0.0, step=0.1, format="%.2f")
+                    # Se puede retirar en otra unidad de la misma dimensión (mL de un stock en L)
+                    unidad = st.selectbox("Unidad", unidades_compatibles(info['unidad']) if info is not None
+                                          else UNIDADES)
                 
                 with col2:
                     usuario = st.text_input("Usuario que solicita *")
@@ -424,11 +363,13 @@ def main():
                     elif cantidad <= 0:
                         st.error("La cantidad debe ser mayor a 0")
                     else:
-                        exito, mensaje = sistema.registrar_salida(
-                            reactivo_id, cantidad, usuario, proyecto, notas
+                        registrar = sistema.encolar_salida if sistema.cola is not None else sistema.registrar_salida
+                        exito, mensaje = registrar(
+                            reactivo_id, cantidad, usuario, proyecto, notas, unidad=unidad
                         )
                         if exito:
                             st.success(mensaje)
+                            marcar_version_propia(sistema)
                             st.rerun()
                         else:
                             st.error(mensaje)
@@ -437,59 +378,126 @@ def main():
 
     elif menu == "📋 Movimientos":
         st.header("Historial de Movimientos")
-        if sistema.df_log is not None and len(sistema.df_log) > 0:
-            df_movimientos = sistema.df_log.copy()
-            
-            # Renombrar columnas
-            df_movimientos = df_movimientos.rename(columns={
-                'fecha': 'Fecha',
-                'hora': 'Hora',
-                'tipo_movimiento': 'Tipo',
-                'reactivo': 'Reactivo',
-                'cantidad': 'Cantidad',
-                'unidad': 'Unidad',
-                'usuario': 'Usuario',
-                'proyecto_curso': 'Proyecto/Curso',
-                'notas': 'Notas'
-            })
-            
-            def colorear_tipo(val):
-                if val == 'ENTRADA': return 'background-color: #d5f4e6'
-                elif val == 'SALIDA': return 'background-color: #fadbd8'
-                return ''
-            
-            columnas_mostrar = ['Fecha', 'Hora', 'Tipo', 'Reactivo', 'Cantidad', 
-                               'Unidad', 'Usuario', 'Proyecto/Curso', 'Notas']
-            
-            st.dataframe(
-                df_movimientos[columnas_mostrar].head(100).style.applymap(
-                    colorear_tipo, subset=['Tipo']
-                ), 
-                use_container_width=True, 
-                height=500
+        
+        if sistema.cola is not None:
+            with st.expander(f"🕒 Cola local ({sistema.cola.pendientes()} pendiente(s))", expanded=False):
+                df_cola = sistema.cola_reciente()
+                if len(df_cola) > 0:
+                    mostrar_ventana(
+                        df_cola,
+                        {
+                            'estado': 'Estado',
+                            'tipo': 'Tipo',
+                            'reactivo': 'Reactivo',
+                            'cantidad': 'Cantidad',
+                            'unidad': 'Unidad',
+                            'usuario': 'Usuario',
+                            'creado': 'Encolado',
+                            'intentos': 'Intentos',
+                            'error': 'Detalle'
+                        },
+                        clave="ventana_cola",
+                        etiquetas={'estado': ETIQUETAS_COLA, 'tipo': ETIQUETAS_TIPO},
+                        alto=250
+                    )
+                else:
+                    st.caption("Sin movimientos encolados")
+        
+        with st.expander("🔎 Filtros", expanded=False):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                rango = st.date_input("Rango de fechas", value=(), key="hist_rango")
+                tipo = st.selectbox("Tipo", ["Todos", "ENTRADA", "SALIDA"], key="hist_tipo")
+            with col2:
+                filtro_reactivo = st.text_input("Reactivo contiene", key="hist_reactivo")
+                filtro_usuario = st.text_input("Usuario contiene", key="hist_usuario")
+            with col3:
+                filtro_proyecto = st.text_input("Proyecto/Curso contiene", key="hist_proyecto")
+        
+        filtros = {
+            'fecha_desde': rango[0].strftime('%Y-%m-%d') if len(rango) > 0 else None,
+            'fecha_hasta': rango[1].strftime('%Y-%m-%d') if len(rango) > 1 else None,
+            'tipo_movimiento': None if tipo == "Todos" else tipo,
+            'reactivo': filtro_reactivo.strip(),
+            'usuario': filtro_usuario.strip(),
+            'proyecto_curso': filtro_proyecto.strip()
+        }
+        
+        # La sesión solo guarda los cursores de las páginas ya visitadas;
+        # al cambiar los filtros se vuelve a la primera página
+        if st.session_state.get('hist_filtros') != filtros:
+            st.session_state.hist_filtros = filtros
+            st.session_state.hist_cursores = [None]
+        cursores = st.session_state.hist_cursores
+        
+        df_pagina, cursor_siguiente = sistema.historial_movimientos(antes_de_id=cursores[-1], **filtros)
+        
+        if len(df_pagina) > 0:
+            # La página ya viene acotada desde el servidor: se muestra completa
+            mostrar_ventana(
+                df_pagina,
+                {
+                    'fecha': 'Fecha',
+                    'tipo_movimiento': 'Tipo',
+                    'reactivo': 'Reactivo',
+                    'cantidad': 'Cantidad',
+                    'unidad': 'Unidad',
+                    'usuario': 'Usuario',
+                    'proyecto_curso': 'Proyecto/Curso',
+                    'notas': 'Notas'
+                },
+                clave="ventana_movimientos",
+                etiquetas={'tipo_movimiento': ETIQUETAS_TIPO},
+                column_config={'Fecha': st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm:ss")},
+                filas_por_ventana=TAMANO_PAGINA_HISTORIAL,
+                alto=500
             )
-        else:
+        elif len(cursores) == 1:
             st.info("No hay movimientos registrados todavía")
+        
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("⬅️ Anterior", disabled=len(cursores) == 1, use_container_width=True):
+                cursores.pop()
+                st.rerun()
+        with col2:
+            st.caption(f"Página {len(cursores)}")
+        with col3:
+            if st.button("Siguiente ➡️", disabled=cursor_siguiente is None, use_container_width=True):
+                cursores.append(cursor_siguiente)
+                st.rerun()
 
     elif menu == "⚠️ Alertas":
         st.header("Alertas y Advertencias")
-        vencimientos = sistema.verificar_vencimientos(dias_alerta=30)
+        dias_alerta = st.selectbox("Horizonte de vencimiento (días)", HORIZONTES_VENCIMIENTO, index=1)
+        
+        resumen = sistema.resumen_vencimientos()
+        columnas = st.columns(len(resumen))
+        columnas[0].metric("Vencidos", resumen['vencidos'])
+        for columna, horizonte in zip(columnas[1:], HORIZONTES_VENCIMIENTO):
+            columna.metric(f"Vencen en ≤ {horizonte} días", resumen[horizonte])
+        
+        vencimientos = sistema.verificar_vencimientos(dias_alerta=dias_alerta)
         
         if len(vencimientos['vencidos']) > 0:
             st.error(f"🔴 REACTIVOS VENCIDOS: {len(vencimientos['vencidos'])}")
-            df_vencidos = vencimientos['vencidos'][['reactivo', 'cantidad', 'unidad', 'fecha_vencimiento']].rename(columns={
+            df_vencidos = vencimientos['vencidos'][['reactivo', 'cantidad_vencida', 'cantidad', 'unidad',
+                                                     'fecha_vencimiento']].rename(columns={
                 'reactivo': 'Reactivo',
-                'cantidad': 'Cantidad',
+                'cantidad_vencida': 'Vencido',
+                'cantidad': 'Stock total',
                 'unidad': 'Unidad',
                 'fecha_vencimiento': 'Fecha Vencimiento'
             })
             st.dataframe(df_vencidos, use_container_width=True)
         
         if len(vencimientos['proximos_vencer']) > 0:
-            st.warning(f"🟡 PRÓXIMOS A VENCER (30 días): {len(vencimientos['proximos_vencer'])}")
-            df_proximos = vencimientos['proximos_vencer'][['reactivo', 'cantidad', 'unidad', 'fecha_vencimiento']].rename(columns={
+            st.warning(f"🟡 PRÓXIMOS A VENCER ({dias_alerta} días): {len(vencimientos['proximos_vencer'])}")
+            df_proximos = vencimientos['proximos_vencer'][['reactivo', 'cantidad_por_vencer', 'cantidad', 'unidad',
+                                                            'fecha_vencimiento']].rename(columns={
                 'reactivo': 'Reactivo',
-                'cantidad': 'Cantidad',
+                'cantidad_por_vencer': 'Por vencer',
+                'cantidad': 'Stock total',
                 'unidad': 'Unidad',
                 'fecha_vencimiento': 'Fecha Vencimiento'
             })
@@ -513,13 +521,114 @@ def main():
 
     elif menu == "📊 Reportes":
         st.header("Reportes del Sistema")
-        if st.button("🔄 Generar Reporte", use_container_width=True):
-            reporte = sistema.generar_reporte_stock()
-            col1, col2, col3, col4 = st.columns(4)
-            col1.metric("Total Reactivos", reporte['total'])
-            col2.metric("Disponibles", reporte['disponibles'])
-            col3.metric("En Uso", reporte['en_uso'])
-            col4.metric("Vencidos", reporte['vencidos'], delta_color="inverse")
+        reporte = sistema.generar_reporte_stock()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Total Reactivos", reporte['total'])
+        col2.metric("Disponibles", reporte['disponibles'])
+        col3.metric("En Uso", reporte['en_uso'])
+        col4.metric("Vencidos", reporte['vencidos'], delta_color="inverse")
+        
+        consumo = reporte['consumo']
+        if consumo is not None:
+            st.subheader("Días de stock y pérdida por vencimiento")
+            st.caption("Ritmo de consumo estimado con las salidas de los últimos 90 días")
+            st.dataframe(consumo['proyeccion'].drop(columns=['id']).rename(columns={
+                'reactivo': 'Reactivo',
+                'cantidad': 'Stock',
+                'unidad': 'Unidad',
+                'fecha_vencimiento': 'Fecha Vencimiento',
+                'consumo_diario': 'Consumo/día',
+                'dias_restantes': 'Días restantes',
+                'perdida_vencimiento': 'Vencerá sin usar'
+            }), use_container_width=True)
+            
+            tab1, tab2, tab3, tab4, tab5 = st.tabs(["Por reactivo", "Por usuario", "Por proyecto", "Mensual",
+                                                    "Histórico"])
+            with tab1:
+                st.dataframe(consumo['por_reactivo'], use_container_width=True)
+            with tab2:
+                st.markdown("**Principales consumidores**")
+                st.dataframe(consumo['top_consumidores'], use_container_width=True)
+                st.dataframe(consumo['por_usuario'], use_container_width=True)
+            with tab3:
+                st.dataframe(consumo['por_proyecto'], use_container_width=True)
+            with tab4:
+                st.dataframe(consumo['mensual'], use_container_width=True)
+            with tab5:
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    rango = st.date_input("Rango", value=(), key="historico_rango")
+                with col2:
+                    frecuencia = st.selectbox("Frecuencia", list(resumenes.FRECUENCIAS), index=2,
+                                              format_func=resumenes.FRECUENCIAS.get)
+                with col3:
+                    por = st.selectbox("Agrupar por", ["reactivo", "usuario"])
+                df_historico = sistema.consumo_historico(
+                    rango[0].strftime('%Y-%m-%d') if len(rango) > 0 else None,
+                    rango[1].strftime('%Y-%m-%d') if len(rango) > 1 else None,
+                    frecuencia, por
+                )
+                if len(df_historico) > 0:
+                    st.line_chart(df_historico.groupby('periodo')[['entradas', 'salidas']].sum())
+                    st.dataframe(df_historico, use_container_width=True)
+                else:
+                    st.info("Sin movimientos en el rango seleccionado")
+
+    elif menu == PAGINA_DIAGNOSTICO:
+        pagina_diagnostico(sistema)
+
+    elif menu == "📥 Importar/Exportar":
+        st.header("Importación y Exportación Masiva")
+        
+        st.subheader("Importar entradas")
+        st.caption("CSV o Parquet con columnas reactivo, cantidad y opcionalmente unidad, "
+                   "fecha_vencimiento, usuario, proyecto_curso, notas, proveedor")
+        archivo = st.file_uploader("Archivo", type=["csv", "parquet"])
+        col1, col2 = st.columns(2)
+        with col1:
+            usuario = st.text_input("Usuario por defecto")
+        with col2:
+            proyecto = st.text_input("Proyecto/Curso por defecto")
+        
+        if archivo is not None:
+            try:
+                df_validas, df_errores = importacion.validar_entradas(
+                    importacion.leer_archivo(archivo), usuario.strip(), proyecto.strip(),
+                    inventario=sistema.df_inventario
+                )
+            except Exception as e:
+                st.error(f"No se pudo leer el archivo: {e}")
+            else:
+                st.info(f"Filas válidas: {len(df_validas)} — con errores: {len(df_errores)}")
+                if len(df_errores) > 0:
+                    st.dataframe(df_errores, use_container_width=True)
+                if len(df_validas) > 0 and st.button("✅ Importar filas válidas", use_container_width=True):
+                    progreso = st.progress(0.0)
+                    exito, mensaje = sistema.importar_entradas(
+                        df_validas, al_avanzar=lambda hechas, total: progreso.progress(hechas / total)
+                    )
+                    # También si falló: los lotes anteriores ya están en la caché
+                    marcar_version_propia(sistema)
+                    if exito:
+                        st.success(mensaje)
+                    else:
+                        st.error(mensaje)
+        
+        st.subheader("Exportar")
+        formato = st.radio("Formato", ["csv", "parquet"], horizontal=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Preparar inventario", use_container_width=True):
+                buffer = io.BytesIO()
+                importacion.exportar_inventario(sistema.backend, buffer, formato)
+                st.download_button("⬇️ Descargar inventario", buffer.getvalue(),
+                                   file_name=f"inventario.{formato}", use_container_width=True)
+        with col2:
+            if st.button("Preparar historial", use_container_width=True):
+                buffer = io.BytesIO()
+                importacion.exportar_movimientos(sistema.backend, buffer, formato)
+                st.download_button("⬇️ Descargar historial", buffer.getvalue(),
+                                   file_name=f"movimientos.{formato}", use_container_width=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,231 @@
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from busqueda import normalizar
+from esquema import ESQUEMA_LOG, concatenar, construir, vacio
+from unidades import a_micro_serie, a_unidad_base
+
+# Días de historia de salidas que se mantienen para los reportes
+VENTANA_REPORTES_DIAS = 365
+
+# Días recientes con los que se estima el ritmo de consumo (burn rate)
+DIAS_RITMO_CONSUMO = 90
+
+# Filas por página al traer salidas del backend
+TAMANO_PAGINA_REPORTES = 5000
+
+# Ids por debajo de la marca que se vuelven a pedir (salidas confirmadas tarde,
+# como en la sincronización del sistema); las que ya estaban se descartan
+VENTANA_IDS_REPORTES = 50
+
+COLUMNAS_CONSUMO = ['id', 'fecha', 'reactivo', 'cantidad', 'unidad', 'usuario', 'proyecto_curso']
+
+# Relectura hacia atrás al sincronizar lotes por updated_at (como la del inventario
+# en sistema.py): un lote modificado por una transacción que confirmó tarde
+VENTANA_LOTES = timedelta(seconds=60)
+
+COLUMNAS_LOTES = ['reactivo_id', 'cantidad_base', 'fecha_vencimiento']
+
+def _consumos_vacios():
+    """Frame de salidas vacío pero con los tipos de columna definitivos"""
+    return vacio(ESQUEMA_LOG)[COLUMNAS_CONSUMO]
+
+# ============================================================================
+# MOTOR DE REPORTES
+# ============================================================================
+
+class MotorReportes:
+    """Reportes de consumo sobre las salidas de log_movimientos
+
+    Mantiene en memoria las salidas de la ventana configurada y las completa
+    de forma incremental (solo ids nuevos); los lotes con stock, igual, por
+    updated_at. Los resultados se memorizan por versión de datos y día:
+    repetir la vista no recalcula nada.
+    """
+
+    def __init__(self, backend, ventana_dias=VENTANA_REPORTES_DIAS):
+        self.backend = backend
+        self.ventana_dias = ventana_dias
+        self._lock = threading.Lock()
+        self._consumos = _consumos_vacios()
+        self._marca_id = None
+        self._lotes = {}
+        self._marca_lotes = None
+        self._memo_clave = None
+        self._memo = None
+
+    def invalidar(self):
+        """Olvida salidas, lotes y resultados (p. ej. tras una resincronización completa)"""
+        with self._lock:
+            self._consumos = _consumos_vacios()
+            self._marca_id = None
+            self._lotes = {}
+            self._marca_lotes = None
+            self._memo_clave = None
+            self._memo = None
+
+    def _sincronizar(self):
+        """Trae por páginas (más recientes primero) solo las salidas con id > marca"""
+        filtros = {
+            'tipo_movimiento': 'SALIDA',
+            'fecha_desde': (datetime.now() - timedelta(days=self.ventana_dias)).strftime('%Y-%m-%d')
+        }
+        desde_id, ya_vistos = None, set()
+        if self._marca_id is not None:
+            desde_id = max(self._marca_id - VENTANA_IDS_REPORTES, 0)
+            ya_vistos = set(self._consumos.loc[self._consumos['id'] > desde_id, 'id'].tolist())
+        paginas, cursor = [], None
+        while True:
+            filas = self.backend.paginar_movimientos(antes_de_id=cursor, limite=TAMANO_PAGINA_REPORTES,
+                                                     filtros=filtros, desde_id=desde_id)
+            if not filas:
+                break
+            cursor = filas[-1]['id']
+            nuevas = [fila for fila in filas if fila['id'] not in ya_vistos]
+            if nuevas:
+                paginas.append(construir(nuevas, ESQUEMA_LOG)[COLUMNAS_CONSUMO])
+            if len(filas) < TAMANO_PAGINA_REPORTES:
+                break
+
+        if paginas:
+            # Mismo esquema en cada página: la unión de categorías evita deriva a object
+            nuevos = concatenar(paginas, ignore_index=True)
+            nuevos['cantidad'] = nuevos['cantidad'].fillna(0.0)
+            self._consumos = concatenar([self._consumos, nuevos], ignore_index=True)
+            self._marca_id = int(self._consumos['id'].max())
+        elif self._marca_id is None:
+            self._marca_id = 0
+
+        # Descartar lo que quedó fuera de la ventana
+        inicio = pd.Timestamp(datetime.now() - timedelta(days=self.ventana_dias)).normalize()
+        self._consumos = self._consumos[self._consumos['fecha'] >= inicio]
+
+    def _sincronizar_lotes(self):
+        """Lotes con stock: la primera vez todos, después solo los tocados desde la marca.
+
+        Lo incremental incluye lotes sin stock, para sacar de memoria los que se agotaron.
+        """
+        if self._marca_lotes is None:
+            filas = self.backend.listar_lotes(con_stock=True)
+        else:
+            desde = datetime.fromisoformat(self._marca_lotes) - VENTANA_LOTES
+            filas = self.backend.listar_lotes(con_stock=False, desde_updated_at=desde.isoformat())
+        for fila in filas:
+            if fila['cantidad_base'] > 0:
+                self._lotes[fila['id']] = {columna: fila[columna] for columna in COLUMNAS_LOTES}
+            else:
+                self._lotes.pop(fila['id'], None)
+            if fila.get('updated_at') and (self._marca_lotes is None or fila['updated_at'] > self._marca_lotes):
+                self._marca_lotes = fila['updated_at']
+
+    def generar(self, df_inventario, version, top=10):
+        """Reportes de consumo; se recalculan solo si cambió la versión o el día"""
+        clave = (version, datetime.now().date(), top)
+        with self._lock:
+            if self._memo_clave == clave:
+                return self._memo
+            self._sincronizar()
+            self._sincronizar_lotes()
+            self._memo = calcular_reportes(self._consumos, df_inventario, top=top,
+                                           lotes=list(self._lotes.values()))
+            self._memo_clave = clave
+            return self._memo
+
+# ============================================================================
+# CÁLCULOS VECTORIZADOS
+# ============================================================================
+
+def calcular_reportes(consumos, df_inventario, top=10, hoy=None, lotes=None):
+    """Agrupaciones de consumo, días de stock restantes y pérdida estimada por vencimiento"""
+    hoy = pd.Timestamp(hoy or datetime.now()).normalize()
+    consumos = consumos.copy()
+    consumos['cantidad'] = consumos['cantidad'].astype(float)
+    # Varios reactivos por grupo: se suman en la unidad base (mL/g), no L con mL
+    en_base = a_unidad_base(consumos)
+
+    por_reactivo = (consumos.groupby(['reactivo', 'unidad'], observed=True)['cantidad']
+                    .agg(total='sum', salidas='count').reset_index()
+                    .sort_values('total', ascending=False, ignore_index=True))
+    por_usuario = (en_base.groupby(['usuario', 'unidad'], observed=True)['cantidad']
+                   .agg(total='sum', salidas='count').reset_index()
+                   .sort_values('salidas', ascending=False, ignore_index=True))
+    por_proyecto = (en_base.groupby(['proyecto_curso', 'unidad'], observed=True)['cantidad']
+                    .agg(total='sum', salidas='count').reset_index()
+                    .sort_values('salidas', ascending=False, ignore_index=True))
+    mensual = (consumos.assign(mes=consumos['fecha'].dt.to_period('M').astype(str))
+               .groupby(['mes', 'reactivo', 'unidad'], observed=True)['cantidad'].sum()
+               .reset_index().sort_values(['mes', 'cantidad'], ascending=[True, False], ignore_index=True))
+
+    top_consumidores = (consumos.groupby('usuario', observed=True)
+                        .agg(salidas=('id', 'count'), reactivos=('reactivo', 'nunique'))
+                        .sort_values('salidas', ascending=False).head(top).reset_index())
+
+    return {
+        'por_reactivo': por_reactivo,
+        'por_usuario': por_usuario,
+        'por_proyecto': por_proyecto,
+        'mensual': mensual,
+        'top_consumidores': top_consumidores,
+        'proyeccion': proyeccion_stock(consumos, df_inventario, hoy, lotes)
+    }
+
+def proyeccion_stock(consumos, df_inventario, hoy, lotes=None):
+    """Ritmo diario, días de stock restantes y stock que vencerá sin usarse, por reactivo
+
+    `lotes` son los lotes con stock (reactivo_id, cantidad_base,
+    fecha_vencimiento); sin ellos cada reactivo cuenta como un solo lote con
+    su vencimiento.
+    """
+    columnas = ['id', 'reactivo', 'cantidad', 'unidad', 'fecha_vencimiento', 'consumo_diario',
+                'dias_restantes', 'perdida_vencimiento']
+    if df_inventario is None or df_inventario.empty:
+        return pd.DataFrame(columns=columnas)
+
+    desde = hoy - pd.Timedelta(days=DIAS_RITMO_CONSUMO)
+    recientes = consumos[consumos['fecha'] >= desde]
+    # El log guarda el nombre, no el id: se cruza por nombre normalizado.
+    # El ritmo se mide en micro-unidades base por si hay salidas en otra unidad.
+    ritmo = (recientes.assign(clave=recientes['reactivo'].map(normalizar),
+                              micro=a_micro_serie(recientes['cantidad'], recientes['unidad']))
+             .groupby('clave', observed=True)['micro'].sum() / DIAS_RITMO_CONSUMO)
+
+    df = df_inventario[['id', 'reactivo', 'cantidad', 'unidad', 'fecha_vencimiento']].copy()
+    df['cantidad'] = df['cantidad'].astype(float)
+    micro_por_unidad = a_micro_serie(np.ones(len(df)), df['unidad'])
+    ritmo_micro = pd.Series(df['reactivo'].map(normalizar).map(ritmo).fillna(0.0).to_numpy(dtype=float),
+                            index=df['id'].to_numpy())
+    df['consumo_diario'] = ritmo_micro.to_numpy() / micro_por_unidad
+
+    con_consumo = df['consumo_diario'] > 0
+    df['dias_restantes'] = np.where(con_consumo, df['cantidad'] / df['consumo_diario'].where(con_consumo, 1.0),
+                                    np.inf)
+
+    if lotes is None:
+        lotes = pd.DataFrame({'reactivo_id': df['id'].to_numpy(),
+                              'cantidad_base': a_micro_serie(df['cantidad'], df['unidad']),
+                              'fecha_vencimiento': df['fecha_vencimiento'].to_numpy()})
+    perdida = _perdida_por_lotes(pd.DataFrame(lotes, columns=COLUMNAS_LOTES), ritmo_micro, hoy)
+    df['perdida_vencimiento'] = df['id'].map(perdida).fillna(0.0).to_numpy(dtype=float) / micro_por_unidad
+
+    return df.sort_values('dias_restantes', ignore_index=True)[columnas]
+
+def _perdida_por_lotes(lotes, ritmo_micro, hoy):
+    """Micro-unidades que vencerán sin usarse, por reactivo_id
+
+    Las salidas consumen los lotes en orden FEFO al ritmo actual. Con Q el
+    stock acumulado hasta cada lote y t los días hasta que vence, lo que no se
+    alcanza a consumir es max(0, max(Q - ritmo * t)) sobre los lotes del
+    reactivo. Los lotes sin fecha no vencen (pero su stock se consume al final).
+    """
+    if lotes.empty:
+        return pd.Series(dtype=float)
+    vencimiento = pd.to_datetime(lotes['fecha_vencimiento'], errors='coerce')
+    lotes = (lotes.assign(vencimiento=vencimiento, dias=(vencimiento - hoy).dt.days.clip(lower=0),
+                          micro=lotes['cantidad_base'].astype(float))
+             .sort_values(['reactivo_id', 'vencimiento'], na_position='last', kind='stable'))
+    acumulado = lotes.groupby('reactivo_id')['micro'].cumsum()
+    exceso = acumulado - lotes['reactivo_id'].map(ritmo_micro).fillna(0.0) * lotes['dias']
+    return exceso.groupby(lotes['reactivo_id']).max().clip(lower=0).fillna(0.0)
@@ -0,0 +1,81 @@
+import argparse
+import sys
+
+import pandas as pd
+
+from almacenamiento import backend_desde_entorno
+
+# Frecuencias de agrupación admitidas (alias de pandas)
+FRECUENCIAS = {'D': "Diaria", 'W': "Semanal", 'M': "Mensual", 'Y': "Anual"}
+
+COLUMNAS_RESUMEN = {
+    'reactivo': ['fecha', 'reactivo', 'unidad', 'entradas', 'salidas', 'movimientos'],
+    'usuario': ['fecha', 'usuario', 'proyecto_curso', 'entradas', 'salidas', 'movimientos']
+}
+
+# ============================================================================
+# CONSULTAS SOBRE AGREGADOS DIARIOS
+# ============================================================================
+
+def consumo_por_periodo(backend, desde=None, hasta=None, frecuencia='M', por='reactivo'):
+    """Entradas, salidas, neto y cantidad de movimientos por período.
+
+    Lee las tablas de agregados diarios (nunca el log crudo) y reagrupa en
+    pandas a la frecuencia pedida. por='reactivo' agrupa por reactivo y
+    unidad; por='usuario' por usuario y proyecto/curso.
+    """
+    if frecuencia not in FRECUENCIAS:
+        raise ValueError(f"Frecuencia no válida: {frecuencia}")
+    columnas = COLUMNAS_RESUMEN[por]
+    df = pd.DataFrame(
+        backend.consultar_resumen_diario(desde, hasta, por_usuario=(por == 'usuario')),
+        columns=columnas
+    )
+    claves = columnas[1:3]
+    if df.empty:
+        return pd.DataFrame(columns=['periodo', *claves, 'entradas', 'salidas', 'neto', 'movimientos'])
+
+    df['fecha'] = pd.to_datetime(df['fecha'], errors='coerce')
+    df[['entradas', 'salidas']] = df[['entradas', 'salidas']].astype(float)
+    df['periodo'] = df['fecha'].dt.to_period(frecuencia).astype(str)
+
+    resultado = (df.groupby(['periodo', *claves], observed=True)[['entradas', 'salidas', 'movimientos']]
+                 .sum().reset_index())
+    resultado['neto'] = resultado['entradas'] - resultado['salidas']
+    return resultado[['periodo', *claves, 'entradas', 'salidas', 'neto', 'movimientos']]
+
+# ============================================================================
+# LÍNEA DE COMANDOS
+# ============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agregados diarios de log_movimientos")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    sub.add_parser('reconstruir', help="Recalcula los agregados desde todo el historial")
+
+    consultar = sub.add_parser('consultar', help="Consumo por período desde los agregados")
+    consultar.add_argument('--desde', help="Fecha inicial YYYY-MM-DD")
+    consultar.add_argument('--hasta', help="Fecha final YYYY-MM-DD")
+    consultar.add_argument('--frecuencia', choices=list(FRECUENCIAS), default='M')
+    consultar.add_argument('--por', choices=list(COLUMNAS_RESUMEN), default='reactivo')
+    consultar.add_argument('--salida', help="Guardar como CSV en lugar de imprimir")
+
+    args = parser.parse_args(argv)
+    backend = backend_desde_entorno()
+
+    if args.comando == 'reconstruir':
+        backend.reconstruir_resumenes()
+        print("✅ Agregados diarios reconstruidos")
+        return 0
+
+    df = consumo_por_periodo(backend, args.desde, args.hasta, args.frecuencia, args.por)
+    if args.salida:
+        df.to_csv(args.salida, index=False)
+        print(f"✅ {len(df)} filas guardadas en {args.salida}")
+    else:
+        print(df.to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,484 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import uuid
+from datetime import date, datetime
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pandas as pd
+
+from cola import ClaveEnConflicto
+from importacion import leer_archivo
+from sistema import RUTA_COLA, SistemaInventarioReactivos
+from unidades import UNIDADES
+
+# Endpoint HTTP: por defecto solo local, en el puerto siguiente al de Streamlit
+HOST = '127.0.0.1'
+PUERTO = 8502
+
+# Límites por petición: cuerpo, encabezados y movimientos
+MAXIMO_CUERPO = 1 << 20
+MAXIMO_ENCABEZADOS = 100
+MAXIMO_MOVIMIENTOS = 1000
+
+# Segundos que una conexión keep-alive puede quedar ociosa
+ESPERA_CONEXION = 30
+
+# Filas de stock por consulta si no se indica límite
+LIMITE_STOCK = 50
+
+COLUMNAS_STOCK = ['id', 'reactivo', 'cantidad', 'unidad', 'estado', 'fecha_vencimiento']
+
+ESTADOS_HTTP = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+                405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# OPERACIONES (comunes a la línea de comandos y al endpoint)
+# ============================================================================
+
+def consultar_stock(sistema, termino="", reactivo_id=None, limite=LIMITE_STOCK):
+    """Filas de stock (dicts listos para JSON) por id o por búsqueda de nombre"""
+    if not sistema.cargado:
+        sistema.cargar_datos()
+    if reactivo_id is not None:
+        fila = sistema.obtener_reactivo(reactivo_id)
+        df = fila.to_frame().T if fila is not None else pd.DataFrame(columns=COLUMNAS_STOCK)
+    else:
+        df = sistema.buscar_reactivo(termino or "", limite=limite)
+        if df.empty:
+            return []
+        df = df.head(limite)
+    return [_a_json(fila) for fila in df[COLUMNAS_STOCK].to_dict('records')]
+
+def _a_json(fila):
+    convertida = {}
+    for clave, valor in fila.items():
+        if pd.isna(valor):
+            valor = None
+        elif isinstance(valor, pd.Timestamp):
+            valor = valor.strftime('%Y-%m-%d')
+        elif hasattr(valor, 'item'):
+            valor = valor.item()
+        convertida[clave] = valor
+    return convertida
+
+def resolver_reactivo(sistema, nombre):
+    """Id del reactivo por nombre (sin distinguir mayúsculas ni acentos), o None.
+
+    Siempre por nombre, aunque sea numérico: los ids llegan solo en 'reactivo_id'.
+    """
+    if not sistema.cargado:
+        sistema.cargar_datos()
+    return sistema.buscar_id_por_nombre(str(nombre).strip())
+
+def normalizar_movimiento(sistema, datos, usuario=None, proyecto_curso=None):
+    """Valida un movimiento recibido (JSON o fila de archivo) y lo deja como lo espera el backend.
+
+    SALIDA necesita 'reactivo_id' o el nombre de un reactivo existente en
+    'reactivo' (que nunca se interpreta como id); ENTRADA,
+    el nombre en 'reactivo'. Devuelve el dict con 'clave' (la recibida o una
+    nueva) y 'tipo'; lanza ValueError con el motivo si algo no es válido.
+    """
+    if not isinstance(datos, dict):
+        raise ValueError("Cada movimiento debe ser un objeto")
+    datos = {clave: valor for clave, valor in datos.items() if not _vacio(valor)}
+    tipo = str(datos.get('tipo', '')).strip().upper()
+    if tipo not in ('ENTRADA', 'SALIDA'):
+        raise ValueError("El tipo debe ser ENTRADA o SALIDA")
+    try:
+        cantidad = float(datos.get('cantidad'))
+    except (TypeError, ValueError):
+        raise ValueError("Cantidad no numérica")
+    if not cantidad > 0:
+        raise ValueError("La cantidad debe ser mayor a 0")
+    unidad = datos.get('unidad')
+    if unidad is not None and unidad not in UNIDADES:
+        raise ValueError(f"Unidad no válida (use {', '.join(UNIDADES)})")
+    usuario = str(datos.get('usuario') or usuario or '').strip()
+    proyecto_curso = str(datos.get('proyecto_curso') or proyecto_curso or '').strip()
+    if not usuario:
+        raise ValueError("Falta usuario")
+    if not proyecto_curso:
+        raise ValueError("Falta proyecto/curso")
+
+    ahora = datetime.now()
+    movimiento = {
+        'clave': str(datos.get('clave') or uuid.uuid4().hex), 'tipo': tipo,
+        'cantidad': cantidad, 'unidad': unidad, 'usuario': usuario, 'proyecto_curso': proyecto_curso,
+        'notas': str(datos.get('notas') or ''),
+        'fecha': ahora.strftime('%Y-%m-%d'), 'hora': ahora.strftime('%H:%M:%S'),
+    }
+    if tipo == 'SALIDA':
+        if 'reactivo_id' in datos:
+            try:
+                reactivo_id = float(datos['reactivo_id'])
+            except (TypeError, ValueError):
+                reactivo_id = None
+            if reactivo_id is None or not reactivo_id.is_integer():
+                raise ValueError("Id de reactivo no válido")
+            reactivo_id = int(reactivo_id)
+        else:
+            reactivo_id = resolver_reactivo(sistema, datos.get('reactivo') or '')
+        if reactivo_id is None:
+            raise ValueError("Reactivo no encontrado")
+        movimiento['reactivo_id'] = reactivo_id
+        return movimiento
+
+    reactivo = str(datos.get('reactivo') or '').strip()
+    if not reactivo:
+        raise ValueError("Reactivo vacío")
+    vence = datos.get('fecha_vencimiento')
+    if vence is not None:
+        try:
+            vence = date.fromisoformat(str(vence)[:10]).isoformat()
+        except ValueError:
+            raise ValueError("Fecha de vencimiento no válida")
+    movimiento.update(reactivo=reactivo, unidad=unidad or 'L', fecha_vencimiento=vence,
+                      proveedor=datos.get('proveedor') or None)
+    return movimiento
+
+def _vacio(valor):
+    return valor is None or (isinstance(valor, float) and pd.isna(valor)) or str(valor).strip() == ''
+
+def encolar_o_registrar(sistema, movimientos):
+    """Con cola: encola y vuelve al instante (estado 'pendiente'); sin cola: registra en el backend"""
+    if sistema.cola is None:
+        return sistema.registrar_movimientos(movimientos)
+    respuestas = []
+    for movimiento in movimientos:
+        datos = dict(movimiento)
+        clave, tipo = datos.pop('clave'), datos.pop('tipo')
+        try:
+            sistema.cola.encolar(tipo, datos, clave=clave)
+        except ClaveEnConflicto as e:
+            respuestas.append({'clave': clave, 'estado': 'rechazado', 'error': str(e), 'resultado': None})
+            continue
+        respuestas.append({'clave': clave, 'estado': 'pendiente', 'error': None, 'resultado': None})
+    return respuestas
+
+# ============================================================================
+# ENDPOINT HTTP (asyncio, sin dependencias)
+# ============================================================================
+
+class ServidorMovimientos:
+    """Endpoint HTTP/1.1 liviano para clientes de alta frecuencia (lectores de código de barras)
+
+    Rutas (JSON de ida y vuelta):
+      GET  /salud                 estado del backend y de la cola
+      GET  /stock?q=...&limite=   búsqueda de stock; /stock/<id> un reactivo
+      POST /movimientos           un movimiento o una lista; con cola responde 202 al encolar
+      GET  /movimientos/<clave>   estado de un movimiento encolado
+
+    Las conexiones son keep-alive; lo que toca el sistema (cola SQLite,
+    backend, caché) corre en hilos para no frenar el bucle de eventos. Un
+    cliente que reintenta con la misma 'clave' no duplica el movimiento.
+    """
+
+    def __init__(self, sistema, host=HOST, puerto=PUERTO):
+        self.sistema = sistema
+        self.host = host
+        self.puerto = puerto
+        self._servidor = None
+
+    async def iniciar(self):
+        self._servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+        self.puerto = self._servidor.sockets[0].getsockname()[1]
+        return self
+
+    async def servir(self):
+        if self._servidor is None:
+            await self.iniciar()
+        async with self._servidor:
+            await self._servidor.serve_forever()
+
+    def cerrar(self):
+        if self._servidor is not None:
+            self._servidor.close()
+
+    async def _atender(self, lector, escritor):
+        try:
+            while True:
+                peticion = await asyncio.wait_for(self._leer_peticion(lector), ESPERA_CONEXION)
+                if peticion is None:
+                    return
+                if 'error' in peticion:
+                    codigo, cuerpo, seguir = peticion['error'], {'error': peticion['mensaje']}, False
+                else:
+                    codigo, cuerpo = await self._responder(peticion)
+                    seguir = peticion['seguir']
+                escritor.write(_respuesta_http(codigo, cuerpo, seguir))
+                await escritor.drain()
+                if not seguir:
+                    return
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ValueError, ConnectionError):
+            # Cliente ocioso, cortado o con una línea demasiado larga: se cierra la conexión
+            return
+        finally:
+            escritor.close()
+
+    async def _leer_peticion(self, lector):
+        linea = await lector.readline()
+        if not linea:
+            return None
+        try:
+            metodo, destino, version = linea.decode('latin-1').split()
+        except ValueError:
+            return {'error': 400, 'mensaje': "Línea de petición no válida"}
+        encabezados = {}
+        while True:
+            linea = await lector.readline()
+            if linea in (b'\r\n', b'\n', b''):
+                break
+            if len(encabezados) >= MAXIMO_ENCABEZADOS:
+                return {'error': 400, 'mensaje': "Demasiados encabezados"}
+            nombre, _, valor = linea.decode('latin-1').partition(':')
+            encabezados[nombre.strip().lower()] = valor.strip()
+        try:
+            largo = int(encabezados.get('content-length', 0))
+        except ValueError:
+            return {'error': 400, 'mensaje': "Content-Length no válido"}
+        if largo > MAXIMO_CUERPO:
+            return {'error': 413, 'mensaje': f"Cuerpo mayor a {MAXIMO_CUERPO} bytes"}
+        cuerpo = await lector.readexactly(largo) if largo else b''
+        conexion = encabezados.get('connection', '').lower()
+        url = urlsplit(destino)
+        return {
+            'metodo': metodo.upper(),
+            'ruta': [unquote(parte) for parte in url.path.split('/') if parte],
+            'consulta': {clave: valores[-1] for clave, valores in parse_qs(url.query).items()},
+            'cuerpo': cuerpo,
+            'seguir': conexion != 'close' and (version == 'HTTP/1.1' or conexion == 'keep-alive'),
+        }
+
+    async def _responder(self, peticion):
+        metodo, ruta = peticion['metodo'], peticion['ruta']
+        try:
+            if ruta == ['salud'] and metodo == 'GET':
+                return 200, await asyncio.to_thread(self._salud)
+            if ruta[:1] == ['stock'] and len(ruta) <= 2 and metodo == 'GET':
+                return await asyncio.to_thread(self._stock, ruta, peticion['consulta'])
+            if ruta == ['movimientos'] and metodo == 'POST':
+                return await asyncio.to_thread(self._movimientos, peticion['cuerpo'])
+            if ruta[:1] == ['movimientos'] and len(ruta) == 2 and metodo == 'GET':
+                return await asyncio.to_thread(self._estado_movimiento, ruta[1])
+            if ruta and ruta[0] in ('salud', 'stock', 'movimientos'):
+                return 405, {'error': f"Método {metodo} no admitido en /{'/'.join(ruta)}"}
+            return 404, {'error': "Ruta desconocida"}
+        except Exception as e:
+            logger.exception("Error atendiendo %s /%s", metodo, '/'.join(ruta))
+            return 500, {'error': str(e)}
+
+    def _salud(self):
+        cola = self.sistema.cola
+        return {'ok': True, 'backend': self.sistema.backend.nombre, 'version': self.sistema.version,
+                'cola': None if cola is None else {'pendientes': cola.pendientes(), 'ultimo_error': cola.ultimo_error}}
+
+    def _stock(self, ruta, consulta):
+        try:
+            reactivo_id = int(ruta[1]) if len(ruta) == 2 else None
+            limite = int(consulta.get('limite', LIMITE_STOCK))
+        except ValueError:
+            return 400, {'error': "El id y el límite deben ser enteros"}
+        if limite <= 0:
+            return 400, {'error': "El límite debe ser mayor a 0"}
+        filas = consultar_stock(self.sistema, consulta.get('q', ''), reactivo_id, limite)
+        if reactivo_id is not None:
+            return (200, filas[0]) if filas else (404, {'error': "Reactivo no encontrado"})
+        return 200, {'reactivos': filas}
+
+    def _movimientos(self, cuerpo):
+        try:
+            datos = json.loads(cuerpo or b'null')
+        except ValueError:
+            return 400, {'error': "El cuerpo debe ser JSON"}
+        lista = datos if isinstance(datos, list) else [datos]
+        if not lista or len(lista) > MAXIMO_MOVIMIENTOS:
+            return 400, {'error': f"Envíe entre 1 y {MAXIMO_MOVIMIENTOS} movimientos"}
+        movimientos, errores = [], []
+        for indice, item in enumerate(lista):
+            try:
+                movimientos.append(normalizar_movimiento(self.sistema, item))
+            except ValueError as e:
+                errores.append({'indice': indice, 'error': str(e)})
+        if errores:
+            # Todo o nada: un lote con filas inválidas no se encola a medias
+            return 400, {'errores': errores}
+        respuestas = encolar_o_registrar(self.sistema, movimientos)
+        codigo = 202 if self.sistema.cola is not None else 200
+        return codigo, respuestas if isinstance(datos, list) else respuestas[0]
+
+    def _estado_movimiento(self, clave):
+        movimiento = self.sistema.cola.consultar(clave) if self.sistema.cola is not None else None
+        if movimiento is None:
+            return 404, {'error': "Movimiento no encontrado en la cola"}
+        return 200, movimiento
+
+def _respuesta_http(codigo, cuerpo, seguir):
+    contenido = json.dumps(cuerpo, ensure_ascii=False, default=str).encode('utf-8')
+    encabezados = (
+        f"HTTP/1.1 {codigo} {ESTADOS_HTTP.get(codigo, '')}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(contenido)}\r\n"
+        f"Connection: {'keep-alive' if seguir else 'close'}\r\n\r\n"
+    )
+    return encabezados.encode('latin-1') + contenido
+
+# ============================================================================
+# LÍNEA DE COMANDOS
+# ============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inventario de reactivos sin interfaz: consultas, movimientos y endpoint HTTP")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    stock = sub.add_parser('stock', help="Consulta stock por nombre o por id")
+    stock.add_argument('termino', nargs='?', default="", help="Nombre o parte del nombre (vacío = todos)")
+    stock.add_argument('--id', type=int, dest='reactivo_id')
+    stock.add_argument('--limite', type=int, default=LIMITE_STOCK)
+    stock.add_argument('--json', action='store_true', help="Salida JSON en lugar de tabla")
+
+    for nombre, ayuda in (('entrada', "Registra una entrada"), ('salida', "Registra una salida")):
+        movimiento = sub.add_parser(nombre, help=ayuda)
+        if nombre == 'salida':
+            # El nombre nunca se toma como id, aunque sea numérico: el id va con --id
+            reactivo = movimiento.add_mutually_exclusive_group(required=True)
+            reactivo.add_argument('reactivo', nargs='?', help="Nombre del reactivo")
+            reactivo.add_argument('--id', type=int, dest='reactivo_id')
+        else:
+            movimiento.add_argument('reactivo', help="Nombre del reactivo")
+        movimiento.add_argument('cantidad', type=float)
+        movimiento.add_argument('--unidad', choices=UNIDADES,
+                                help="Por defecto L en entradas y la del reactivo en salidas")
+        movimiento.add_argument('--usuario', required=True)
+        movimiento.add_argument('--proyecto', required=True)
+        movimiento.add_argument('--notas', default="")
+        if nombre == 'entrada':
+            movimiento.add_argument('--vence', help="Fecha de vencimiento YYYY-MM-DD")
+            movimiento.add_argument('--proveedor')
+
+    lote = sub.add_parser('lote', help="Registra entradas y salidas desde un CSV/Parquet (columna 'tipo')")
+    lote.add_argument('archivo')
+    lote.add_argument('--usuario', help="Usuario por defecto para filas sin 'usuario'")
+    lote.add_argument('--proyecto', help="Proyecto/curso por defecto para filas sin 'proyecto_curso'")
+    lote.add_argument('--errores', help="Ruta CSV donde guardar las filas rechazadas")
+
+    sub.add_parser('migrar-nombres', help="Completa los nombres normalizados de filas anteriores a la columna "
+                                          "(una vez, tras ejecutar sql/movimientos.sql en Supabase)")
+
+    servir = sub.add_parser('servir', help="Endpoint HTTP para lectores y otros clientes")
+    servir.add_argument('--host', default=HOST)
+    servir.add_argument('--puerto', type=int, default=PUERTO)
+    servir.add_argument('--cola', default=os.environ.get('INVENTARIO_COLA', RUTA_COLA),
+                        help="Archivo de la cola local (vacío = registrar directo en el backend)")
+
+    args = parser.parse_args(argv)
+    if args.comando == 'stock' and args.limite <= 0:
+        parser.error("--limite debe ser mayor a 0")
+
+    # El servicio nunca siembra el inventario de ejemplo en una base vacía
+    if args.comando == 'servir':
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        sistema = SistemaInventarioReactivos(ejemplos=False)
+        sistema.iniciar_cambios()
+        if args.cola:
+            sistema.iniciar_cola(args.cola)
+        servidor = ServidorMovimientos(sistema, args.host, args.puerto)
+        print(f"✅ Escuchando en http://{args.host}:{args.puerto} ({sistema.backend.nombre})", file=sys.stderr)
+        try:
+            asyncio.run(servidor.servir())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if sistema.cola is not None:
+                sistema.cola.detener()
+        return 0
+
+    # Sin carga inicial: solo se descarga la caché si hace falta buscar por nombre
+    sistema = SistemaInventarioReactivos(cargar=False, ejemplos=False)
+
+    if args.comando == 'stock':
+        filas = consultar_stock(sistema, args.termino, args.reactivo_id, args.limite)
+        if args.json:
+            print(json.dumps(filas, ensure_ascii=False, indent=2))
+        elif filas:
+            print(pd.DataFrame(filas).to_string(index=False))
+        else:
+            print("No se encontraron reactivos.")
+        return 0 if filas else 1
+
+    if args.comando == 'lote':
+        return _registrar_lote(sistema, args)
+
+    if args.comando == 'migrar-nombres':
+        completados, duplicados = sistema.backend.migrar_nombres()
+        print(f"✅ {completados} nombres completados")
+        for reactivo_id in duplicados:
+            print(f"  ❌ Reactivo {reactivo_id}: su nombre ya existe, fusionarlo a mano")
+        return 1 if duplicados else 0
+
+    # Mismas validaciones que el endpoint y los archivos de lote
+    datos = {'tipo': args.comando.upper(), 'reactivo': args.reactivo, 'cantidad': args.cantidad,
+             'unidad': args.unidad, 'usuario': args.usuario, 'proyecto_curso': args.proyecto, 'notas': args.notas}
+    if args.comando == 'entrada':
+        datos.update(fecha_vencimiento=args.vence, proveedor=args.proveedor)
+    elif args.reactivo_id is not None:
+        datos['reactivo_id'] = args.reactivo_id
+    try:
+        movimiento = normalizar_movimiento(sistema, datos)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    if args.comando == 'entrada':
+        ok, mensaje = sistema.registrar_entrada(
+            movimiento['reactivo'], movimiento['cantidad'], movimiento['usuario'], movimiento['proyecto_curso'],
+            unidad=movimiento['unidad'], fecha_vencimiento=movimiento['fecha_vencimiento'],
+            notas=movimiento['notas'], proveedor=movimiento['proveedor']
+        )
+    else:
+        ok, mensaje = sistema.registrar_salida(
+            movimiento['reactivo_id'], movimiento['cantidad'], movimiento['usuario'], movimiento['proyecto_curso'],
+            notas=movimiento['notas'], unidad=movimiento['unidad']
+        )
+
+    print(f"{'✅' if ok else '❌'} {mensaje}")
+    return 0 if ok else 1
+
+def _registrar_lote(sistema, args):
+    df = leer_archivo(args.archivo)
+    df = df.rename(columns=lambda columna: str(columna).strip().lower())
+    movimientos, errores, numeros = [], [], {}
+    for posicion, fila in enumerate(df.to_dict('records')):
+        # Numerada como en el archivo (con encabezado), igual que importacion.py
+        numero = posicion + 2
+        try:
+            movimiento = normalizar_movimiento(sistema, fila, args.usuario, args.proyecto)
+        except ValueError as e:
+            errores.append({**fila, 'fila': numero, 'error': str(e)})
+            continue
+        if movimiento['clave'] in numeros:
+            # Una clave repetida solo aplicaría la primera fila: la otra se rechaza
+            errores.append({**fila, 'fila': numero,
+                            'error': f"Clave repetida (fila {numeros[movimiento['clave']]})"})
+            continue
+        movimientos.append(movimiento)
+        numeros[movimiento['clave']] = numero
+
+    respuestas = sistema.registrar_movimientos(movimientos)
+    rechazados = [r for r in respuestas if r['estado'] == 'rechazado']
+    for respuesta in rechazados:
+        print(f"  ❌ Fila {numeros[respuesta['clave']]}: {respuesta['error']}", file=sys.stderr)
+    print(f"✅ {len(respuestas) - len(rechazados)} movimientos registrados, "
+          f"{len(rechazados)} rechazados por el backend, {len(errores)} filas no válidas")
+    if errores and args.errores:
+        pd.DataFrame(errores).set_index('fila').to_csv(args.errores)
+    return 1 if errores or rechazados else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
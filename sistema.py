@@ -0,0 +1,688 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import importacion
+import resumenes
+from almacenamiento import backend_desde_entorno
+from busqueda import IndiceBusqueda
+from cambios import crear_suscripcion
+from cola import TAMANO_LOTE_COLA, ClaveEnConflicto, ColaMovimientos, motivo_rechazo
+from diagnostico import BackendInstrumentado, instrumentar_clase
+from esquema import ESQUEMA_INVENTARIO, ESQUEMA_LOG, concatenar, construir, reporte_memoria
+from reportes import MotorReportes
+from unidades import UnidadIncompatible, a_micro, convertir_micro, desde_micro_serie
+from vencimientos import HORIZONTES_VENCIMIENTO, IndiceVencimientos
+
+# Máximo de movimientos recientes que se mantienen en memoria; el historial
+# completo se consulta por páginas con historial_movimientos
+LIMITE_LOG = 100
+
+# Relectura hacia atrás en cada sincronización incremental: una transacción
+# que empezó antes del sondeo pero confirmó después deja un updated_at (o un id
+# de log) por debajo de la marca; lo releído ya en caché se descarta por id
+VENTANA_SINCRONIZACION = timedelta(seconds=60)
+VENTANA_LOG_IDS = 50
+
+# Filas por página del historial de movimientos
+TAMANO_PAGINA_HISTORIAL = 100
+
+# Resultados que devuelve la búsqueda de la interfaz (los más relevantes)
+LIMITE_BUSQUEDA = 200
+
+# Archivo de la cola local de movimientos (vacío en la config para desactivarla)
+RUTA_COLA = 'cola_movimientos.db'
+
+logger = logging.getLogger(__name__)
+
+class SistemaInventarioReactivos:
+    """Gestión de inventario de reactivos químicos sobre un backend de almacenamiento
+
+    No depende de Streamlit: sin backend se arma uno desde las variables de
+    entorno (ver backend_desde_entorno). Con cargar=False no se descarga nada
+    hasta el primer cargar_datos(); mientras la caché no esté cargada, los
+    movimientos se registran en el backend sin fusionarse en memoria. Los
+    mensajes para el usuario (inventario de ejemplo creado, errores de carga)
+    quedan en tomar_avisos() además del log. Con ejemplos=False una base vacía
+    se carga vacía: leer nunca escribe el inventario de ejemplo (scripts,
+    servicio).
+    """
+    
+    def __init__(self, backend=None, cargar=True, ejemplos=True):
+        # Cada llamada al backend queda medida como un viaje (ver Diagnóstico)
+        self.backend = BackendInstrumentado(backend if backend is not None else backend_desde_entorno())
+        self.df_inventario = None
+        self.df_log = None
+        self._indice = IndiceBusqueda()
+        self._indice_vencimientos = IndiceVencimientos()
+        self._reportes = MotorReportes(self.backend)
+        self._memo_reporte = (None, None)
+        self._memo_vencimientos = (None, None)
+        self._memo_opciones = None
+        # Marcas de sincronización incremental (updated_at / id más altos vistos)
+        self._marca_inventario = None
+        self._marca_log = None
+        # La instancia se comparte entre sesiones: el lock serializa las
+        # escrituras en caché y la versión cambia con cada modificación
+        self._lock = threading.RLock()
+        self.version = 0
+        self._suscripcion = None
+        self.cola = None
+        self._avisos = []
+        self.ejemplos = ejemplos
+        if cargar:
+            self.cargar_datos(completo=True)
+    
+    def cargar_datos(self, completo=False):
+        """Carga datos desde el backend (incremental salvo recarga completa o marca inválida)"""
+        with self._lock:
+            if completo or self._marca_inventario is None or self._marca_log is None:
+                self._carga_completa()
+                return
+            
+            try:
+                self._sincronizar_cambios()
+            except Exception:
+                # Marca rechazada por el servidor o datos inconsistentes: resincronizar todo
+                self._carga_completa()
+    
+    def _carga_completa(self):
+        """Descarga completa de inventario y log, reiniciando las marcas"""
+        try:
+            # Cargar inventario
+            filas = self.backend.listar_inventario()
+            if not filas and self.ejemplos:
+                self._avisar('info', "No hay datos en inventario. Creando ejemplos iniciales...")
+                self.crear_inventario_inicial()
+                return
+            self.df_inventario = self._tipar_inventario(filas)
+            self._reconstruir_indices()
+            self._reportes.invalidar()
+            
+            # Cargar log
+            self.df_log = construir(self.backend.listar_movimientos(limite=LIMITE_LOG), ESQUEMA_LOG)
+            
+            self._actualizar_marcas()
+            self.version += 1
+                
+        except Exception as e:
+            self._avisar('error', f"Error cargando datos: {e}")
+            self.df_inventario = self._tipar_inventario([])
+            self.df_log = construir([], ESQUEMA_LOG)
+            self._reconstruir_indices()
+            self._marca_inventario = None
+            self._marca_log = None
+            self.version += 1
+    
+    def _sincronizar_cambios(self):
+        """Trae solo filas modificadas/nuevas desde las marcas y las fusiona en caché"""
+        desde = datetime.fromisoformat(self._marca_inventario) - VENTANA_SINCRONIZACION
+        filas = self.backend.listar_inventario(desde_updated_at=desde.isoformat())
+        hubo_cambios = self._fusionar_inventario(filas)
+        
+        # La ventana de ids no supera LIMITE_LOG: lo releído que ya estaba sigue en caché
+        limite = LIMITE_LOG + VENTANA_LOG_IDS
+        filas = self.backend.listar_movimientos(desde_id=max(self._marca_log - VENTANA_LOG_IDS, 0), limite=limite)
+        hubo_cambios = self._fusionar_log(filas, reemplazar=len(filas) >= limite) or hubo_cambios
+        
+        self._actualizar_marcas()
+        if hubo_cambios:
+            self.version += 1
+    
+    def _fusionar_inventario(self, filas):
+        """Fusiona filas de inventario en caché; True si alguna era nueva o distinta"""
+        if not filas:
+            return False
+        df_cambios = self._tipar_inventario(filas)
+        df = self.df_inventario
+        if df is not None and not df.empty and 'updated_at' in df_cambios.columns:
+            # Misma updated_at = ya estaba en caché (una fila releída por la ventana
+            # del delta, o un movimiento propio que vuelve por el feed): no es un cambio
+            vistas = df['updated_at'].reindex(df_cambios.index)
+            df_cambios = df_cambios[(vistas != df_cambios['updated_at']).to_numpy()]
+        if df_cambios.empty:
+            return False
+        self.df_inventario = self._fusionar_por_id(df, df_cambios)
+        self._actualizar_indices(df_cambios)
+        return True
+    
+    def _fusionar_log(self, filas, reemplazar=False):
+        """Antepone movimientos al log en caché; True si había alguno que no estaba"""
+        if not filas:
+            return False
+        df_nuevos = construir(filas, ESQUEMA_LOG)
+        if reemplazar or self.df_log is None or self.df_log.empty:
+            self.df_log = df_nuevos.sort_values('id', ascending=False, ignore_index=True).head(LIMITE_LOG)
+            return True
+        df_nuevos = df_nuevos[~df_nuevos['id'].isin(self.df_log['id'])]
+        if df_nuevos.empty:
+            return False
+        self.df_log = (concatenar([df_nuevos, self.df_log], ignore_index=True)
+                       .sort_values('id', ascending=False, ignore_index=True)
+                       .head(LIMITE_LOG))
+        return True
+    
+    def _eliminar_inventario(self, ids):
+        """Quita de caché e índices las filas borradas; True si alguna estaba"""
+        df = self.df_inventario
+        if not ids or df is None or df.empty:
+            return False
+        presentes = df.index.intersection(pd.Index(ids))
+        if presentes.empty:
+            return False
+        self.df_inventario = df.drop(presentes)
+        self._indice.eliminar(presentes)
+        self._indice_vencimientos.eliminar(presentes)
+        return True
+    
+    # ------------------------------------------------------------------------
+    # Feed de cambios
+    # ------------------------------------------------------------------------
+    
+    def iniciar_cambios(self, suscripcion=None):
+        """Suscribe la caché al feed de cambios del backend (realtime o sondeo)"""
+        self._suscripcion = suscripcion or crear_suscripcion(self.backend)
+        self._suscripcion.iniciar(self._al_recibir_cambios)
+    
+    @property
+    def cambios_en_vivo(self):
+        return self._suscripcion is not None and self._suscripcion.activa
+    
+    def _al_recibir_cambios(self, cambios):
+        """Callback del feed (hilo propio): filas concretas o solo un aviso"""
+        if cambios is None:
+            self.cargar_datos()
+        else:
+            self.aplicar_cambios(cambios)
+    
+    def aplicar_cambios(self, cambios):
+        """Aplica cambios de fila {'tabla', 'tipo', 'registro'} como deltas en caché.
+
+        La versión (y con ella el aviso a las sesiones) solo cambia si alguna
+        fila era realmente nueva o distinta de lo que ya había en caché.
+        """
+        inventario = [c['registro'] for c in cambios
+                      if c['tabla'] == 'inventario' and c['tipo'] in ('INSERT', 'UPDATE')]
+        borrados = [c['registro'].get('id') for c in cambios
+                    if c['tabla'] == 'inventario' and c['tipo'] == 'DELETE']
+        movimientos = [c['registro'] for c in cambios
+                       if c['tabla'] == 'log_movimientos' and c['tipo'] == 'INSERT']
+        with self._lock:
+            if self.df_inventario is None:
+                return
+            hubo_cambios = self._fusionar_inventario(inventario)
+            hubo_cambios = self._eliminar_inventario(borrados) or hubo_cambios
+            hubo_cambios = self._fusionar_log(movimientos) or hubo_cambios
+            if hubo_cambios:
+                self.version += 1
+    
+    @staticmethod
+    def _tipar_inventario(filas):
+        """Arma el frame de caché con los tipos del esquema (categóricas, datetime64,
+        numéricos), una sola vez al entrar, e indexa las filas por id para búsquedas O(1)"""
+        df = construir(filas, ESQUEMA_INVENTARIO)
+        df.index = pd.Index(df['id'].to_numpy())
+        return df
+    
+    def _reconstruir_indices(self):
+        """Reconstruye los índices en memoria tras una carga completa"""
+        self._indice.reconstruir(self.df_inventario)
+        self._indice_vencimientos.reconstruir(self.df_inventario)
+    
+    def _actualizar_indices(self, df_cambios):
+        """Reindexa solo las filas que llegaron en un delta o movimiento"""
+        self._indice.actualizar(df_cambios)
+        self._indice_vencimientos.actualizar(df_cambios)
+    
+    def _filas_por_id(self, ids):
+        """Filas de inventario para los ids dados, en ese orden"""
+        df = self.df_inventario
+        if df is None or df.empty:
+            return pd.DataFrame()
+        posiciones = df.index.get_indexer(ids)
+        return df.iloc[posiciones[posiciones >= 0]]
+    
+    def obtener_reactivo(self, reactivo_id):
+        """Fila de inventario (Series) del id dado, o None si no está en caché"""
+        df = self.df_inventario
+        if df is None or df.empty or reactivo_id not in df.index:
+            return None
+        return df.loc[reactivo_id]
+    
+    def buscar_id_por_nombre(self, nombre):
+        """Id del reactivo con ese nombre (sin distinguir mayúsculas ni acentos), o None"""
+        return self._indice.id_por_nombre(nombre)
+    
+    def opciones_reactivos(self):
+        """Ids y etiquetas "nombre (stock unidad)" para selectores, memorizadas por versión"""
+        if self._memo_opciones is not None and self._memo_opciones[0] == self.version:
+            return self._memo_opciones[1]
+        df = self.df_inventario
+        etiquetas = (df['reactivo'].astype(str) + " (" + df['cantidad'].astype(float).map('{:.2f}'.format)
+                     + " " + df['unidad'].astype(str) + ")")
+        opciones = dict(zip(df['id'].tolist(), etiquetas.tolist()))
+        self._memo_opciones = (self.version, opciones)
+        return opciones
+    
+    @staticmethod
+    def _fusionar_por_id(df_actual, df_cambios):
+        """Reemplaza por id las filas cambiadas y agrega las nuevas (índice = id)"""
+        if df_actual is None or df_actual.empty:
+            return df_cambios.sort_index()
+        
+        # Una sola copia: cada fila cambiada toma su versión nueva en el mismo
+        # lugar y las nuevas van al final (solo entonces hace falta ordenar)
+        posiciones = df_actual.index.get_indexer(df_cambios.index)
+        existentes = posiciones >= 0
+        orden = np.arange(len(df_actual))
+        orden[posiciones[existentes]] = len(df_actual) + np.flatnonzero(existentes)
+        orden = np.concatenate([orden, len(df_actual) + np.flatnonzero(~existentes)])
+        resultado = concatenar([df_actual, df_cambios]).take(orden)
+        return resultado if resultado.index.is_monotonic_increasing else resultado.sort_index()
+    
+    def _actualizar_marcas(self):
+        """Recalcula las marcas a partir de los datos en caché (None = marca inválida)"""
+        self._marca_inventario = None
+        self._marca_log = None
+        
+        if self.df_inventario is not None and 'updated_at' in self.df_inventario.columns:
+            marca = self.df_inventario['updated_at'].dropna().max()
+            if isinstance(marca, str) and marca:
+                self._marca_inventario = marca
+        
+        if self.df_log is not None and not self.df_log.empty and 'id' in self.df_log.columns:
+            self._marca_log = int(self.df_log['id'].max())
+        elif self.df_log is not None:
+            self._marca_log = 0
+    
+    def crear_inventario_inicial(self):
+        """Crea datos de ejemplo iniciales"""
+        datos_ejemplo = [
+            {
+                'reactivo': 'Ácido Sulfúrico 98%',
+                'cantidad': 2.5,
+                'unidad': 'L',
+                'estado': 'disponible',
+                'fecha_vencimiento': '2026-12-31',
+                'fecha_ingreso': '2024-01-15',
+                'notas': 'Manipular con precaución - Corrosivo'
+            },
+            {
+                'reactivo': 'Hidróxido de Sodio',
+                'cantidad': 5.0,
+                'unidad': 'kg',
+                'estado': 'disponible',
+                'fecha_vencimiento': '2027-06-30',
+                'fecha_ingreso': '2024-02-20',
+                'notas': 'Almacenar en lugar seco'
+            },
+            {
+                'reactivo': 'Etanol 96%',
+                'cantidad': 10.0,
+                'unidad': 'L',
+                'estado': 'disponible',
+                'fecha_vencimiento': '2025-11-15',
+                'fecha_ingreso': '2024-03-10',
+                'notas': 'Inflamable - Mantener alejado del fuego'
+            },
+            {
+                'reactivo': 'Cloruro de Sodio',
+                'cantidad': 15.0,
+                'unidad': 'kg',
+                'estado': 'disponible',
+                'fecha_vencimiento': '2028-01-31',
+                'fecha_ingreso': '2024-01-05',
+                'notas': 'Grado analítico'
+            },
+            {
+                'reactivo': 'Acetona',
+                'cantidad': 8.0,
+                'unidad': 'L',
+                'estado': 'disponible',
+                'fecha_vencimiento': '2025-10-20',
+                'fecha_ingreso': '2024-04-12',
+                'notas': 'Inflamable - Buena ventilación'
+            }
+        ]
+        
+        ahora = datetime.now().isoformat()
+        for dato in datos_ejemplo:
+            dato['updated_at'] = ahora
+        
+        try:
+            self.backend.insertar_inventario(datos_ejemplo)
+            self.cargar_datos(completo=True)
+            self._avisar('success', "✅ Inventario inicial creado")
+        except Exception as e:
+            self._avisar('error', f"Error creando inventario inicial: {e}")
+    
+    def _avisar(self, nivel, mensaje):
+        """Mensaje para quien muestre el sistema (nivel: 'info', 'success' o 'error')"""
+        logger.log(logging.ERROR if nivel == 'error' else logging.INFO, mensaje)
+        with self._lock:
+            self._avisos.append((nivel, mensaje))
+    
+    def tomar_avisos(self):
+        """Devuelve los avisos pendientes y los descarta"""
+        with self._lock:
+            avisos, self._avisos = self._avisos, []
+        return avisos
+    
+    @property
+    def cargado(self):
+        return self.df_inventario is not None
+    
+    def buscar_reactivo(self, termino_busqueda, limite=None):
+        """Busca reactivos por nombre (sin acentos, tolera errores de tipeo), por relevancia.
+
+        Con `limite` solo se puntúan y ordenan los `limite` más relevantes; un
+        término vacío devuelve todo el inventario.
+        """
+        df = self.df_inventario
+        if df is None or df.empty:
+            return pd.DataFrame()
+        
+        if termino_busqueda.strip() == "":
+            return df
+        
+        return self._filas_por_id(self._indice.buscar(termino_busqueda, limite=limite))
+    
+    def registrar_salida(self, reactivo_id, cantidad, usuario, proyecto_curso, notas="", unidad=None):
+        """Registra una salida de reactivo (descuento condicional + log en una transacción).
+
+        La cantidad se expresa en `unidad` (por defecto la del reactivo).
+        """
+        try:
+            ahora = datetime.now()
+            resultado = self.backend.registrar_salida(
+                reactivo_id, cantidad, usuario, proyecto_curso, notas,
+                ahora.strftime('%Y-%m-%d'), ahora.strftime('%H:%M:%S'), unidad=unidad
+            )
+            reactivo = resultado.get('inventario')
+            
+            if reactivo is None:
+                return False, "Reactivo no encontrado"
+            
+            if not resultado.get('ok'):
+                return False, f"Stock insuficiente. Disponible: {float(reactivo['cantidad'])} {reactivo['unidad']}"
+            
+            self._aplicar_movimiento(resultado)
+            
+            nueva_cantidad = float(reactivo['cantidad'])
+            lotes = ", ".join(f"#{lote['lote_id']} ({float(lote['cantidad']):g})"
+                              for lote in resultado.get('lotes') or [])
+            return True, (f"Salida registrada: {cantidad} {unidad or reactivo['unidad']} de {reactivo['reactivo']}. "
+                          f"Nuevo stock: {nueva_cantidad} {reactivo['unidad']}"
+                          + (f". Lotes: {lotes}" if lotes else ""))
+            
+        except Exception as e:
+            return False, f"Error: {str(e)}"
+    
+    def registrar_entrada(self, nombre_reactivo, cantidad, usuario, proyecto_curso, 
+                          unidad='L', fecha_vencimiento=None, notas="", proveedor=None):
+        """Registra una entrada de reactivo (lote nuevo + suma de stock + log en una transacción)"""
+        try:
+            ahora = datetime.now()
+            resultado = self.backend.registrar_entrada(
+                nombre_reactivo, cantidad, unidad, fecha_vencimiento, usuario, proyecto_curso,
+                notas, ahora.strftime('%Y-%m-%d'), ahora.strftime('%H:%M:%S'), proveedor=proveedor or None
+            )
+            reactivo = resultado['inventario']
+            
+            self._aplicar_movimiento(resultado)
+            
+            if resultado.get('nuevo'):
+                mensaje = f"Nuevo reactivo agregado: {cantidad} {unidad} de {nombre_reactivo}"
+            else:
+                nueva_cantidad = float(reactivo['cantidad'])
+                mensaje = f"Entrada registrada: +{cantidad} {unidad}. Nuevo stock: {nueva_cantidad} {reactivo['unidad']}"
+            
+            return True, mensaje
+            
+        except Exception as e:
+            return False, f"Error: {str(e)}"
+    
+    # ------------------------------------------------------------------------
+    # Cola local (write-behind)
+    # ------------------------------------------------------------------------
+    
+    def iniciar_cola(self, ruta=RUTA_COLA):
+        """Los formularios encolan los movimientos y un hilo los confirma contra el backend"""
+        self.cola = ColaMovimientos(self.backend, ruta, al_resolver=self._al_resolver_cola)
+        self.cola.iniciar()
+    
+    def encolar_salida(self, reactivo_id, cantidad, usuario, proyecto_curso, notas="", unidad=None, clave=None):
+        """Acepta la salida al instante; el descuento real lo confirma la cola en segundo plano.
+
+        El stock se chequea contra la caché para rechazar lo evidente; el chequeo
+        definitivo (condicional, sin sobregiro) sigue siendo el del backend.
+        """
+        info = self.obtener_reactivo(reactivo_id)
+        if info is None:
+            return False, "Reactivo no encontrado"
+        unidad = unidad or info['unidad']
+        try:
+            micro = convertir_micro(cantidad, unidad, info['unidad'])
+        except UnidadIncompatible as e:
+            return False, str(e)
+        if micro > a_micro(info['cantidad'], info['unidad']):
+            return False, f"Stock insuficiente. Disponible: {float(info['cantidad'])} {info['unidad']}"
+        
+        ahora = datetime.now()
+        try:
+            self.cola.encolar('SALIDA', {
+                'reactivo_id': int(reactivo_id), 'cantidad': cantidad, 'unidad': unidad,
+                'usuario': usuario, 'proyecto_curso': proyecto_curso, 'notas': notas,
+                'fecha': ahora.strftime('%Y-%m-%d'), 'hora': ahora.strftime('%H:%M:%S')
+            }, clave=clave)
+        except ClaveEnConflicto as e:
+            return False, str(e)
+        return True, f"⏳ Salida en cola: {cantidad} {unidad} de {info['reactivo']} (pendiente de confirmar)"
+    
+    def encolar_entrada(self, nombre_reactivo, cantidad, usuario, proyecto_curso,
+                        unidad='L', fecha_vencimiento=None, notas="", proveedor=None, clave=None):
+        """Acepta la entrada al instante; la cola la registra en el backend en segundo plano"""
+        ahora = datetime.now()
+        try:
+            self.cola.encolar('ENTRADA', {
+                'reactivo': nombre_reactivo, 'cantidad': cantidad, 'unidad': unidad,
+                'fecha_vencimiento': fecha_vencimiento, 'usuario': usuario,
+                'proyecto_curso': proyecto_curso, 'notas': notas, 'proveedor': proveedor or None,
+                'fecha': ahora.strftime('%Y-%m-%d'), 'hora': ahora.strftime('%H:%M:%S')
+            }, clave=clave)
+        except ClaveEnConflicto as e:
+            return False, str(e)
+        return True, f"⏳ Entrada en cola: +{cantidad} {unidad} de {nombre_reactivo} (pendiente de confirmar)"
+    
+    def registrar_movimientos(self, movimientos, tamano_lote=TAMANO_LOTE_COLA):
+        """Registra sin cola movimientos con 'clave' y 'tipo' (datos como los de la cola),
+        un viaje al backend por lote; fusiona en caché los confirmados.
+
+        Reenviar la misma clave devuelve el resultado ya registrado sin mover
+        stock otra vez. Devuelve por movimiento {'clave', 'estado'
+        ('confirmado' o 'rechazado'), 'error', 'resultado'}.
+        """
+        respuestas = []
+        for inicio in range(0, len(movimientos), tamano_lote):
+            for respuesta in self.backend.registrar_movimientos_lote(movimientos[inicio:inicio + tamano_lote]):
+                resultado = respuesta.get('resultado')
+                error = respuesta.get('error') or motivo_rechazo(resultado)
+                respuestas.append({'clave': respuesta['clave'], 'estado': 'rechazado' if error else 'confirmado',
+                                   'error': error, 'resultado': resultado})
+        confirmados = [r['resultado'] for r in respuestas if r['estado'] == 'confirmado']
+        if confirmados:
+            self._aplicar_resultados([r['inventario'] for r in confirmados],
+                                     [r['movimiento'] for r in confirmados])
+        return respuestas
+    
+    def _al_resolver_cola(self, resueltos):
+        """Callback de la cola (hilo propio): fusiona lo confirmado y avisa a las sesiones"""
+        confirmados = [r['resultado'] for r in resueltos if r['estado'] == 'confirmado']
+        if confirmados:
+            self._aplicar_resultados([r['inventario'] for r in confirmados],
+                                     [r['movimiento'] for r in confirmados])
+        else:
+            # Solo rechazos: no hay filas nuevas, pero cambia el estado visible de la cola
+            with self._lock:
+                self.version += 1
+    
+    def cola_reciente(self, limite=20):
+        """Últimos movimientos de la cola local con su estado, listos para mostrar"""
+        columnas = ['estado', 'tipo', 'reactivo', 'cantidad', 'unidad', 'usuario', 'creado', 'intentos', 'error']
+        filas = []
+        for movimiento in self.cola.recientes(limite):
+            datos = movimiento['datos']
+            reactivo = datos.get('reactivo')
+            if reactivo is None:
+                info = self.obtener_reactivo(datos.get('reactivo_id'))
+                reactivo = info['reactivo'] if info is not None else f"#{datos.get('reactivo_id')}"
+            filas.append({**movimiento, 'reactivo': reactivo, 'cantidad': datos.get('cantidad'),
+                          'unidad': datos.get('unidad'), 'usuario': datos.get('usuario')})
+        return pd.DataFrame(filas, columns=columnas)
+    
+    def lotes_reactivo(self, reactivo_id):
+        """Lotes con stock del reactivo en orden FEFO, con la cantidad en su unidad"""
+        df = pd.DataFrame(self.backend.listar_lotes(reactivo_id),
+                          columns=['id', 'cantidad_base', 'fecha_vencimiento', 'fecha_ingreso', 'proveedor'])
+        info = self.obtener_reactivo(reactivo_id)
+        unidad = info['unidad'] if info is not None else None
+        df['cantidad'] = desde_micro_serie(df['cantidad_base'], [unidad] * len(df))
+        df['unidad'] = unidad
+        return df
+    
+    def _aplicar_movimiento(self, resultado):
+        """Fusiona en caché la fila de inventario y el movimiento devueltos por el servidor"""
+        self._aplicar_resultados([resultado['inventario']], [resultado['movimiento']])
+    
+    def _aplicar_resultados(self, filas_inventario, filas_log):
+        """Fusiona en caché filas de inventario y de log ya confirmadas por el backend"""
+        with self._lock:
+            if not self.cargado:
+                # Sin caché (uso sin interfaz): la primera carga ya las traerá
+                return
+            self._fusionar_inventario(filas_inventario)
+            self._fusionar_log(filas_log)
+            # Las marcas no se avanzan: la próxima sincronización incremental trae
+            # también lo que otros usuarios hayan escrito entretanto
+            self.version += 1
+    
+    def importar_entradas(self, df_validas, al_avanzar=None):
+        """Registra entradas masivas ya validadas, en lotes, y fusiona el resultado en caché.
+
+        Si un lote falla, los anteriores ya confirmados se fusionan igual y el
+        mensaje dice cuántas filas entraron.
+        """
+        error = None
+        try:
+            resultados = importacion.importar_entradas(self.backend, df_validas, al_avanzar)
+        except importacion.ImportacionInterrumpida as e:
+            resultados, error = e.resultados, str(e)
+        except Exception as e:
+            return False, f"Error: {str(e)}"
+        
+        filas_inventario = [fila for r in resultados for fila in r['inventario']]
+        filas_log = [fila for r in resultados for fila in r['movimientos']]
+        if filas_inventario:
+            self._aplicar_resultados(filas_inventario, filas_log)
+        if error is not None:
+            return False, f"Error: {error}"
+        return True, f"{len(filas_log)} entradas registradas en {len(resultados)} lote(s)"
+    
+    def historial_movimientos(self, antes_de_id=None, limite=TAMANO_PAGINA_HISTORIAL, **filtros):
+        """Página del historial filtrada en el servidor.
+
+        Devuelve (df_pagina, cursor_siguiente); cursor_siguiente es el id a pasar
+        como antes_de_id para la página siguiente, o None si no hay más.
+        """
+        filtros = {clave: valor for clave, valor in filtros.items() if valor}
+        # Se pide una fila extra solo para saber si existe otra página
+        filas = self.backend.paginar_movimientos(antes_de_id=antes_de_id, limite=limite + 1, filtros=filtros)
+        hay_mas = len(filas) > limite
+        filas = filas[:limite]
+        cursor_siguiente = filas[-1]['id'] if hay_mas else None
+        return construir(filas, ESQUEMA_LOG), cursor_siguiente
+    
+    def consumo_historico(self, desde=None, hasta=None, frecuencia='M', por='reactivo'):
+        """Consumo por período sobre los agregados diarios (apto para rangos de varios años)"""
+        return resumenes.consumo_por_periodo(self.backend, desde, hasta, frecuencia, por)
+    
+    def verificar_vencimientos(self, dias_alerta=30):
+        """Verifica reactivos vencidos y próximos a vencer (búsqueda binaria en el índice).
+
+        El índice usa el vencimiento del próximo lote, pero no todo el stock
+        vence con él: 'cantidad_vencida' y 'cantidad_por_vencer' suman solo los
+        lotes de cada rango (una consulta de lotes, memorizada por versión).
+        """
+        hoy = datetime.now()
+        clave = (self.version, hoy.date(), dias_alerta)
+        if self._memo_vencimientos[0] == clave:
+            return self._memo_vencimientos[1]
+        
+        vencidos = self._filas_por_id(self._indice_vencimientos.vencidos(hoy))
+        proximos = self._filas_por_id(self._indice_vencimientos.proximos(dias_alerta, hoy))
+        if len(vencidos) > 0 or len(proximos) > 0:
+            lotes = pd.DataFrame(
+                self.backend.listar_lotes(vencen_hasta=(hoy + timedelta(days=dias_alerta)).strftime('%Y-%m-%d')),
+                columns=['reactivo_id', 'cantidad_base', 'fecha_vencimiento']
+            )
+            # Como en el índice, lo que vence hoy ya cuenta como vencido
+            vencido = lotes['fecha_vencimiento'] <= hoy.strftime('%Y-%m-%d')
+            vencidos = self._con_cantidad_de_lotes(vencidos, lotes[vencido], 'cantidad_vencida')
+            proximos = self._con_cantidad_de_lotes(proximos, lotes[~vencido], 'cantidad_por_vencer')
+        resultado = {'vencidos': vencidos, 'proximos_vencer': proximos}
+        self._memo_vencimientos = (clave, resultado)
+        return resultado
+    
+    @staticmethod
+    def _con_cantidad_de_lotes(df, lotes, columna):
+        """Copia de df con la suma de esos lotes de cada reactivo, en la unidad del reactivo"""
+        if df.empty:
+            return df
+        micro = lotes.groupby('reactivo_id')['cantidad_base'].sum()
+        return df.assign(**{columna: desde_micro_serie(df['id'].map(micro).fillna(0).to_numpy(), df['unidad'])})
+    
+    def resumen_vencimientos(self, horizontes=HORIZONTES_VENCIMIENTO):
+        """Conteos de vencidos y de reactivos que vencen dentro de cada horizonte (días)"""
+        return self._indice_vencimientos.resumen(horizontes)
+    
+    def memoria(self):
+        """Memoria (bytes por columna, con tipos) de las tablas en caché"""
+        return {'inventario': reporte_memoria(self.df_inventario), 'log': reporte_memoria(self.df_log)}
+    
+    def generar_reporte_stock(self):
+        """Genera reporte del estado del inventario y de consumo (memorizado por versión de datos)"""
+        version, reporte = self._memo_reporte
+        if version == (self.version, datetime.now().date()):
+            return reporte
+        
+        df = self.df_inventario
+        version = (self.version, datetime.now().date())
+        if df is None or df.empty:
+            reporte = {
+                'total': 0, 'disponibles': 0, 'en_uso': 0, 
+                'vencidos': 0, 'proximos_vencer': 0,
+                'vencimientos': {'vencidos': pd.DataFrame(), 'proximos_vencer': pd.DataFrame()},
+                'consumo': None
+            }
+        else:
+            # Un solo conteo agrupado en lugar de un filtro por estado
+            por_estado = df['estado'].value_counts()
+            vencimientos = self.verificar_vencimientos()
+            reporte = {
+                'total': len(df),
+                'disponibles': int(por_estado.get('disponible', 0)),
+                'en_uso': int(por_estado.get('en uso', 0)),
+                'vencidos': len(vencimientos['vencidos']),
+                'proximos_vencer': len(vencimientos['proximos_vencer']),
+                'vencimientos': vencimientos,
+                'consumo': self._reportes.generar(df, self.version)
+            }
+        
+        self._memo_reporte = (version, reporte)
+        return reporte
+
+# Tiempos de cada método del sistema, visibles en la página de Diagnóstico
+instrumentar_clase(SistemaInventarioReactivos)
@@ -0,0 +1,524 @@
+-- ============================================================================
+-- MOVIMIENTOS ATÓMICOS DE STOCK
+-- Ejecutar en el SQL Editor de Supabase. Cada función corre en una sola
+-- transacción: el descuento/suma de stock y el registro en log_movimientos
+-- se confirman juntos, en un solo viaje de red desde la aplicación.
+-- ============================================================================
+
+-- ============================================================================
+-- UNIDADES Y STOCK EN MICRO-UNIDADES
+-- cantidad_base guarda el stock como entero en micro-unidades de la unidad
+-- base (mL o g); cantidad queda como valor de presentación en la unidad del
+-- reactivo. Mismos factores que unidades.py.
+-- ============================================================================
+
+create or replace function micro_por_unidad(p_unidad text)
+returns bigint
+language sql immutable
+as $$
+    select case p_unidad
+        when 'L' then 1000000000
+        when 'kg' then 1000000000
+        when 'g' then 1000000
+        when 'mL' then 1000000
+        else 1000000
+    end::bigint;
+$$;
+
+create or replace function dimension_unidad(p_unidad text)
+returns text
+language sql immutable
+as $$
+    select case when p_unidad in ('L', 'mL') then 'volumen'
+                when p_unidad in ('kg', 'g') then 'masa'
+                else p_unidad end;
+$$;
+
+-- Micro-unidades base de una cantidad en p_desde, que debe ser compatible con p_hacia
+create or replace function convertir_a_micro(p_cantidad numeric, p_desde text, p_hacia text)
+returns bigint
+language plpgsql immutable
+as $$
+begin
+    if dimension_unidad(p_desde) is distinct from dimension_unidad(p_hacia) then
+        raise exception 'No se puede convertir % a %', p_desde, p_hacia;
+    end if;
+    return round(p_cantidad * micro_por_unidad(p_desde))::bigint;
+end;
+$$;
+
+alter table inventario add column if not exists cantidad_base bigint;
+
+update inventario
+   set cantidad_base = round(cantidad * micro_por_unidad(unidad))::bigint
+ where cantidad_base is null;
+
+-- ============================================================================
+-- LOTES Y ASIGNACIÓN FEFO
+-- Cada entrada crea un lote; inventario.cantidad_base es la suma de sus lotes
+-- e inventario.fecha_vencimiento el vencimiento del próximo lote a consumir.
+-- Las salidas descuentan primero del lote que vence antes (first-expired-
+-- first-out); el índice parcial ordenado hace que tomar cada lote sea O(log n).
+-- ============================================================================
+
+create table if not exists lotes (
+    id bigserial primary key,
+    reactivo_id bigint not null references inventario (id),
+    cantidad_base bigint not null,
+    fecha_vencimiento text,
+    fecha_ingreso text,
+    proveedor text,
+    updated_at timestamptz default now()
+);
+
+create index if not exists idx_lotes_reactivo on lotes (reactivo_id);
+create index if not exists idx_lotes_fefo on lotes (reactivo_id, fecha_vencimiento, id)
+    where cantidad_base > 0;
+-- Sincronización incremental de lotes (reportes)
+create index if not exists idx_lotes_updated_at on lotes (updated_at);
+
+create table if not exists salidas_lotes (
+    movimiento_id bigint not null references log_movimientos (id),
+    lote_id bigint not null references lotes (id),
+    cantidad_base bigint not null,
+    primary key (movimiento_id, lote_id)
+);
+
+-- Stock anterior a los lotes: un lote por reactivo con su vencimiento actual
+insert into lotes (reactivo_id, cantidad_base, fecha_vencimiento, fecha_ingreso, updated_at)
+select i.id, i.cantidad_base, i.fecha_vencimiento, i.fecha_ingreso, coalesce(i.updated_at, now())
+  from inventario i
+ where i.cantidad_base > 0
+   and not exists (select 1 from lotes l where l.reactivo_id = i.id);
+
+-- Vencimiento del próximo lote a consumir (o el actual si no quedan lotes con stock)
+create or replace function actualizar_vencimiento(p_reactivo_id bigint)
+returns void
+language sql
+as $$
+    update inventario
+       set fecha_vencimiento = coalesce(
+           (select l.fecha_vencimiento from lotes l
+             where l.reactivo_id = p_reactivo_id and l.cantidad_base > 0
+             order by l.fecha_vencimiento, l.id limit 1),
+           fecha_vencimiento)
+     where id = p_reactivo_id;
+$$;
+
+-- Firma anterior (sin unidad de la cantidad)
+drop function if exists registrar_salida(bigint, numeric, text, text, text, text, text);
+
+-- Salida: descuento condicional (nunca deja stock negativo) + log
+create or replace function registrar_salida(
+    p_reactivo_id bigint,
+    p_cantidad numeric,
+    p_unidad text,
+    p_usuario text,
+    p_proyecto_curso text,
+    p_notas text,
+    p_fecha text,
+    p_hora text
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_inventario inventario%rowtype;
+    v_movimiento log_movimientos%rowtype;
+    v_unidad text;
+    v_micro bigint;
+    v_restante bigint;
+    v_tomado bigint;
+    v_lote lotes%rowtype;
+    v_lotes jsonb := '[]'::jsonb;
+begin
+    select unidad into v_unidad from inventario where id = p_reactivo_id;
+    if not found then
+        return jsonb_build_object('ok', false, 'inventario', null);
+    end if;
+    v_micro := convertir_a_micro(p_cantidad, coalesce(p_unidad, v_unidad), v_unidad);
+    -- Una salida negativa pasaría el chequeo de stock y sumaría sin tocar lotes
+    if v_micro is null or v_micro <= 0 then
+        raise exception 'La cantidad debe ser mayor a 0';
+    end if;
+
+    -- El WHERE sobre cantidad_base hace el chequeo y el descuento en la misma
+    -- sentencia: dos salidas concurrentes no pueden sobregirar el stock
+    update inventario
+       set cantidad_base = cantidad_base - v_micro,
+           cantidad = (cantidad_base - v_micro)::numeric / micro_por_unidad(unidad),
+           estado = case when cantidad_base - v_micro <= 0 then 'agotado' else estado end,
+           -- Hora real de la escritura (now() es la del inicio de la transacción):
+           -- la app relee una ventana hacia atrás desde su marca de updated_at
+           updated_at = clock_timestamp()
+     where id = p_reactivo_id
+       and cantidad_base >= v_micro
+    returning * into v_inventario;
+
+    if not found then
+        select * into v_inventario from inventario where id = p_reactivo_id;
+        return jsonb_build_object('ok', false, 'inventario', to_jsonb(v_inventario));
+    end if;
+
+    -- El log queda en la unidad del reactivo, para agregados coherentes
+    insert into log_movimientos (fecha, hora, tipo_movimiento, reactivo, cantidad,
+                                 unidad, usuario, proyecto_curso, notas)
+    values (p_fecha, p_hora, 'SALIDA', v_inventario.reactivo,
+            v_micro::numeric / micro_por_unidad(v_inventario.unidad),
+            v_inventario.unidad, p_usuario, p_proyecto_curso, p_notas)
+    returning * into v_movimiento;
+
+    -- FEFO: siempre el primer lote con stock según idx_lotes_fefo
+    v_restante := v_micro;
+    while v_restante > 0 loop
+        select * into v_lote from lotes
+         where reactivo_id = p_reactivo_id and cantidad_base > 0
+         order by fecha_vencimiento, id
+         limit 1
+         for update;
+        -- Los lotes deben sumar el total del reactivo: si no alcanzan, se
+        -- deshace la salida en vez de dejar stock sin lote
+        if not found then
+            raise exception 'Los lotes del reactivo % no cubren la salida', p_reactivo_id;
+        end if;
+
+        v_tomado := least(v_restante, v_lote.cantidad_base);
+        update lotes set cantidad_base = cantidad_base - v_tomado, updated_at = now() where id = v_lote.id;
+        insert into salidas_lotes (movimiento_id, lote_id, cantidad_base)
+        values (v_movimiento.id, v_lote.id, v_tomado);
+        v_lotes := v_lotes || jsonb_build_array(jsonb_build_object(
+            'lote_id', v_lote.id,
+            'cantidad', v_tomado::numeric / micro_por_unidad(v_inventario.unidad)
+        ));
+        v_restante := v_restante - v_tomado;
+    end loop;
+
+    perform actualizar_vencimiento(p_reactivo_id);
+    select * into v_inventario from inventario where id = p_reactivo_id;
+
+    return jsonb_build_object(
+        'ok', true,
+        'inventario', to_jsonb(v_inventario),
+        'movimiento', to_jsonb(v_movimiento),
+        'lotes', v_lotes
+    );
+end;
+$$;
+
+-- ============================================================================
+-- IDENTIDAD DE REACTIVOS
+-- nombre_normalizado (minúsculas, sin acentos, espacios colapsados) es la
+-- clave única por nombre; la aplicación la calcula con busqueda.normalizar.
+-- Las filas anteriores a la columna se completan una vez, después de este
+-- script, con `python servicio.py migrar-nombres`: unaccent no quita los mismos caracteres que NFKD y
+-- dejaría claves que no coinciden con las que calcula Python.
+-- ============================================================================
+
+alter table inventario add column if not exists nombre_normalizado text;
+
+create unique index if not exists idx_inventario_nombre on inventario (nombre_normalizado);
+
+-- Firmas anteriores (sin nombre normalizado / sin proveedor)
+drop function if exists registrar_entrada(text, numeric, text, text, text, text, text, text, text);
+drop function if exists registrar_entrada(text, text, numeric, text, text, text, text, text, text, text);
+
+-- Entrada: suma al reactivo existente (o lo crea) + log
+create or replace function registrar_entrada(
+    p_reactivo text,
+    p_nombre_normalizado text,
+    p_cantidad numeric,
+    p_unidad text,
+    p_fecha_vencimiento text,
+    p_usuario text,
+    p_proyecto_curso text,
+    p_notas text,
+    p_fecha text,
+    p_hora text,
+    p_proveedor text default null
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_inventario inventario%rowtype;
+    v_movimiento log_movimientos%rowtype;
+    v_nuevo boolean := false;
+    v_unidad text;
+    v_micro bigint;
+begin
+    -- Serializa entradas del mismo nombre para no crear duplicados en paralelo
+    perform pg_advisory_xact_lock(hashtext(p_nombre_normalizado));
+
+    -- La cantidad se suma convertida a la unidad del reactivo existente
+    select unidad into v_unidad from inventario where nombre_normalizado = p_nombre_normalizado;
+    v_micro := convertir_a_micro(p_cantidad, p_unidad, coalesce(v_unidad, p_unidad));
+    if v_micro is null or v_micro <= 0 then
+        raise exception 'La cantidad debe ser mayor a 0';
+    end if;
+
+    update inventario
+       set cantidad_base = cantidad_base + v_micro,
+           cantidad = (cantidad_base + v_micro)::numeric / micro_por_unidad(unidad),
+           estado = case when estado = 'agotado' then 'disponible' else estado end,
+           updated_at = clock_timestamp()
+     where nombre_normalizado = p_nombre_normalizado
+    returning * into v_inventario;
+
+    if not found then
+        v_nuevo := true;
+        insert into inventario (reactivo, nombre_normalizado, cantidad, cantidad_base, unidad, estado,
+                                fecha_ingreso, notas, updated_at)
+        values (p_reactivo, p_nombre_normalizado, v_micro::numeric / micro_por_unidad(p_unidad), v_micro,
+                p_unidad, 'disponible', p_fecha, p_notas, clock_timestamp())
+        returning * into v_inventario;
+    end if;
+
+    -- Cada entrada es un lote propio: no pisa el vencimiento del stock anterior.
+    -- Sin fecha, un reactivo nuevo vence en un año; el lote sin fecha de uno
+    -- existente queda en null y se consume último (FEFO)
+    insert into lotes (reactivo_id, cantidad_base, fecha_vencimiento, fecha_ingreso, proveedor)
+    values (v_inventario.id, v_micro,
+            coalesce(nullif(p_fecha_vencimiento, ''),
+                     case when v_nuevo then to_char(current_date + 365, 'YYYY-MM-DD') end),
+            p_fecha, p_proveedor);
+    perform actualizar_vencimiento(v_inventario.id);
+    select * into v_inventario from inventario where id = v_inventario.id;
+
+    insert into log_movimientos (fecha, hora, tipo_movimiento, reactivo, cantidad,
+                                 unidad, usuario, proyecto_curso, notas)
+    -- El log lleva el nombre del reactivo tal como está en inventario, no el tipeado
+    values (p_fecha, p_hora, 'ENTRADA', v_inventario.reactivo,
+            v_micro::numeric / micro_por_unidad(v_inventario.unidad),
+            v_inventario.unidad, p_usuario, p_proyecto_curso, p_notas)
+    returning * into v_movimiento;
+
+    return jsonb_build_object(
+        'ok', true,
+        'nuevo', v_nuevo,
+        'inventario', to_jsonb(v_inventario),
+        'movimiento', to_jsonb(v_movimiento)
+    );
+end;
+$$;
+
+-- Entradas en lote (importación masiva): una sola petición y una sola
+-- transacción para todo el lote; el recorrido ocurre dentro del servidor
+create or replace function registrar_entradas_lote(p_movimientos jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_movimiento jsonb;
+    v_resultado jsonb;
+    v_inventario jsonb := '{}'::jsonb;
+    v_log jsonb := '[]'::jsonb;
+begin
+    for v_movimiento in select value from jsonb_array_elements(p_movimientos) loop
+        v_resultado := registrar_entrada(
+            v_movimiento->>'reactivo',
+            v_movimiento->>'nombre_normalizado',
+            (v_movimiento->>'cantidad')::numeric,
+            v_movimiento->>'unidad',
+            v_movimiento->>'fecha_vencimiento',
+            v_movimiento->>'usuario',
+            v_movimiento->>'proyecto_curso',
+            coalesce(v_movimiento->>'notas', ''),
+            v_movimiento->>'fecha',
+            v_movimiento->>'hora',
+            nullif(v_movimiento->>'proveedor', '')
+        );
+        -- Última versión de cada reactivo tocado, indexada por id
+        v_inventario := v_inventario || jsonb_build_object(
+            v_resultado->'inventario'->>'id', v_resultado->'inventario'
+        );
+        v_log := v_log || jsonb_build_array(v_resultado->'movimiento');
+    end loop;
+
+    return jsonb_build_object(
+        'inventario', coalesce((select jsonb_agg(value) from jsonb_each(v_inventario)), '[]'::jsonb),
+        'movimientos', v_log
+    );
+end;
+$$;
+
+-- ============================================================================
+-- MOVIMIENTOS CON CLAVE DE IDEMPOTENCIA (cola local de la app)
+-- Cada movimiento encolado lleva una clave única; si la petición se reintenta
+-- tras un corte, las claves ya aplicadas devuelven su resultado guardado sin
+-- volver a mover stock.
+-- ============================================================================
+
+create table if not exists movimientos_aplicados (
+    clave text primary key,
+    resultado jsonb not null,
+    creado timestamptz not null default now()
+);
+
+create or replace function registrar_movimientos_lote(p_movimientos jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_movimiento jsonb;
+    v_clave text;
+    v_resultado jsonb;
+    v_respuestas jsonb := '[]'::jsonb;
+begin
+    for v_movimiento in select value from jsonb_array_elements(p_movimientos) loop
+        v_clave := v_movimiento->>'clave';
+        -- Serializa reintentos concurrentes de la misma clave
+        perform pg_advisory_xact_lock(hashtext('movimiento:' || v_clave));
+
+        select resultado into v_resultado from movimientos_aplicados where clave = v_clave;
+        if found then
+            v_respuestas := v_respuestas || jsonb_build_array(
+                jsonb_build_object('clave', v_clave, 'resultado', v_resultado));
+            continue;
+        end if;
+
+        begin
+            if v_movimiento->>'tipo' = 'SALIDA' then
+                v_resultado := registrar_salida(
+                    (v_movimiento->>'reactivo_id')::bigint,
+                    (v_movimiento->>'cantidad')::numeric,
+                    v_movimiento->>'unidad',
+                    v_movimiento->>'usuario',
+                    v_movimiento->>'proyecto_curso',
+                    coalesce(v_movimiento->>'notas', ''),
+                    v_movimiento->>'fecha',
+                    v_movimiento->>'hora'
+                );
+            else
+                v_resultado := registrar_entrada(
+                    v_movimiento->>'reactivo',
+                    v_movimiento->>'nombre_normalizado',
+                    (v_movimiento->>'cantidad')::numeric,
+                    v_movimiento->>'unidad',
+                    v_movimiento->>'fecha_vencimiento',
+                    v_movimiento->>'usuario',
+                    v_movimiento->>'proyecto_curso',
+                    coalesce(v_movimiento->>'notas', ''),
+                    v_movimiento->>'fecha',
+                    v_movimiento->>'hora',
+                    nullif(v_movimiento->>'proveedor', '')
+                );
+            end if;
+        exception
+            -- Conflictos de concurrencia: falla el lote y la cola lo reintenta
+            when serialization_failure or deadlock_detected or lock_not_available then
+                raise;
+            -- Cualquier otro error del movimiento (unidad incompatible, datos mal
+            -- formados, restricciones): se deshace solo este y queda rechazado;
+            -- si fallara el lote, la cola lo reenviaría para siempre
+            when others then
+                v_respuestas := v_respuestas || jsonb_build_array(
+                    jsonb_build_object('clave', v_clave, 'error', sqlerrm));
+                continue;
+        end;
+
+        insert into movimientos_aplicados (clave, resultado) values (v_clave, v_resultado);
+        v_respuestas := v_respuestas || jsonb_build_array(
+            jsonb_build_object('clave', v_clave, 'resultado', v_resultado));
+    end loop;
+
+    return v_respuestas;
+end;
+$$;
+
+-- ============================================================================
+-- ÍNDICES PARA EL HISTORIAL PAGINADO
+-- La paginación es por id (clave primaria); los filtros frecuentes usan
+-- estos índices. pg_trgm permite ilike '%texto%' sin recorrer la tabla.
+-- ============================================================================
+
+create extension if not exists pg_trgm;
+
+create index if not exists idx_log_fecha on log_movimientos (fecha);
+create index if not exists idx_log_tipo_id on log_movimientos (tipo_movimiento, id desc);
+create index if not exists idx_log_reactivo_trgm on log_movimientos using gin (reactivo gin_trgm_ops);
+create index if not exists idx_log_usuario_trgm on log_movimientos using gin (usuario gin_trgm_ops);
+create index if not exists idx_log_proyecto_trgm on log_movimientos using gin (proyecto_curso gin_trgm_ops);
+
+-- ============================================================================
+-- AGREGADOS DIARIOS MATERIALIZADOS
+-- Un trigger suma cada movimiento a su día/reactivo y día/usuario/proyecto,
+-- así los análisis de varios años leen miles de filas en lugar de millones.
+-- Tras crear las tablas (o si se desalinean) ejecutar:
+--     select reconstruir_resumenes();
+-- ============================================================================
+
+create table if not exists resumen_diario (
+    fecha text not null,
+    reactivo text not null,
+    unidad text not null default '',
+    entradas numeric not null default 0,
+    salidas numeric not null default 0,
+    movimientos integer not null default 0,
+    primary key (fecha, reactivo, unidad)
+);
+
+create table if not exists resumen_diario_usuario (
+    fecha text not null,
+    usuario text not null default '',
+    proyecto_curso text not null default '',
+    entradas numeric not null default 0,
+    salidas numeric not null default 0,
+    movimientos integer not null default 0,
+    primary key (fecha, usuario, proyecto_curso)
+);
+
+create or replace function acumular_resumen_diario()
+returns trigger
+language plpgsql
+as $$
+declare
+    v_entrada numeric := case when new.tipo_movimiento = 'ENTRADA' then new.cantidad else 0 end;
+    v_salida numeric := case when new.tipo_movimiento = 'SALIDA' then new.cantidad else 0 end;
+begin
+    insert into resumen_diario (fecha, reactivo, unidad, entradas, salidas, movimientos)
+    values (new.fecha, new.reactivo, coalesce(new.unidad, ''), v_entrada, v_salida, 1)
+    on conflict (fecha, reactivo, unidad) do update set
+        entradas = resumen_diario.entradas + excluded.entradas,
+        salidas = resumen_diario.salidas + excluded.salidas,
+        movimientos = resumen_diario.movimientos + 1;
+
+    insert into resumen_diario_usuario (fecha, usuario, proyecto_curso, entradas, salidas, movimientos)
+    values (new.fecha, coalesce(new.usuario, ''), coalesce(new.proyecto_curso, ''), v_entrada, v_salida, 1)
+    on conflict (fecha, usuario, proyecto_curso) do update set
+        entradas = resumen_diario_usuario.entradas + excluded.entradas,
+        salidas = resumen_diario_usuario.salidas + excluded.salidas,
+        movimientos = resumen_diario_usuario.movimientos + 1;
+
+    return new;
+end;
+$$;
+
+drop trigger if exists trg_resumen_diario on log_movimientos;
+create trigger trg_resumen_diario
+    after insert on log_movimientos
+    for each row execute function acumular_resumen_diario();
+
+create or replace function reconstruir_resumenes()
+returns void
+language plpgsql
+as $$
+begin
+    -- Bloquea inserciones en el log mientras se recalcula
+    lock table log_movimientos in share mode;
+    truncate resumen_diario, resumen_diario_usuario;
+
+    insert into resumen_diario (fecha, reactivo, unidad, entradas, salidas, movimientos)
+    select fecha, reactivo, coalesce(unidad, ''),
+           sum(case when tipo_movimiento = 'ENTRADA' then cantidad else 0 end),
+           sum(case when tipo_movimiento = 'SALIDA' then cantidad else 0 end),
+           count(*)
+      from log_movimientos
+     group by fecha, reactivo, coalesce(unidad, '');
+
+    insert into resumen_diario_usuario (fecha, usuario, proyecto_curso, entradas, salidas, movimientos)
+    select fecha, coalesce(usuario, ''), coalesce(proyecto_curso, ''),
+           sum(case when tipo_movimiento = 'ENTRADA' then cantidad else 0 end),
+           sum(case when tipo_movimiento = 'SALIDA' then cantidad else 0 end),
+           count(*)
+      from log_movimientos
+     group by fecha, coalesce(usuario, ''), coalesce(proyecto_curso, '');
+end;
+$$;
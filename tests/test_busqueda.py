@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+from busqueda import IndiceBusqueda, normalizar, normalizar_serie
+
+NOMBRES = ['Ácido Sulfúrico', 'ácido  nítrico', 'Sulfato de cobre', 'Etanol 96%', 'Metanol', 'ﬁltro Ⅻ',
+           'Straße', 'ΣΟΦΊΑ', '  Cloruro\tde sodio ', 'İsopropanol', '', 'Acetona']
+
+@pytest.fixture
+def indice():
+    indice = IndiceBusqueda()
+    indice.reconstruir(pd.DataFrame({'id': range(1, len(NOMBRES) + 1), 'reactivo': NOMBRES}))
+    return indice
+
+def test_normalizar_serie_coincide_con_normalizar():
+    assert normalizar_serie(NOMBRES) == [normalizar(nombre) for nombre in NOMBRES]
+
+def test_orden_por_relevancia(indice):
+    # prefijo antes que subcadena
+    assert indice.buscar('acido') == [2, 1]
+    assert indice.buscar('sulf') == [3, 1]
+    assert indice.buscar('etanol') == [4, 5]
+
+def test_limite_corta_el_mismo_orden(indice):
+    for termino in ('acido', 'sulf', 'etanol', 'ol'):
+        completo = indice.buscar(termino)
+        assert indice.buscar(termino, limite=1) == completo[:1]
+
+def test_aproximada_y_filas_nuevas(indice):
+    assert indice.buscar('acetnoa') == [12]
+    indice.actualizar(pd.DataFrame({'id': [4, 13], 'reactivo': ['Propanol', 'Acetonitrilo']}))
+    assert indice.buscar('etanol') == [5]
+    assert indice.buscar('aceto') == [12, 13]
+    assert indice.buscar('propanol') == [4, 10]
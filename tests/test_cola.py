@@ -0,0 +1,46 @@
+import pytest
+
+from almacenamiento import BackendSQLite
+from cola import ClaveEnConflicto, ColaMovimientos
+from unidades import a_micro
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = BackendSQLite(str(tmp_path / "inventario.db"))
+    backend.insertar_inventario([{'reactivo': 'Etanol 96%', 'cantidad': 10.0, 'unidad': 'L'}])
+    return backend
+
+def _salida(**cambios):
+    return dict({'reactivo_id': 1, 'cantidad': 1, 'unidad': 'L', 'usuario': 'ana', 'proyecto_curso': 'QUI101',
+                 'notas': '', 'fecha': '2026-01-01', 'hora': '10:00:00'}, **cambios)
+
+def test_movimiento_mal_formado_se_rechaza_sin_frenar_el_lote(backend, tmp_path):
+    cola = ColaMovimientos(backend, str(tmp_path / "cola.db"))
+    buena = cola.encolar('SALIDA', _salida())
+    # Cantidad no numérica (ValueError), campo desconocido (TypeError), unidad de otra dimensión
+    no_numerica = cola.encolar('SALIDA', _salida(cantidad='mucho'))
+    campo_extra = cola.encolar('SALIDA', _salida(lector='3'))
+    otra_dimension = cola.encolar('SALIDA', _salida(unidad='kg'))
+    otra_buena = cola.encolar('SALIDA', _salida(cantidad=500, unidad='mL'))
+
+    assert cola.vaciar() == 5
+    assert cola.pendientes() == 0
+    for clave in (buena, otra_buena):
+        assert cola.consultar(clave)['estado'] == 'confirmado'
+    for clave in (no_numerica, campo_extra, otra_dimension):
+        movimiento = cola.consultar(clave)
+        assert movimiento['estado'] == 'rechazado' and movimiento['error']
+    assert backend.listar_inventario()[0]['cantidad_base'] == a_micro(8.5, 'L')
+
+def test_clave_reusada_con_otros_datos_es_conflicto(backend, tmp_path):
+    cola = ColaMovimientos(backend, str(tmp_path / "cola.db"))
+    cola.encolar('SALIDA', _salida(), clave='lector-1')
+    # Reintento del mismo movimiento (con otra hora): se acepta sin duplicar
+    assert cola.encolar('SALIDA', _salida(hora='10:00:05'), clave='lector-1') == 'lector-1'
+
+    with pytest.raises(ClaveEnConflicto):
+        cola.encolar('SALIDA', _salida(cantidad=2), clave='lector-1')
+    with pytest.raises(ClaveEnConflicto):
+        cola.encolar('ENTRADA', _salida(), clave='lector-1')
+    assert cola.vaciar() == 1
+    assert backend.listar_inventario()[0]['cantidad_base'] == a_micro(9, 'L')
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from almacenamiento import BackendSQLite
+from unidades import a_micro
+
+HILOS = 8
+SALIDAS_POR_HILO = 25
+CANTIDAD_SALIDA = 0.3
+STOCK_INICIAL = 10.0
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = BackendSQLite(str(tmp_path / "inventario.db"))
+    backend.insertar_inventario([{'reactivo': 'Etanol 96%', 'cantidad': STOCK_INICIAL, 'unidad': 'L',
+                                  'estado': 'disponible', 'fecha_vencimiento': '2030-01-01',
+                                  'fecha_ingreso': '2024-01-01', 'notas': ''}])
+    return backend
+
+def _salidas_en_paralelo(backend, reactivo_id):
+    confirmadas, errores = [], []
+    barrera = threading.Barrier(HILOS)
+
+    def retirar():
+        barrera.wait()
+        for _ in range(SALIDAS_POR_HILO):
+            try:
+                resultado = backend.registrar_salida(reactivo_id, CANTIDAD_SALIDA, 'carga', 'QUI101', '',
+                                                     '2026-01-01', '10:00:00')
+            except Exception as e:
+                errores.append(e)
+                continue
+            if resultado['ok']:
+                confirmadas.append(resultado)
+
+    hilos = [threading.Thread(target=retirar) for _ in range(HILOS)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return confirmadas, errores
+
+def test_salidas_concurrentes_no_sobregiran(backend):
+    reactivo_id = backend.listar_inventario()[0]['id']
+    # La demanda total (60 L) supera el stock: muchas salidas deben rechazarse
+    confirmadas, errores = _salidas_en_paralelo(backend, reactivo_id)
+    assert errores == []
+
+    inventario = backend.listar_inventario()[0]
+    stock = inventario['cantidad_base']
+    assert stock >= 0
+    assert len(confirmadas) == int(STOCK_INICIAL / CANTIDAD_SALIDA)
+    assert all(r['inventario']['cantidad_base'] >= 0 for r in confirmadas)
+
+    # El log coincide con el stock: inicial - salidas registradas = stock final
+    log = backend.listar_movimientos(limite=10_000)
+    salidas = [m for m in log if m['tipo_movimiento'] == 'SALIDA']
+    assert len(salidas) == len(confirmadas)
+    assert a_micro(STOCK_INICIAL, 'L') - sum(a_micro(m['cantidad'], m['unidad']) for m in salidas) == stock
+    assert sum(lote['cantidad_base'] for lote in backend.listar_lotes(reactivo_id)) == stock
+
+@pytest.mark.parametrize('cantidad', [0, -5])
+def test_cantidades_no_positivas_se_rechazan(backend, cantidad):
+    reactivo_id = backend.listar_inventario()[0]['id']
+    with pytest.raises(ValueError, match="mayor a 0"):
+        backend.registrar_salida(reactivo_id, cantidad, 'u', 'p', '', '2026-01-01', '10:00:00')
+    with pytest.raises(ValueError, match="mayor a 0"):
+        backend.registrar_entrada('Etanol 96%', cantidad, 'L', None, 'u', 'p', '', '2026-01-01', '10:00:00')
+    with pytest.raises(ValueError, match="mayor a 0"):
+        backend.registrar_entrada('Nuevo', cantidad, 'L', None, 'u', 'p', '', '2026-01-01', '10:00:00')
+
+    assert backend.listar_inventario()[0]['cantidad_base'] == a_micro(STOCK_INICIAL, 'L')
+    assert backend.listar_movimientos() == []
+    assert [lote['cantidad_base'] for lote in backend.listar_lotes(con_stock=False)] == [a_micro(STOCK_INICIAL, 'L')]
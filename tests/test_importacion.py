@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+import importacion
+from almacenamiento import BackendSQLite
+from sistema import SistemaInventarioReactivos
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = BackendSQLite(str(tmp_path / "inventario.db"))
+    backend.insertar_inventario([{'reactivo': 'Etanol 96%', 'cantidad': 10.0, 'unidad': 'L',
+                                  'estado': 'disponible', 'fecha_vencimiento': '2030-01-01',
+                                  'fecha_ingreso': '2024-01-01', 'notas': ''}])
+    return backend
+
+def test_unidad_incompatible_va_a_errores(backend):
+    archivo = pd.DataFrame({'reactivo': ['etanol 96 %', 'ETANOL 96%', 'Nuevo', 'nuevo', 'Nuevo'],
+                            'cantidad': ['500', '2', '1', '3', '4'],
+                            'unidad': ['mL', 'kg', 'g', 'L', 'kg']})
+    df_validas, df_errores = importacion.validar_entradas(
+        archivo, 'ana', 'QUI101', inventario=pd.DataFrame(backend.listar_inventario())
+    )
+
+    assert df_validas['cantidad'].tolist() == [500, 1, 4]
+    # Filas numeradas como en el archivo (encabezado = fila 1)
+    assert df_errores.index.tolist() == [3, 5]
+    assert df_errores['error'].tolist() == ["La unidad no es compatible con el stock en L",
+                                            "La unidad no es compatible con el stock en g"]
+
+class _BackendQueFallaEnElSegundoLote(BackendSQLite):
+    def __init__(self, ruta):
+        super().__init__(ruta)
+        self.lotes = 0
+
+    def registrar_entradas_lote(self, movimientos):
+        self.lotes += 1
+        if self.lotes == 2:
+            raise RuntimeError("sin conexión")
+        return super().registrar_entradas_lote(movimientos)
+
+def test_lotes_confirmados_se_informan_aunque_falle_uno_posterior(tmp_path, monkeypatch):
+    monkeypatch.setattr(importacion, 'TAMANO_LOTE', 2)
+    backend = _BackendQueFallaEnElSegundoLote(str(tmp_path / "inventario.db"))
+    backend.insertar_inventario([{'reactivo': 'Etanol 96%', 'cantidad': 10.0, 'unidad': 'L'}])
+    sistema = SistemaInventarioReactivos(backend=backend, cargar=False)
+    sistema.cargar_datos()
+    df_validas, _ = importacion.validar_entradas(
+        pd.DataFrame({'reactivo': ['A', 'B', 'C', 'D'], 'cantidad': ['1'] * 4}), 'ana', 'QUI101'
+    )
+
+    exito, mensaje = sistema.importar_entradas(df_validas)
+
+    assert not exito
+    assert "Se registraron 2 de 4 filas" in mensaje and "sin conexión" in mensaje
+    assert {'A', 'B'} <= set(sistema.df_inventario['reactivo'])
+    assert not {'C', 'D'} & set(sistema.df_inventario['reactivo'])
+    assert len(backend.listar_movimientos()) == 2
+
+def test_log_de_entradas_usa_el_nombre_del_inventario(backend):
+    resultado = backend.registrar_entrada('  ETANOL  96%', 1, 'L', None, 'ana', 'QUI101', '',
+                                          '2026-01-01', '10:00:00')
+    assert resultado['movimiento']['reactivo'] == 'Etanol 96%'
+
+    df_validas, _ = importacion.validar_entradas(
+        pd.DataFrame({'reactivo': ['etanol 96%', 'Nuevo Reactivo', 'NUEVO reactivo'], 'cantidad': ['1'] * 3}),
+        'ana', 'QUI101'
+    )
+    lote = importacion.importar_entradas(backend, df_validas)[0]
+    assert [m['reactivo'] for m in lote['movimientos']] == ['Etanol 96%', 'Nuevo Reactivo', 'Nuevo Reactivo']
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import pytest
+
+from almacenamiento import BackendSQLite
+from reportes import COLUMNAS_LOTES, MotorReportes
+
+class _BackendContador(BackendSQLite):
+    """Cuenta las filas que devuelve cada página del historial y cada lectura de lotes"""
+
+    def __init__(self, ruta):
+        super().__init__(ruta)
+        self.filas_paginadas = 0
+        self.lotes_leidos = 0
+
+    def paginar_movimientos(self, *args, **kwargs):
+        filas = super().paginar_movimientos(*args, **kwargs)
+        self.filas_paginadas += len(filas)
+        return filas
+
+    def listar_lotes(self, *args, **kwargs):
+        filas = super().listar_lotes(*args, **kwargs)
+        self.lotes_leidos += len(filas)
+        return filas
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = _BackendContador(str(tmp_path / "inventario.db"))
+    backend.insertar_inventario([{'reactivo': 'Etanol 96%', 'cantidad': 1000.0, 'unidad': 'L'}])
+    return backend
+
+def _salidas(backend, cantidad):
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    for _ in range(cantidad):
+        backend.registrar_salida(1, 1.0, 'ana', 'QUI101', '', hoy, '10:00:00')
+
+def test_solo_trae_salidas_nuevas(backend):
+    motor = MotorReportes(backend)
+    _salidas(backend, 120)
+    motor._sincronizar()
+    assert len(motor._consumos) == 120
+
+    backend.filas_paginadas = 0
+    _salidas(backend, 3)
+    motor._sincronizar()
+    assert len(motor._consumos) == 123
+    assert motor._consumos['id'].is_unique
+    # Las 3 nuevas más la ventana de relectura, no la página completa
+    assert backend.filas_paginadas < 60
+
+def test_salida_confirmada_tarde_no_se_pierde(backend):
+    motor = MotorReportes(backend)
+    _salidas(backend, 5)
+    # La salida 3 todavía no era visible cuando se sincronizó
+    with backend._transaccion() as conexion:
+        tardia = dict(conexion.execute("SELECT * FROM log_movimientos WHERE id = 3").fetchone())
+        conexion.execute("DELETE FROM log_movimientos WHERE id = 3")
+    motor._sincronizar()
+    assert sorted(motor._consumos['id']) == [1, 2, 4, 5]
+
+    with backend._transaccion() as conexion:
+        conexion.execute(f"INSERT INTO log_movimientos ({', '.join(tardia)}) VALUES "
+                         f"({', '.join('?' for _ in tardia)})", list(tardia.values()))
+    motor._sincronizar()
+    assert sorted(motor._consumos['id']) == [1, 2, 3, 4, 5]
+
+def test_lotes_se_sincronizan_por_updated_at(backend):
+    motor = MotorReportes(backend)
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    for dia in range(1, 21):
+        backend.registrar_entrada('Etanol 96%', 1, 'L', f'2030-01-{dia:02d}', 'ana', 'QUI101', '', hoy, '10:00:00')
+    motor._sincronizar_lotes()
+    assert len(motor._lotes) == 21
+
+    # Lotes que no cambian: fuera de la ventana de relectura
+    with backend._transaccion() as conexion:
+        conexion.execute("UPDATE lotes SET updated_at = '2020-01-01T00:00:00'")
+    backend.lotes_leidos = 0
+    backend.registrar_entrada('Etanol 96%', 2, 'L', '2029-06-01', 'ana', 'QUI101', '', hoy, '10:00:00')
+    backend.registrar_salida(1, 2.5, 'ana', 'QUI101', '', hoy, '10:00:00')
+    motor._sincronizar_lotes()
+
+    # Solo el lote nuevo (ya agotado) y el del 2030-01-01 (medio litro menos)
+    assert backend.lotes_leidos == 2
+    assert motor._lotes == {lote['id']: {columna: lote[columna] for columna in COLUMNAS_LOTES}
+                            for lote in BackendSQLite.listar_lotes(backend)}
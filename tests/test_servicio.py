@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+import servicio
+from almacenamiento import BackendSQLite
+from sistema import SistemaInventarioReactivos
+
+@pytest.fixture
+def ruta(tmp_path, monkeypatch):
+    ruta = str(tmp_path / "inventario.db")
+    monkeypatch.setenv('INVENTARIO_BACKEND', 'sqlite')
+    monkeypatch.setenv('INVENTARIO_SQLITE', ruta)
+    return ruta
+
+def test_consultar_no_siembra_ejemplos(ruta):
+    assert servicio.main(['stock', 'etanol']) == 1
+    assert servicio.main(['stock', '--id', '1']) == 1
+    assert BackendSQLite(ruta).listar_inventario() == []
+
+@pytest.mark.parametrize('argumentos', [
+    ['entrada', 'Etanol', '0', '--usuario', 'ana', '--proyecto', 'QUI101'],
+    ['entrada', 'Etanol', '-2', '--usuario', 'ana', '--proyecto', 'QUI101'],
+    ['entrada', 'Etanol', '1', '--usuario', ' ', '--proyecto', 'QUI101'],
+    ['entrada', 'Etanol', '1', '--usuario', 'ana', '--proyecto', 'QUI101', '--vence', '31/12/2027'],
+    ['salida', 'Etanol', '-1', '--usuario', 'ana', '--proyecto', 'QUI101'],
+    ['salida', 'Metanol', '1', '--usuario', 'ana', '--proyecto', 'QUI101'],
+])
+def test_movimientos_por_consola_se_validan(ruta, argumentos, capsys):
+    BackendSQLite(ruta).insertar_inventario([{'reactivo': 'Etanol', 'cantidad': 5.0, 'unidad': 'L'}])
+
+    assert servicio.main(argumentos) == 1
+    assert "❌" in capsys.readouterr().out
+    backend = BackendSQLite(ruta)
+    assert backend.listar_movimientos() == []
+    assert [fila['cantidad'] for fila in backend.listar_inventario()] == [5.0]
+
+def test_limite_no_positivo_es_400(ruta):
+    BackendSQLite(ruta).insertar_inventario([{'reactivo': 'Etanol', 'cantidad': 5.0, 'unidad': 'L'}])
+    servidor = servicio.ServidorMovimientos(SistemaInventarioReactivos(cargar=False, ejemplos=False))
+
+    for limite in ('0', '-3'):
+        codigo, cuerpo = servidor._stock(['stock'], {'q': 'etanol', 'limite': limite})
+        assert codigo == 400 and 'límite' in cuerpo['error']
+    assert servidor._stock(['stock'], {'q': 'etanol', 'limite': '1'})[0] == 200
+
+def test_nombre_numerico_no_se_toma_como_id(ruta):
+    BackendSQLite(ruta).insertar_inventario([{'reactivo': 'Etanol', 'cantidad': 5.0, 'unidad': 'L'},
+                                             {'reactivo': '1', 'cantidad': 5.0, 'unidad': 'L'}])
+    sistema = SistemaInventarioReactivos(cargar=False, ejemplos=False)
+
+    assert servicio.normalizar_movimiento(sistema, {'tipo': 'SALIDA', 'reactivo': '1', 'cantidad': 1,
+                                                    'usuario': 'ana', 'proyecto_curso': 'QUI101'})['reactivo_id'] == 2
+    assert servicio.main(['salida', '--id', '1', '2', '--usuario', 'ana', '--proyecto', 'QUI101']) == 0
+    assert servicio.main(['salida', '1', '1', '--usuario', 'ana', '--proyecto', 'QUI101']) == 0
+    assert [fila['cantidad'] for fila in BackendSQLite(ruta).listar_inventario()] == [3.0, 4.0]
+
+def test_clave_repetida_en_el_archivo_es_error_de_fila(ruta, tmp_path, capsys):
+    BackendSQLite(ruta).insertar_inventario([{'reactivo': 'Etanol', 'cantidad': 5.0, 'unidad': 'L'}])
+    archivo, errores = tmp_path / "movimientos.csv", tmp_path / "errores.csv"
+    archivo.write_text("tipo,reactivo,cantidad,clave\nSALIDA,Etanol,1,a\nSALIDA,Etanol,2,a\nSALIDA,Etanol,9,b\n")
+
+    assert servicio.main(['lote', str(archivo), '--usuario', 'ana', '--proyecto', 'QUI101',
+                          '--errores', str(errores)]) == 1
+    assert "Fila 4:" in capsys.readouterr().err
+    rechazadas = pd.read_csv(errores)
+    assert rechazadas['fila'].tolist() == [3] and rechazadas['error'].tolist() == ["Clave repetida (fila 2)"]
+    assert [fila['cantidad'] for fila in BackendSQLite(ruta).listar_inventario()] == [4.0]
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from almacenamiento import BackendSQLite
+from reportes import proyeccion_stock
+from sistema import SistemaInventarioReactivos
+
+def _dia(dias):
+    return (datetime.now() + timedelta(days=dias)).strftime('%Y-%m-%d')
+
+@pytest.fixture
+def sistema(tmp_path):
+    backend = BackendSQLite(str(tmp_path / "inventario.db"))
+    # Etanol: 1 L vencido, 2 L que vencen en 10 días y 5 L que vencen en un año
+    backend.insertar_inventario([{'reactivo': 'Etanol', 'cantidad': 1.0, 'unidad': 'L',
+                                  'fecha_vencimiento': _dia(-3), 'fecha_ingreso': _dia(-400)}])
+    backend.registrar_entrada('Etanol', 2000, 'mL', _dia(10), 'ana', 'QUI101', '', _dia(0), '10:00:00')
+    backend.registrar_entrada('Etanol', 5, 'L', _dia(365), 'ana', 'QUI101', '', _dia(0), '10:00:00')
+    # Acetona: 3 L que vencen en 5 días
+    backend.registrar_entrada('Acetona', 3, 'L', _dia(5), 'ana', 'QUI101', '', _dia(0), '10:00:00')
+    return SistemaInventarioReactivos(backend=backend)
+
+def test_cantidades_por_lote(sistema):
+    vencimientos = sistema.verificar_vencimientos(dias_alerta=30)
+
+    vencidos = vencimientos['vencidos'].set_index('reactivo')
+    assert vencidos.loc['Etanol', 'cantidad'] == 8.0
+    assert vencidos.loc['Etanol', 'cantidad_vencida'] == 1.0
+
+    proximos = vencimientos['proximos_vencer'].set_index('reactivo')
+    assert proximos.loc['Acetona', 'cantidad_por_vencer'] == 3.0
+
+def test_perdida_por_lote_en_orden_fefo():
+    hoy = pd.Timestamp(datetime.now()).normalize()
+    inventario = pd.DataFrame({'id': [1], 'reactivo': ['Etanol'], 'cantidad': [8.0], 'unidad': ['L'],
+                               'fecha_vencimiento': [hoy + pd.Timedelta(days=10)]})
+    # 0.1 L/día durante 90 días: 9 L
+    consumos = pd.DataFrame({'fecha': [hoy - pd.Timedelta(days=1)], 'reactivo': ['etanol'],
+                             'cantidad': [9.0], 'unidad': ['L']})
+    lotes = [{'reactivo_id': 1, 'cantidad_base': 2_000_000_000, 'fecha_vencimiento': _dia(10)},
+             {'reactivo_id': 1, 'cantidad_base': 1_000_000_000, 'fecha_vencimiento': _dia(20)},
+             {'reactivo_id': 1, 'cantidad_base': 5_000_000_000, 'fecha_vencimiento': None}]
+
+    proyeccion = proyeccion_stock(consumos, inventario, hoy, lotes)
+    # En 10 días se usa 1 L del primer lote (se pierde 1 L); el segundo se usa entero
+    assert proyeccion.loc[0, 'perdida_vencimiento'] == pytest.approx(1.0)
+    # Sin lotes: todo el stock con el vencimiento del reactivo (8 L - 1 L)
+    assert proyeccion_stock(consumos, inventario, hoy).loc[0, 'perdida_vencimiento'] == pytest.approx(7.0)
+
+def test_entrada_sin_fecha_de_reactivo_existente_no_inventa_vencimiento(tmp_path):
+    backend = BackendSQLite(str(tmp_path / "inventario.db"))
+    backend.insertar_inventario([{'reactivo': 'Etanol', 'cantidad': 1.0, 'unidad': 'L',
+                                  'fecha_vencimiento': '2027-01-01'}])
+
+    backend.registrar_entrada('Etanol', 1, 'L', None, 'ana', 'QUI101', '', _dia(0), '10:00:00')
+
+    assert [lote['fecha_vencimiento'] for lote in backend.listar_lotes()] == ['2027-01-01', None]
+    assert backend.listar_inventario()[0]['fecha_vencimiento'] == '2027-01-01'
+    # El lote sin fecha se consume último
+    resultado = backend.registrar_salida(1, 1.0, 'ana', 'QUI101', '', _dia(0), '10:00:00')
+    assert [lote['lote_id'] for lote in resultado['lotes']] == [1]
+
+def test_salida_que_los_lotes_no_cubren_se_deshace(tmp_path):
+    backend = BackendSQLite(str(tmp_path / "inventario.db"))
+    backend.insertar_inventario([{'reactivo': 'Etanol', 'cantidad': 2.0, 'unidad': 'L'}])
+    with backend._transaccion() as conexion:
+        conexion.execute("UPDATE lotes SET cantidad_base = cantidad_base / 2")
+
+    with pytest.raises(RuntimeError, match="no cubren"):
+        backend.registrar_salida(1, 1.5, 'ana', 'QUI101', '', _dia(0), '10:00:00')
+    assert backend.listar_inventario()[0]['cantidad'] == 2.0
+    assert backend.listar_lotes()[0]['cantidad_base'] == 1_000_000_000
+    assert backend.listar_movimientos() == []
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# Micro-unidades de la unidad base (mL o g) que tiene cada unidad aceptada.
+# El stock se guarda como entero en estas micro-unidades: sumas y restas son
+# exactas y "quedó en cero" se puede comparar sin tolerancias.
+MICRO_POR_UNIDAD = {
+    'L': 1_000_000_000,
+    'kg': 1_000_000_000,
+    'g': 1_000_000,
+    'mL': 1_000_000,
+}
+
+DIMENSION_UNIDAD = {'L': 'volumen', 'mL': 'volumen', 'kg': 'masa', 'g': 'masa'}
+
+UNIDAD_BASE = {'volumen': 'mL', 'masa': 'g'}
+
+# Unidades aceptadas en formularios e importaciones
+UNIDADES = list(MICRO_POR_UNIDAD)
+
+# Unidades desconocidas (datos anteriores): dimensión propia y factor 1
+MICRO_POR_DEFECTO = 1_000_000
+
+class UnidadIncompatible(ValueError):
+    """Se intentó sumar o restar cantidades de dimensiones distintas (p. ej. mL y kg)"""
+
+def dimension(unidad):
+    """'volumen', 'masa' o la propia unidad si no es conocida"""
+    return DIMENSION_UNIDAD.get(unidad, unidad)
+
+def unidad_base(unidad):
+    """Unidad canónica de la dimensión (mL o g)"""
+    return UNIDAD_BASE.get(dimension(unidad), unidad)
+
+def unidades_compatibles(unidad):
+    """Unidades de la misma dimensión, empezando por la propia"""
+    return [unidad] + [u for u in UNIDADES if u != unidad and dimension(u) == dimension(unidad)]
+
+def a_micro(cantidad, unidad):
+    """Cantidad en la unidad dada -> entero de micro-unidades base"""
+    return int(round(float(cantidad) * MICRO_POR_UNIDAD.get(unidad, MICRO_POR_DEFECTO)))
+
+def desde_micro(micro, unidad):
+    """Entero de micro-unidades base -> cantidad en la unidad dada"""
+    return int(micro) / MICRO_POR_UNIDAD.get(unidad, MICRO_POR_DEFECTO)
+
+def convertir_micro(cantidad, desde, hacia):
+    """Micro-unidades base de `cantidad` expresada en `desde`, validando que `hacia` sea compatible"""
+    if dimension(desde) != dimension(hacia):
+        raise UnidadIncompatible(f"No se puede convertir {desde} a {hacia}")
+    return a_micro(cantidad, desde)
+
+def convertir(cantidad, desde, hacia):
+    """Cantidad expresada en `desde` convertida a `hacia`"""
+    return desde_micro(convertir_micro(cantidad, desde, hacia), hacia)
+
+# ============================================================================
+# CONVERSIÓN VECTORIZADA
+# ============================================================================
+
+def _factores(unidades):
+    # Como object: con categóricas, map devolvería otra categórica y fillna fallaría
+    return (pd.Series(np.asarray(unidades, dtype=object)).map(MICRO_POR_UNIDAD)
+            .fillna(MICRO_POR_DEFECTO).to_numpy(dtype=np.float64))
+
+def a_micro_serie(cantidades, unidades):
+    """Columna de cantidades + columna de unidades -> array int64 de micro-unidades base"""
+    valores = pd.to_numeric(pd.Series(cantidades), errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    return np.rint(valores * _factores(unidades)).astype(np.int64)
+
+def desde_micro_serie(micro, unidades):
+    """Array de micro-unidades base -> cantidades en las unidades dadas (float)"""
+    return np.asarray(micro, dtype=np.float64) / _factores(unidades)
+
+def a_unidad_base(df, columna='cantidad', columna_unidad='unidad'):
+    """Copia de df con la cantidad convertida a la unidad base de cada fila (mL o g)
+
+    Permite agrupar y sumar filas que se registraron en L y mL (o kg y g).
+    """
+    unidades = df[columna_unidad].astype(object)
+    # Una llamada por unidad distinta, no por fila
+    base = unidades.map({u: unidad_base(u) for u in unidades.dropna().unique()})
+    convertido = df.copy()
+    convertido[columna] = a_micro_serie(df[columna], unidades) / _factores(base)
+    convertido[columna_unidad] = base.to_numpy()
+    return convertido
@@ -0,0 +1,107 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Horizontes (días) que se muestran en alertas y reportes
+HORIZONTES_VENCIMIENTO = (7, 30, 90)
+
+def dia_ordinal(fecha):
+    """Días desde 1970-01-01 de una fecha/datetime"""
+    return int(np.datetime64(pd.Timestamp(fecha).normalize(), 'D').astype(np.int64))
+
+def parsear_fechas(serie):
+    """Convierte a datetime64 una columna de fechas en texto (inválidas -> NaT)"""
+    return pd.to_datetime(serie, errors='coerce')
+
+# ============================================================================
+# ÍNDICE DE VENCIMIENTOS
+# ============================================================================
+
+class IndiceVencimientos:
+    """Lista ordenada de (día de vencimiento, id) para consultas por rango
+
+    Espera la columna fecha_vencimiento ya convertida a datetime64; las filas
+    sin fecha válida no se indexan. Un reactivo que vence hoy cuenta como
+    vencido, igual que la comparación original contra datetime.now().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dia_por_id = {}   # id -> día ordinal
+        self._ordenados = []    # lista ordenada de (día ordinal, id)
+
+    def __len__(self):
+        return len(self._ordenados)
+
+    @staticmethod
+    def _pares(df):
+        if df is None or df.empty or 'fecha_vencimiento' not in df.columns:
+            return []
+        fechas = df['fecha_vencimiento']
+        validas = fechas.notna()
+        dias = fechas[validas].values.astype('datetime64[D]').astype(np.int64)
+        return list(zip(dias.tolist(), df['id'][validas].tolist()))
+
+    def reconstruir(self, df):
+        """Reconstruye el índice completo desde un DataFrame de inventario"""
+        pares = self._pares(df)
+        with self._lock:
+            self._ordenados = sorted(pares)
+            self._dia_por_id = {id_: dia for dia, id_ in pares}
+
+    def actualizar(self, df_cambios):
+        """Reindexa solo las filas cambiadas/nuevas (O(log n) de búsqueda por fila)"""
+        pares = self._pares(df_cambios)
+        with self._lock:
+            for id_ in df_cambios['id']:
+                self._quitar(id_)
+            for dia, id_ in pares:
+                insort(self._ordenados, (dia, id_))
+                self._dia_por_id[id_] = dia
+
+    def eliminar(self, ids):
+        """Quita filas del índice"""
+        with self._lock:
+            for id_ in ids:
+                self._quitar(id_)
+
+    def _quitar(self, id_):
+        dia = self._dia_por_id.pop(id_, None)
+        if dia is None:
+            return
+        posicion = bisect_left(self._ordenados, (dia, id_))
+        if posicion < len(self._ordenados) and self._ordenados[posicion] == (dia, id_):
+            del self._ordenados[posicion]
+
+    def _rango(self, desde=None, hasta=None):
+        """Ids con desde <= día <= hasta (None = sin cota), por fecha ascendente"""
+        with self._lock:
+            inicio = 0 if desde is None else bisect_left(self._ordenados, (desde, float('-inf')))
+            fin = len(self._ordenados) if hasta is None else bisect_right(self._ordenados, (hasta, float('inf')))
+            return [id_ for _, id_ in self._ordenados[inicio:fin]]
+
+    def _contar(self, desde=None, hasta=None):
+        with self._lock:
+            inicio = 0 if desde is None else bisect_left(self._ordenados, (desde, float('-inf')))
+            fin = len(self._ordenados) if hasta is None else bisect_right(self._ordenados, (hasta, float('inf')))
+            return max(fin - inicio, 0)
+
+    def vencidos(self, hoy=None):
+        """Ids vencidos (vencimiento hasta hoy inclusive)"""
+        return self._rango(hasta=dia_ordinal(hoy or datetime.now()))
+
+    def proximos(self, dias, hoy=None):
+        """Ids que vencen en los próximos `dias` días (sin incluir los ya vencidos)"""
+        dia_hoy = dia_ordinal(hoy or datetime.now())
+        return self._rango(desde=dia_hoy + 1, hasta=dia_hoy + dias)
+
+    def resumen(self, horizontes=HORIZONTES_VENCIMIENTO, hoy=None):
+        """Conteos {'vencidos': n, h: n, ...}; cada horizonte cuenta los que vencen dentro de h días"""
+        dia_hoy = dia_ordinal(hoy or datetime.now())
+        resumen = {'vencidos': self._contar(hasta=dia_hoy)}
+        for horizonte in horizontes:
+            resumen[horizonte] = self._contar(desde=dia_hoy + 1, hasta=dia_hoy + horizonte)
+        return resumen